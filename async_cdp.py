@@ -0,0 +1,311 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+from urllib.parse import urlsplit
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+_WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# websocket帧操作码
+_OP_CONTINUATION = 0x0
+_OP_TEXT = 0x1
+_OP_BINARY = 0x2
+_OP_CLOSE = 0x8
+_OP_PING = 0x9
+_OP_PONG = 0xA
+
+
+class CdpError(Exception):
+    """CDP命令返回的错误"""
+
+
+def _mask(payload, mask):
+    """按RFC 6455对客户端帧做掩码（整数异或，避免逐字节循环）"""
+    if not payload:
+        return payload
+    length = len(payload)
+    repeated = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+
+
+class AsyncWebSocket:
+    """基于asyncio流的最小websocket客户端，只用于连接本机浏览器的DevTools（ws://）
+
+    未安装aiohttp时使用。network_capture 使用的 websocket-client 是同步阻塞的，
+    在事件循环中使用需要为每次收发占用一个线程，所以这里不复用它。
+    """
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._send_lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, url, timeout=10):
+        """完成握手并返回连接"""
+        parts = urlsplit(url)
+        if parts.scheme != 'ws':
+            raise ValueError(f"只支持 ws:// 地址: {url}")
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname, parts.port or 80, limit=2 ** 24), timeout)
+
+        key = base64.b64encode(os.urandom(16)).decode()
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        writer.write((f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        await writer.drain()
+
+        response = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+        status_line, *header_lines = response.decode('latin-1').split('\r\n')
+        if ' 101 ' not in status_line + ' ':
+            writer.close()
+            raise ConnectionError(f"websocket握手失败: {status_line}")
+        headers = {name.strip().lower(): value.strip() for name, _, value in
+                   (line.partition(':') for line in header_lines if line)}
+        expected = base64.b64encode(hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()).decode()
+        if headers.get('sec-websocket-accept') != expected:
+            writer.close()
+            raise ConnectionError("websocket握手校验失败")
+        return cls(reader, writer)
+
+    async def _send_frame(self, opcode, payload):
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header.append(0x80 | length)
+        elif length < 65536:
+            header.append(0x80 | 126)
+            header += struct.pack('!H', length)
+        else:
+            header.append(0x80 | 127)
+            header += struct.pack('!Q', length)
+        mask = os.urandom(4)
+        async with self._send_lock:
+            self._writer.write(bytes(header) + mask + _mask(payload, mask))
+            await self._writer.drain()
+
+    async def send(self, text):
+        """发送一条文本消息"""
+        await self._send_frame(_OP_TEXT, text.encode('utf-8'))
+
+    async def recv(self):
+        """接收一条完整的文本消息（合并分片，自动回复ping），连接关闭时抛出ConnectionError"""
+        message = bytearray()
+        while True:
+            first, second = await self._reader.readexactly(2)
+            fin, opcode = first & 0x80, first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', await self._reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', await self._reader.readexactly(8))[0]
+            mask = await self._reader.readexactly(4) if second & 0x80 else None
+            payload = await self._reader.readexactly(length)
+            if mask:
+                payload = _mask(payload, mask)
+
+            if opcode == _OP_PING:
+                await self._send_frame(_OP_PONG, payload)
+                continue
+            if opcode == _OP_PONG:
+                continue
+            if opcode == _OP_CLOSE:
+                raise ConnectionError("websocket连接已被关闭")
+            if opcode in (_OP_TEXT, _OP_BINARY, _OP_CONTINUATION):
+                message += payload
+                if fin:
+                    return message.decode('utf-8')
+
+    async def close(self):
+        """发送关闭帧并关闭连接"""
+        try:
+            await self._send_frame(_OP_CLOSE, struct.pack('!H', 1000))
+        except Exception:
+            pass
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except Exception:
+            pass
+
+
+class AiohttpWebSocket:
+    """把aiohttp的websocket客户端适配为与 AsyncWebSocket 相同的接口（send/recv/close）"""
+    def __init__(self, session, websocket):
+        self._session = session
+        self._ws = websocket
+
+    @classmethod
+    async def connect(cls, url, timeout=10):
+        session = aiohttp.ClientSession()
+        try:
+            # DevTools消息（如截图、大页面的求值结果）可能很大，不限制消息大小
+            websocket = await asyncio.wait_for(session.ws_connect(url, max_msg_size=0), timeout)
+        except BaseException:
+            await session.close()
+            raise
+        return cls(session, websocket)
+
+    async def send(self, text):
+        await self._ws.send_str(text)
+
+    async def recv(self):
+        """接收一条完整的消息，连接关闭时抛出ConnectionError"""
+        message = await self._ws.receive()
+        if message.type == aiohttp.WSMsgType.TEXT:
+            return message.data
+        if message.type == aiohttp.WSMsgType.BINARY:
+            return message.data.decode('utf-8')
+        raise ConnectionError(f"websocket连接已被关闭: {message.type.name}")
+
+    async def close(self):
+        try:
+            await self._ws.close()
+        finally:
+            await self._session.close()
+
+
+class CdpConnection:
+    """浏览器级DevTools连接：单个websocket上并发多路复用所有命令和事件
+
+    每条命令按id匹配响应，可以同时有任意多条命令在途；
+    事件按 (sessionId, 方法名) 分发给等待者，flatten模式下所有标签页共用这一条连接。
+    """
+    def __init__(self, websocket, command_timeout=30):
+        """初始化连接
+
+        Args:
+            websocket (AsyncWebSocket): 已握手的websocket
+            command_timeout (float): 单条命令的默认超时时间（秒）
+        """
+        self._ws = websocket
+        self.command_timeout = command_timeout
+        self._next_id = 0
+        self._pending = {}
+        self._waiters = {}
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    @classmethod
+    async def connect(cls, websocket_url, **kwargs):
+        """连接浏览器的 webSocketDebuggerUrl：安装了aiohttp时使用其websocket客户端，否则使用内置的最小实现"""
+        websocket_class = AiohttpWebSocket if aiohttp is not None else AsyncWebSocket
+        return cls(await websocket_class.connect(websocket_url), **kwargs)
+
+    async def send(self, method, params=None, session_id=None, timeout=None):
+        """发送命令并等待结果，CDP返回错误时抛出CdpError"""
+        self._next_id += 1
+        message_id = self._next_id
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            await self._ws.send(json.dumps(message))
+            return await asyncio.wait_for(future, timeout or self.command_timeout)
+        finally:
+            self._pending.pop(message_id, None)
+
+    def expect_event(self, method, session_id=None):
+        """登记等待一个事件，返回Future；需在触发事件的命令之前调用"""
+        key = (session_id, method)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, []).append(future)
+        # 等待者超时或被取消时立即移除，事件一直不来也不会在连接的生命周期内累积
+        future.add_done_callback(lambda done: self._discard_waiter(key, done))
+        return future
+
+    def _discard_waiter(self, key, future):
+        waiters = self._waiters.get(key)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._waiters[key]
+
+    async def _read_loop(self):
+        """读取并分发响应和事件，连接断开时让所有在途命令失败"""
+        error = ConnectionError("DevTools连接已断开")
+        try:
+            while True:
+                message = json.loads(await self._ws.recv())
+                if 'id' in message:
+                    future = self._pending.get(message['id'])
+                    if future and not future.done():
+                        if 'error' in message:
+                            future.set_exception(CdpError(message['error'].get('message', message['error'])))
+                        else:
+                            future.set_result(message.get('result', {}))
+                elif 'method' in message:
+                    waiters = self._waiters.pop((message.get('sessionId'), message['method']), [])
+                    for future in waiters:
+                        if not future.done():
+                            future.set_result(message.get('params', {}))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            for future in list(self._pending.values()) + [f for fs in self._waiters.values() for f in fs]:
+                if not future.done():
+                    future.set_exception(ConnectionError(f"DevTools连接已断开: {error}"))
+
+    async def attach(self, target_id):
+        """以flatten模式附加到页面目标，返回会话"""
+        result = await self.send('Target.attachToTarget', {'targetId': target_id, 'flatten': True})
+        return CdpSession(self, result['sessionId'], target_id)
+
+    async def close(self):
+        """关闭连接"""
+        self._reader_task.cancel()
+        try:
+            await self._reader_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        await self._ws.close()
+
+
+class CdpSession:
+    """单个页面目标上的会话，提供按Selenium约定执行页面脚本的方法"""
+    def __init__(self, connection, session_id, target_id):
+        self.connection = connection
+        self.session_id = session_id
+        self.target_id = target_id
+
+    async def send(self, method, params=None, timeout=None):
+        return await self.connection.send(method, params, self.session_id, timeout)
+
+    def expect_event(self, method):
+        return self.connection.expect_event(method, self.session_id)
+
+    async def evaluate(self, expression, await_promise=False, timeout=None):
+        """求值表达式并返回JSON值，页面内抛出异常时抛出CdpError"""
+        result = await self.send('Runtime.evaluate', {
+            'expression': expression,
+            'returnByValue': True,
+            'awaitPromise': await_promise,
+        }, timeout)
+        if 'exceptionDetails' in result:
+            details = result['exceptionDetails']
+            description = details.get('exception', {}).get('description') or details.get('text')
+            raise CdpError(f"页面脚本出错: {description}")
+        return result.get('result', {}).get('value')
+
+    async def execute_script(self, script, *args, timeout=None):
+        """与 WebDriver.execute_script 相同约定：脚本为函数体，通过 arguments 取参数"""
+        expression = f"(function() {{\n{script}\n}}).apply(null, {json.dumps(list(args))})"
+        return await self.evaluate(expression, timeout=timeout)
+
+    async def execute_async_script(self, script, *args, timeout=None):
+        """与 WebDriver.execute_async_script 相同约定：最后一个参数是完成回调"""
+        expression = (f"new Promise((resolve) => (function() {{\n{script}\n}})"
+                      f".apply(null, {json.dumps(list(args))}.concat([resolve])))")
+        return await self.evaluate(expression, await_promise=True, timeout=timeout)
@@ -0,0 +1,471 @@
+import asyncio
+import os
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from async_cdp import CdpConnection
+from doubao_image_generator import DoubaoImageGenerator, DOUBAO_CHAT_URL, IMAGE_WATCHER_SCRIPT, WAIT_FOR_IMAGES_SCRIPT
+from generation_scheduler import GenerationScheduler
+from image_downloader import ImageDownloader, SIGNATURE_BYTES, detect_image_format
+from image_url_classifier import GENERATED_URL_RULES
+from image_url_rewriter import convert_to_original_url
+from metrics import (Metrics, STAGE_INPUT_LOOKUP, STAGE_SUBMIT, STAGE_GENERATION_WAIT, STAGE_URL_RESOLUTION,
+                     STAGE_DOWNLOAD, STAGE_DOWNLOAD_BATCH, STAGE_TRANSCODE)
+from resolution_cache import ResolutionCache, STRATEGY_ATTRIBUTE
+from waiting import NETWORK_IDLE_SCRIPT
+
+
+# 查找可见的输入框，聚焦并选中已有内容（随后输入的文本会替换选区），返回命中的选择器序号，未找到返回-1
+FOCUS_INPUT_SCRIPT = """
+const selectors = [
+    "textarea[placeholder*='输入'], textarea[placeholder*='消息'], textarea[placeholder*='问题']",
+    "input[placeholder*='输入'], input[placeholder*='消息'], input[placeholder*='问题']",
+    "div[contenteditable='true']",
+    "textarea",
+    "input[type='text']"
+];
+const visible = (el) => !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+for (let i = 0; i < selectors.length; i++) {
+    const el = Array.from(document.querySelectorAll(selectors[i])).find(e => visible(e) && !e.disabled);
+    if (el) {
+        el.focus();
+        if (el.select) el.select(); else document.execCommand('selectAll');
+        return i;
+    }
+}
+return -1;
+"""
+
+
+def _failed(prompt):
+    return {'prompt': prompt, 'success': False, 'image_urls': [], 'downloaded_files': []}
+
+
+class AsyncImageDownloader:
+    """异步图片下载与可访问性验证
+
+    安装了aiohttp时所有请求直接在事件循环上发出，连接数由连接池限制；
+    未安装时退回到线程中的同步下载引擎（pip install aiohttp 后自动启用异步路径）。
+    """
+    def __init__(self, limit=64, per_host=16, timeout=30, chunk_size=64 * 1024, min_size=10240, metrics=None):
+        """初始化下载器
+
+        Args:
+            limit (int): 同时打开的最大连接数
+            per_host (int): 每个主机的最大连接数
+            timeout (float): 单次请求超时时间（秒）
+            chunk_size (int): 流式下载的分块大小（字节）
+            min_size (int): 有效图片的最小字节数
+            metrics (Metrics): 指标收集器，每张图片的下载记录为一个 download 阶段
+        """
+        self.limit = limit
+        self.per_host = per_host
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.min_size = min_size
+        self.metrics = metrics or Metrics()
+        self._session = None
+        self._fallback = None
+
+    async def start(self):
+        """创建HTTP会话（必须在事件循环中调用）"""
+        if aiohttp is not None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.per_host),
+                headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                                       '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'},
+            )
+        else:
+            print("⚠️ 未安装aiohttp，下载和验证改为在线程中执行（pip install aiohttp）")
+            self._fallback = ImageDownloader(max_workers=self.per_host, timeout=self.timeout,
+                                             min_size=self.min_size, metrics=self.metrics)
+        return self
+
+    @staticmethod
+    def _cookie_header(cookies):
+        return {'Cookie': '; '.join(f"{name}={value}" for name, value in cookies.items())} if cookies else {}
+
+    async def verify(self, url, cookies=None):
+        """HEAD请求验证URL是否为大小合理的图片"""
+        try:
+            if self._session is None:
+                response = await asyncio.to_thread(self._fallback.session.head, url, cookies=cookies,
+                                                   timeout=self.timeout, allow_redirects=True)
+                status, headers = response.status_code, response.headers
+            else:
+                async with self._session.head(url, headers=self._cookie_header(cookies),
+                                              allow_redirects=True) as response:
+                    status, headers = response.status, response.headers
+        except Exception as e:
+            print(f"验证图片URL时出现错误: {e}")
+            return False
+
+        content_type = headers.get('content-type', '')
+        content_length = headers.get('content-length')
+        return (status == 200 and 'image' in content_type and
+                bool(content_length) and content_length.isdigit() and int(content_length) > self.min_size)
+
+    async def download(self, url, filename, cookies=None):
+        """流式下载单张图片：首块校验文件头，写入临时文件后原子重命名"""
+        if self._session is None:
+            return await asyncio.to_thread(self._fallback.download, url, filename, cookies)
+
+        directory = os.path.dirname(os.path.abspath(filename))
+        tmp_path = None
+        with self.metrics.span(STAGE_DOWNLOAD, host=urlsplit(url).hostname) as span:
+            try:
+                async with self._session.get(url, headers=self._cookie_header(cookies)) as response:
+                    content_type = response.headers.get('content-type', '')
+                    if response.status != 200 or 'image' not in content_type:
+                        print(f"❌ 下载图片失败，状态码: {response.status}，类型: {content_type}")
+                        span.set('failed')
+                        return False
+
+                    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.download.', suffix='.part')
+                    size = 0
+                    head = b''
+                    with os.fdopen(fd, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(self.chunk_size):
+                            if head is not None:
+                                head += chunk
+                                if len(head) < SIGNATURE_BYTES:
+                                    continue
+                                if not detect_image_format(head):
+                                    print(f"❌ 未识别的图片格式，文件头: {head[:16].hex()}，中止下载")
+                                    span.set('failed')
+                                    return False
+                                chunk, head = head, None
+                            f.write(chunk)
+                            size += len(chunk)
+                        if head is not None:
+                            if not detect_image_format(head):
+                                span.set('failed')
+                                return False
+                            f.write(head)
+                            size += len(head)
+
+                span.set(bytes=size)
+                if size <= self.min_size:
+                    print(f"❌ 下载的文件不是有效图片 (大小: {size} 字节)")
+                    span.set('failed')
+                    return False
+                os.replace(tmp_path, filename)
+                tmp_path = None
+                print(f"✅ 图片下载成功: {filename} ({size/1024:.1f}KB)")
+                return True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ 下载图片时出现错误: {e}")
+                span.set('error')
+                return False
+            finally:
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._fallback is not None:
+            await asyncio.to_thread(self._fallback.close)
+            self._fallback = None
+
+
+class AsyncDoubaoImageGenerator:
+    """原生asyncio版本的豆包图片生成器
+
+    Selenium只用于启动Chrome和恢复登录；之后每个提示词在浏览器中新建一个标签页，
+    通过同一条DevTools websocket（CDP，flatten会话）异步提交并等待生成，
+    下载和验证使用异步HTTP客户端。数百个在途提示词和下载可以复用一个事件循环，
+    调用方可以用 asyncio.wait_for / Task.cancel 控制超时和取消，取消时标签页会被关闭。
+
+    用法:
+        async with AsyncDoubaoImageGenerator(headless=True) as generator:
+            results = await generator.generate_many(prompts)
+    """
+    def __init__(self, headless=True, user_data_dir=None, session_file=None, allow_manual_login=True,
+                 max_tabs=8, submit_interval=3, output_dir=None, downloader=None, resolution_cache=None,
+                 metrics=None, generation_scheduler=None, transcoder=None, chat_url=DOUBAO_CHAT_URL):
+        """初始化生成器（浏览器在 start() 中启动）
+
+        Args:
+            headless (bool): 是否使用无头模式
+            user_data_dir (str): 持久化的Chrome用户数据目录
+            session_file (str): 登录会话快照文件
+            allow_manual_login (bool): 会话无效时是否等待人工登录
+            max_tabs (int): 同时打开的生成标签页上限
+            submit_interval (float): 相邻两次提交之间的最短间隔（秒）
+            output_dir (str): 图片保存目录，None表示当前目录
+            downloader (AsyncImageDownloader): 异步下载器，为None时自动创建
+            resolution_cache (ResolutionCache): 缩略图到原图的解析缓存
+            metrics (Metrics): 分阶段计时指标收集器
+            generation_scheduler (GenerationScheduler): 根据历史生成耗时决定等待超时
+            transcoder (ImageTranscoder): 下载后的本地转码阶段
+            chat_url (str): 新标签页打开的聊天页面
+        """
+        self.headless = headless
+        self.user_data_dir = user_data_dir
+        self.session_file = session_file
+        self.allow_manual_login = allow_manual_login
+        self.max_tabs = max_tabs
+        self.submit_interval = submit_interval
+        self.output_dir = output_dir
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.metrics = metrics or Metrics()
+        self._owns_downloader = downloader is None
+        self.downloader = downloader or AsyncImageDownloader(metrics=self.metrics)
+        self.resolution_cache = resolution_cache or ResolutionCache()
+        self.generation_scheduler = generation_scheduler or GenerationScheduler()
+        self.transcoder = transcoder
+        self.chat_url = chat_url
+        self.cdp = None
+        self._browser = None
+        self._cookies = []
+        self._tabs = None
+        self._submit_lock = None
+        self._last_submit = 0
+        # 下一个未分配的提示词序号，保证同一实例上并发的 generate 调用不会写同名文件
+        self._next_index = 0
+
+    async def start(self):
+        """启动浏览器、登录并连接DevTools"""
+        self._tabs = asyncio.Semaphore(self.max_tabs)
+        self._submit_lock = asyncio.Lock()
+        self._browser = await asyncio.to_thread(self._launch_browser)
+        debugger_address = self._browser.driver.capabilities.get('goog:chromeOptions', {}).get('debuggerAddress')
+        if not debugger_address:
+            raise Exception("浏览器未暴露debuggerAddress")
+        version = await asyncio.to_thread(
+            lambda: requests.get(f"http://{debugger_address}/json/version", timeout=5).json())
+        self.cdp = await CdpConnection.connect(version['webSocketDebuggerUrl'])
+        if self._owns_downloader:
+            await self.downloader.start()
+        await self.refresh_cookies()
+        print(f"✅ 异步生成器就绪（DevTools: {debugger_address}，最多 {self.max_tabs} 个标签页）")
+        return self
+
+    def _launch_browser(self):
+        """在线程中用Selenium启动浏览器并登录"""
+        browser = DoubaoImageGenerator(headless=self.headless, capture_network=False,
+                                       user_data_dir=self.user_data_dir, session_file=self.session_file,
+                                       metrics=self.metrics, generation_scheduler=self.generation_scheduler)
+        if not browser.login_and_extract_params(allow_manual_login=self.allow_manual_login):
+            browser.close()
+            raise Exception("登录失败")
+        return browser
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def refresh_cookies(self):
+        """通过CDP读取浏览器中所有域名的cookies"""
+        result = await self.cdp.send('Storage.getCookies')
+        self._cookies = result.get('cookies', [])
+        return self._cookies
+
+    def cookies_for(self, url):
+        """返回适用于URL主机的cookies字典"""
+        host = urlsplit(url).hostname or ''
+        cookies = {}
+        for cookie in self._cookies:
+            domain = cookie.get('domain', '').lstrip('.')
+            if domain and (host == domain or host.endswith('.' + domain)):
+                cookies[cookie['name']] = cookie['value']
+        return cookies
+
+    def output_path(self, filename):
+        return os.path.join(self.output_dir, filename) if self.output_dir else filename
+
+    async def _open_tab(self):
+        """新建后台标签页并打开聊天页面，返回CDP会话"""
+        target = await self.cdp.send('Target.createTarget', {'url': 'about:blank', 'background': True})
+        session = await self.cdp.attach(target['targetId'])
+        try:
+            await session.send('Page.enable')
+            # 后台标签页也按聚焦状态渲染，页面内监听器不会被降频
+            await session.send('Emulation.setFocusEmulationEnabled', {'enabled': True})
+            loaded = session.expect_event('Page.loadEventFired')
+            await session.send('Page.navigate', {'url': self.chat_url})
+            await asyncio.wait_for(loaded, 30)
+            await session.execute_async_script(NETWORK_IDLE_SCRIPT, 500, 5000, timeout=15)
+        except BaseException:
+            await self._close_tab(session)
+            raise
+        return session
+
+    async def _close_tab(self, session):
+        try:
+            await self.cdp.send('Target.closeTarget', {'targetId': session.target_id}, timeout=5)
+        except Exception as e:
+            print(f"关闭标签页时出现错误: {e}")
+
+    async def _submit(self, session, prompt, timeout=10):
+        """等待输入框出现，注入图片监听器后输入并发送提示词，返回发送前页面上已有图片的src列表（基线）"""
+        with self.metrics.span(STAGE_INPUT_LOOKUP) as span:
+            deadline = time.time() + timeout
+            while (selector := await session.execute_script(FOCUS_INPUT_SCRIPT)) < 0:
+                if time.time() >= deadline:
+                    span.set('failed')
+                    raise Exception("找不到输入框")
+                await asyncio.sleep(0.25)
+            span.set(selector=selector + 1)
+
+        # 相邻提交之间保持间隔
+        async with self._submit_lock:
+            delay = self.submit_interval - (time.time() - self._last_submit)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            with self.metrics.span(STAGE_SUBMIT):
+                baseline = await session.execute_script(IMAGE_WATCHER_SCRIPT, True, GENERATED_URL_RULES)
+                await session.execute_script(FOCUS_INPUT_SCRIPT)
+                await session.send('Input.insertText', {'text': prompt})
+                key = {'key': 'Enter', 'code': 'Enter', 'windowsVirtualKeyCode': 13}
+                await session.send('Input.dispatchKeyEvent', dict(key, type='keyDown', text='\r'))
+                await session.send('Input.dispatchKeyEvent', dict(key, type='keyUp'))
+            self._last_submit = time.time()
+        return baseline
+
+    async def _wait_for_images(self, session, timeout, baseline=None, settle=1.0, slice_seconds=30):
+        """等待页面内监听器判定生成完成，返回图片URL列表；超时返回None"""
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            slice_ms = int(min(remaining, slice_seconds) * 1000)
+            state = await session.execute_async_script(WAIT_FOR_IMAGES_SCRIPT, slice_ms, int(settle * 1000),
+                                                       timeout=slice_seconds + 10)
+            if state is None:
+                # 页面已刷新，监听器丢失，按发送前的基线重新注入
+                await session.execute_script(IMAGE_WATCHER_SCRIPT, baseline or [], GENERATED_URL_RULES)
+                continue
+            if state['complete']:
+                return [image['src'] for image in state['images']]
+
+    async def resolve_original_urls(self, image_urls):
+        """缩略图URL并发解析为原图URL：命中缓存直接使用，否则验证改写后的URL，不可访问时保留缩略图"""
+        async def resolve(url):
+            # 解析缓存读写SQLite，放到线程中执行，不阻塞事件循环
+            cached = await asyncio.to_thread(self.resolution_cache.get, url)
+            if cached:
+                return cached['original_url']
+            keep_format = bool(self.transcoder and self.transcoder.available)
+            rewritten = convert_to_original_url(url, keep_format=keep_format)
+            if rewritten != url and await self.downloader.verify(rewritten, self.cookies_for(rewritten)):
+                await asyncio.to_thread(self.resolution_cache.put, url, rewritten, STRATEGY_ATTRIBUTE)
+                return rewritten
+            return url
+
+        with self.metrics.span(STAGE_URL_RESOLUTION, images=len(image_urls)):
+            return list(await asyncio.gather(*(resolve(url) for url in image_urls)))
+
+    async def download_images(self, image_urls, filenames):
+        """并发下载一组图片，返回与输入顺序一致的保存路径（失败为None）"""
+        with self.metrics.span(STAGE_DOWNLOAD_BATCH, images=len(image_urls)) as span:
+            results = await asyncio.gather(*(self.downloader.download(url, filename, self.cookies_for(url))
+                                             for url, filename in zip(image_urls, filenames)))
+            paths = [filename if ok else None for filename, ok in zip(filenames, results)]
+            span.set('ok' if all(results) else 'failed', saved=sum(results))
+        if self.transcoder and any(paths):
+            with self.metrics.span(STAGE_TRANSCODE, images=sum(results)):
+                paths = await asyncio.get_running_loop().run_in_executor(None, self.transcoder.transcode_many, paths)
+        return paths
+
+    def _reserve_indexes(self, count):
+        """分配 count 个连续的提示词序号，返回第一个（事件循环单线程执行，分配过程中没有await，无需加锁）"""
+        start = self._next_index
+        self._next_index += count
+        return start
+
+    async def generate(self, prompt, index=None, timeout=None):
+        """生成单个提示词的图片并下载，返回结果记录
+
+        Args:
+            prompt (str): 提示词
+            index (int): 提示词序号，用于生成文件名；为None时从实例的计数器分配，并发调用的文件名互不冲突
+            timeout (float): 等待生成的最长时间（秒），为None时由生成耗时调度器决定
+        """
+        if index is None:
+            index = self._reserve_indexes(1)
+        async with self._tabs:
+            print(f"\n=== [异步] 提示词 {index+1}: {prompt} ===")
+            session = await self._open_tab()
+            try:
+                baseline = await self._submit(session, prompt)
+                wait_timeout = timeout or self.generation_scheduler.timeout()
+                started = time.time()
+                with self.metrics.span(STAGE_GENERATION_WAIT) as span:
+                    image_urls = await self._wait_for_images(session, wait_timeout, baseline)
+                    span.set('ok' if image_urls else 'timeout', images=len(image_urls or []))
+            finally:
+                await self._close_tab(session)
+
+        if not image_urls:
+            if image_urls is None:
+                # 等待超时：已等待时长作为删失样本计入历史
+                await asyncio.to_thread(self.generation_scheduler.observe, time.time() - started, True)
+            print(f"❌ 提示词 {index+1} 未获取到生成的图片")
+            return _failed(prompt)
+        # 记录耗时会写历史文件
+        await asyncio.to_thread(self.generation_scheduler.observe, time.time() - started)
+        print(f"🎉 提示词 {index+1} 生成完成，共 {len(image_urls)} 张图片")
+
+        await self.refresh_cookies()
+        original_urls = await self.resolve_original_urls(image_urls)
+        filenames = [self.output_path(f"generated_image_{index+1}_{j+1}.jpg") for j in range(len(original_urls))]
+        paths = await self.download_images(original_urls, filenames)
+        downloaded_files = [path for path in paths if path]
+        print(f"✅ 提示词 {index+1} 保存了 {len(downloaded_files)}/{len(original_urls)} 张图片")
+        return {
+            'prompt': prompt,
+            'success': True,
+            'image_urls': original_urls,
+            'downloaded_files': downloaded_files,
+        }
+
+    async def generate_many(self, prompts, timeout=None):
+        """并发生成多个提示词，结果按输入顺序返回
+
+        同时打开的标签页不超过 max_tabs；单个提示词出错只记为失败，不影响其他提示词。
+        取消 generate_many 会取消所有在途的提示词并关闭它们的标签页。
+        """
+        async def run(index, prompt):
+            try:
+                return await self.generate(prompt, index, timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ 提示词 {index+1} 执行出错: {e}")
+                return _failed(prompt)
+            finally:
+                await asyncio.to_thread(self.metrics.flush)
+
+        prompts = list(prompts)
+        start = self._reserve_indexes(len(prompts))
+        return list(await asyncio.gather(*(run(index, prompt) for index, prompt in enumerate(prompts, start))))
+
+    async def close(self):
+        """关闭DevTools连接、HTTP会话和浏览器"""
+        if self.cdp is not None:
+            await self.cdp.close()
+            self.cdp = None
+        if self._owns_downloader:
+            await self.downloader.close()
+        if self._browser is not None:
+            await asyncio.to_thread(self._browser.close)
+            self._browser = None
+        await asyncio.to_thread(self.metrics.flush)
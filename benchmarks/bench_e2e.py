@@ -0,0 +1,207 @@
+"""端到端基准：在本地模拟的豆包站点上测量各阶段耗时和吞吐
+
+启动 fake_doubao.FakeDoubaoServer（聊天页面 + 图片CDN），用无头Chrome驱动 DoubaoImageGenerator，
+分别统计 send_image_request_via_browser、wait_for_image_generation、get_current_images、
+download_image 的延迟分布，以及下载吞吐和条件等待相比固定sleep每个提示词节省的秒数。不需要访问 doubao.com，也不需要真实生成。
+
+用法:
+    python benchmarks/bench_e2e.py [--iterations 5] [--delay 3] [--images 4] [--json result.json]
+    python benchmarks/bench_e2e.py --no-browser   # 只测下载阶段（无需Chrome）
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_doubao import FakeDoubaoServer
+from image_downloader import ImageDownloader
+
+
+def percentile(values, fraction):
+    """最近秩百分位数"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """把各阶段的耗时样本（秒）汇总为毫秒统计"""
+    summary = {}
+    for stage, values in samples.items():
+        if not values:
+            continue
+        summary[stage] = {
+            'count': len(values),
+            'mean_ms': sum(values) / len(values) * 1000,
+            'p50_ms': percentile(values, 0.5) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'max_ms': max(values) * 1000,
+        }
+    return summary
+
+
+def print_summary(summary, throughput):
+    print(f"\n{'阶段':<34}{'次数':>6}{'平均(ms)':>12}{'P50(ms)':>12}{'P95(ms)':>12}{'最大(ms)':>12}")
+    for stage, stats in summary.items():
+        print(f"{stage:<34}{stats['count']:>6}{stats['mean_ms']:>12.1f}{stats['p50_ms']:>12.1f}"
+              f"{stats['p95_ms']:>12.1f}{stats['max_ms']:>12.1f}")
+    for name, value in throughput.items():
+        print(f"{name}: {value:.2f}")
+
+
+@contextlib.contextmanager
+def quiet(enabled):
+    """屏蔽被测代码的进度输出"""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_downloads(server, download, samples, throughput, directory, count):
+    """下载阶段：逐张测单图延迟，再测并行批量吞吐"""
+    urls = [server.image_url(f"download{i}", original=True) for i in range(count)]
+    for i, url in enumerate(urls):
+        start = time.perf_counter()
+        ok = download(url, os.path.join(directory, f"single_{i}.png"))
+        samples['download_image'].append(time.perf_counter() - start)
+        if not ok:
+            print(f"⚠️ 下载失败: {url}")
+
+    downloader = ImageDownloader()
+    try:
+        items = [(url, os.path.join(directory, f"batch_{i}.png")) for i, url in enumerate(urls)]
+        start = time.perf_counter()
+        results = downloader.download_many(items)
+        elapsed = time.perf_counter() - start
+    finally:
+        downloader.close()
+    samples['download_many (批量)'].append(elapsed)
+    total_bytes = sum(os.path.getsize(path) for (url, path), ok in zip(items, results) if ok)
+    throughput['并行下载吞吐 (张/秒)'] = sum(results) / elapsed
+    throughput['并行下载吞吐 (MB/秒)'] = total_bytes / elapsed / 1024 / 1024
+
+
+def bench_browser(server, args, samples, throughput):
+    """浏览器阶段：发送提示词、等待生成、获取当前页面图片"""
+    from doubao_image_generator import DoubaoImageGenerator
+
+    start = time.perf_counter()
+    with quiet(not args.verbose):
+        generator = DoubaoImageGenerator(headless=True, startup_budget=None)
+    samples['启动浏览器'].append(time.perf_counter() - start)
+
+    # 记录 send_image_request_via_browser 内部的等待耗时，以便拆分出提交阶段
+    wait_times = []
+    original_wait = generator.wait_for_image_generation
+
+    def timed_wait(*wait_args, **wait_kwargs):
+        wait_start = time.perf_counter()
+        try:
+            return original_wait(*wait_args, **wait_kwargs)
+        finally:
+            wait_times.append(time.perf_counter() - wait_start)
+
+    generator.wait_for_image_generation = timed_wait
+
+    try:
+        generated = 0
+        saved = []
+        run_start = time.perf_counter()
+        for i in range(args.iterations):
+            generator.driver.get(server.chat_url)
+
+            wait_times.clear()
+            generator.wait_ledger.reset()
+            start = time.perf_counter()
+            with quiet(not args.verbose):
+                urls = generator.send_image_request_via_browser(f"基准测试提示词 {i+1}", download=False)
+            total = time.perf_counter() - start
+            generated += len(urls)
+            samples['send_image_request_via_browser'].append(total)
+            if wait_times:
+                samples['wait_for_image_generation'].append(wait_times[-1])
+                samples['  等待超出生成耗时的部分'].append(wait_times[-1] - server.delay)
+                samples['  提交（不含等待）'].append(total - wait_times[-1])
+            if len(urls) != server.images:
+                print(f"⚠️ 第 {i+1} 轮获取到 {len(urls)}/{server.images} 张图片")
+
+            start = time.perf_counter()
+            with quiet(not args.verbose):
+                current = generator.get_current_images()
+            samples['get_current_images'].append(time.perf_counter() - start)
+            if len(current) != server.images:
+                print(f"⚠️ 第 {i+1} 轮 get_current_images 返回 {len(current)}/{server.images} 张图片")
+            saved.append(generator.wait_ledger.total_saved())
+
+        throughput['生成吞吐 (张/分钟)'] = generated / (time.perf_counter() - run_start) * 60
+        throughput['条件等待节省 (秒/提示词)'] = sum(saved) / len(saved) if saved else 0.0
+        return generator
+    except Exception:
+        generator.close()
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟豆包站点上的端到端基准")
+    parser.add_argument('--iterations', type=int, default=5, help="生成轮数")
+    parser.add_argument('--delay', type=float, default=3.0, help="模拟生成耗时（秒）")
+    parser.add_argument('--images', type=int, default=4, help="每轮生成的图片数量")
+    parser.add_argument('--thumb-kb', type=int, default=40)
+    parser.add_argument('--original-kb', type=int, default=400)
+    parser.add_argument('--cdn-latency', type=float, default=0.0, help="CDN每个请求的额外延迟（秒）")
+    parser.add_argument('--downloads', type=int, default=16, help="下载阶段的图片数量")
+    parser.add_argument('--no-browser', action='store_true', help="跳过浏览器阶段，只测下载")
+    parser.add_argument('--verbose', action='store_true', help="显示被测代码的进度输出")
+    parser.add_argument('--json', help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    server = FakeDoubaoServer(delay=args.delay, images=args.images, thumb_kb=args.thumb_kb,
+                              original_kb=args.original_kb, cdn_latency=args.cdn_latency).start()
+    print(f"模拟站点: {server.chat_url}")
+
+    samples = {name: [] for name in (
+        '启动浏览器', 'send_image_request_via_browser', '  提交（不含等待）', 'wait_for_image_generation',
+        '  等待超出生成耗时的部分', 'get_current_images', 'download_image', 'download_many (批量)',
+    )}
+    throughput = {}
+    generator = None
+
+    try:
+        if not args.no_browser:
+            generator = bench_browser(server, args, samples, throughput)
+            download = generator.download_image
+        else:
+            single_downloader = ImageDownloader()
+            download = single_downloader.download
+
+        with tempfile.TemporaryDirectory() as directory, quiet(not args.verbose):
+            bench_downloads(server, download, samples, throughput, directory, args.downloads)
+    finally:
+        if generator:
+            generator.close()
+        elif args.no_browser:
+            single_downloader.close()
+        server.stop()
+
+    summary = summarize(samples)
+    print_summary(summary, throughput)
+    print(f"CDN请求: {server.requests}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'stages': summary, 'throughput': throughput,
+                       'cdn_requests': server.requests}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.json}")
+
+
+if __name__ == '__main__':
+    main()
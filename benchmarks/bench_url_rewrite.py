@@ -0,0 +1,176 @@
+"""缩略图转原图URL改写的微基准
+
+对比原先逐条执行 re.sub 的实现与预编译单遍改写器（冷缓存/热缓存）的单URL耗时，
+并校验两者在语料上的输出是否一致。
+
+用法:
+    python benchmarks/bench_url_rewrite.py [--corpus urls.txt] [--repeat 5]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_url_rewriter import OriginalUrlRewriter
+
+
+# 线上观察到的缩略图URL形态
+SAMPLE_TEMPLATES = [
+    "https://p3-flow-imagex-sign.byteimg.com/ocean-cloud-tos/image_skill/{id}~tplv-a9rns2rl98-image-web-thumb-watermark-v2.jpeg?rk3s={rk3s}&x-expires={exp}&x-signature={sig}",
+    "https://p9-flow-imagex-sign.byteimg.com/ocean-cloud-tos/image_skill/{id}~tplv-a9rns2rl98-web-thumb-watermark-v2-avif.avif?rk3s={rk3s}&x-expires={exp}&x-signature={sig}",
+    "https://p26-flow-imagex-sign.byteimg.com/ocean-cloud-tos/image_skill/{id}~tplv-a9rns2rl98-web-thumb-watermark-v2-webp.webp?rk3s={rk3s}&x-expires={exp}&x-signature={sig}",
+    "https://p3-flow-imagex-sign.byteimg.com/ocean-cloud-tos/image_skill/{id}~tplv-a9rns2rl98-image-web-thumb-wm.jpeg?rk3s={rk3s}&x-expires={exp}&x-signature={sig}",
+    "https://p6-flow-imagex-sign.byteimg.com/ocean-cloud-tos/image_skill/{id}~tplv-a9rns2rl98-downsize-watermark-1-5-b.png?rk3s={rk3s}&x-expires={exp}&x-signature={sig}",
+]
+
+
+def legacy_convert(thumbnail_url):
+    """原 convert_to_original_url_enhanced 的实现（逐条 re.sub，每次调用 import re 并打印）"""
+    try:
+        import re
+        original_url = thumbnail_url
+
+        print(f"原始缩略图URL: {thumbnail_url}")
+
+        doubao_conversions = [
+            (r'~tplv-[^?]+', ''),
+            (r'-web-thumb-watermark-v2', ''),
+            (r'-web-thumb-watermark', ''),
+            (r'-web-thumb-wm', ''),
+            (r'-watermark-v2', ''),
+            (r'-watermark', ''),
+            (r'-thumb', ''),
+            (r'-wm', ''),
+            (r'-avif\.avif$', ''),
+            (r'-webp\.webp$', ''),
+            (r'\.avif$', '.jpeg'),
+            (r'\.webp$', '.jpeg'),
+            (r'\?[^?]*tplv[^&]*', ''),
+            (r'&[^&]*tplv[^&]*', ''),
+            (r'[?&]w=\d+', ''),
+            (r'[?&]h=\d+', ''),
+            (r'[?&]s=\d+', ''),
+            (r'[?&]size=\d+', ''),
+            (r'[?&]quality=\d+', ''),
+            (r'[?&]format=\w+', ''),
+            (r'[?&]f=\w+', ''),
+            (r'[?&]rk3s=[^&]*', ''),
+            (r'[?&]x-expires=[^&]*', ''),
+            (r'[?&]x-signature=[^&]*', ''),
+        ]
+
+        for pattern, replacement in doubao_conversions:
+            old_url = original_url
+            original_url = re.sub(pattern, replacement, original_url)
+            if old_url != original_url:
+                print(f"✓ 应用规则 '{pattern}': 移除了缩略图标识")
+
+        original_url = re.sub(r'[?&]+$', '', original_url)
+        original_url = re.sub(r'[?]&', '?', original_url)
+        original_url = re.sub(r'&&+', '&', original_url)
+
+        print(f"转换后原图URL: {original_url}")
+
+        if original_url == thumbnail_url:
+            base_match = re.match(r'(https://[^~?]+)', thumbnail_url)
+            if base_match:
+                base_url = base_match.group(1)
+                if not base_url.endswith(('.jpg', '.jpeg', '.png')):
+                    base_url += '.jpeg'
+                return base_url
+            id_match = re.search(r'image_skill/([^~]+)', thumbnail_url)
+            if id_match:
+                domain_match = re.match(r'(https://[^/]+)', thumbnail_url)
+                if domain_match:
+                    return f"{domain_match.group(1)}/ocean-cloud-tos/image_skill/{id_match.group(1)}.jpeg"
+
+        return original_url
+
+    except Exception:
+        return thumbnail_url
+
+
+def generate_corpus(size, objects, seed=0):
+    """生成语料：objects 个图片对象，每个对象以不同签名多次出现"""
+    rng = random.Random(seed)
+    ids = ["%032x_%d" % (rng.getrandbits(128), 1700000000 + i) for i in range(objects)]
+    corpus = []
+    for _ in range(size):
+        template = rng.choice(SAMPLE_TEMPLATES)
+        corpus.append(template.format(
+            id=rng.choice(ids),
+            rk3s="%08x" % rng.getrandbits(32),
+            exp=1760000000 + rng.randrange(86400 * 30),
+            sig="%s%%3D" % "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789%") for _ in range(28)),
+        ))
+    return corpus
+
+
+def load_corpus(path):
+    """从文件读取语料，每行一个URL"""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip().startswith('http')]
+
+
+def measure(func, corpus, repeat):
+    """返回每个URL的最佳平均耗时（微秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for url in corpus:
+            func(url)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(corpus) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="缩略图转原图URL改写微基准")
+    parser.add_argument('--corpus', help="URL语料文件，每行一个；缺省时生成合成语料")
+    parser.add_argument('--size', type=int, default=5000, help="合成语料的URL数量")
+    parser.add_argument('--objects', type=int, default=500, help="合成语料中不同图片对象的数量")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus(args.size, args.objects)
+    print(f"语料: {len(corpus)} 个URL")
+
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        legacy_results = [legacy_convert(url) for url in corpus]
+    rewriter = OriginalUrlRewriter()
+    new_results = rewriter.convert_many(corpus)
+    mismatches = [(url, a, b) for url, a, b in zip(corpus, legacy_results, new_results) if a != b]
+    print(f"输出一致性: {len(corpus) - len(mismatches)}/{len(corpus)}")
+    for url, a, b in mismatches[:5]:
+        print(f"  不一致: {url}\n    旧: {a}\n    新: {b}")
+
+    def legacy_quiet(url):
+        with contextlib.redirect_stdout(sink):
+            legacy_convert(url)
+        sink.seek(0)
+        sink.truncate()
+
+    def cold(url):
+        rewriter.clear()
+        rewriter.convert(url)
+
+    legacy_us = measure(legacy_quiet, corpus, args.repeat)
+    cold_us = measure(cold, corpus, args.repeat)
+    rewriter.clear()
+    warm_us = measure(rewriter.convert, corpus, args.repeat)
+
+    print(f"{'实现':<24}{'每URL耗时(us)':>16}{'加速比':>10}")
+    print(f"{'旧实现(逐条re.sub)':<24}{legacy_us:>16.2f}{1:>10.1f}")
+    print(f"{'单遍改写(冷缓存)':<24}{cold_us:>16.2f}{legacy_us / cold_us:>10.1f}")
+    print(f"{'单遍改写(LRU缓存)':<24}{warm_us:>16.2f}{legacy_us / warm_us:>10.1f}")
+    print(f"缓存命中: {rewriter.hits}, 未命中: {rewriter.misses}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""本地模拟的豆包聊天页面和byteimg图片CDN
+
+聊天页面复刻生成器依赖的DOM结构：输入框、加载指示器（class含generating、文字“正在生成”）、
+image-box-grid-item / image-wrapper 容器、picture + avif/webp source、
+class含image-且 imagex-type='react' 的img，以及悬停后出现的下载按钮。
+CDN按 /byteimg.com/ocean-cloud-tos/image_skill/<对象ID>[~tplv-...] 路径返回可解码的PNG，
+缩略图和原图大小可配置，支持HEAD请求。
+
+用法:
+    python benchmarks/fake_doubao.py --port 8765 --delay 3 --images 4
+"""
+import argparse
+import hashlib
+import json
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+CDN_PREFIX = '/byteimg.com/ocean-cloud-tos/image_skill/'
+THUMB_SUFFIX = '~tplv-a9rns2rl98-image-web-thumb-watermark-v2.jpeg'
+
+CHAT_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>豆包 - 本地模拟</title>
+<style>
+  body { font-family: sans-serif; margin: 0; padding: 16px; }
+  .image-box-grid { display: grid; grid-template-columns: repeat(2, 256px); gap: 8px; margin: 12px 0; }
+  .image-wrapper { position: relative; width: 256px; height: 256px; }
+  .image-wrapper img { width: 256px; height: 256px; display: block; }
+  .image-wrapper button { position: absolute; right: 8px; bottom: 8px; display: none; }
+  .image-wrapper:hover button { display: block; }
+  .generating { padding: 8px; color: #888; }
+  textarea { width: 600px; height: 48px; }
+</style>
+</head>
+<body>
+<div id="messages"></div>
+<textarea placeholder="输入消息，发送给豆包"></textarea>
+<script>
+const CONFIG = __CONFIG__;
+const messages = document.getElementById('messages');
+const input = document.querySelector('textarea');
+let counter = 0;
+
+function signed(url) {
+  const expires = Math.floor(Date.now() / 1000) + 86400;
+  const signature = Math.random().toString(36).slice(2);
+  return url + '?rk3s=8e244e95&x-expires=' + expires + '&x-signature=' + signature;
+}
+
+function renderImages(prompt) {
+  const grid = document.createElement('div');
+  grid.className = 'image-box-grid';
+  for (let i = 0; i < CONFIG.images; i++) {
+    const id = 'bench' + Date.now().toString(36) + (counter++) + '_' + i;
+    const base = CONFIG.cdn + id;
+    const item = document.createElement('div');
+    item.className = 'image-box-grid-item';
+    item.innerHTML =
+      '<div class="image-wrapper">' +
+        '<picture>' +
+          '<source type="image/avif" srcset="' + signed(base + '~tplv-a9rns2rl98-web-thumb-watermark-v2-avif.avif') + '">' +
+          '<source type="image/webp" srcset="' + signed(base + '~tplv-a9rns2rl98-web-thumb-watermark-v2-webp.webp') + '">' +
+          '<img class="image-' + i + '" imagex-type="react" alt="' + prompt + '" src="' + signed(base + CONFIG.thumbSuffix) + '">' +
+        '</picture>' +
+        '<button class="download" title="下载">下载</button>' +
+      '</div>';
+    item.querySelector('button').addEventListener('click', () => {
+      fetch(signed(base + '.jpeg') + '&download=1');
+    });
+    grid.appendChild(item);
+  }
+  messages.appendChild(grid);
+}
+
+input.addEventListener('keydown', (event) => {
+  if (event.key !== 'Enter' || event.shiftKey) return;
+  event.preventDefault();
+  const prompt = input.value;
+  input.value = '';
+  const loading = document.createElement('div');
+  loading.className = 'generating';
+  loading.textContent = '正在生成...';
+  messages.appendChild(loading);
+  setTimeout(() => {
+    loading.remove();
+    renderImages(prompt);
+  }, CONFIG.delayMs);
+});
+</script>
+</body>
+</html>
+"""
+
+
+def _png_chunk(kind, data):
+    """构造PNG数据块"""
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def make_png(seed, size_bytes, width=64, height=64):
+    """生成可被浏览器解码的纯色PNG，用私有数据块填充到指定大小；同一seed内容相同"""
+    digest = hashlib.sha256(seed.encode('utf-8')).digest()
+    row = b'\x00' + digest[:3] * width
+    header = _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+    body = _png_chunk(b'IDAT', zlib.compress(row * height))
+    end = _png_chunk(b'IEND', b'')
+    png = b'\x89PNG\r\n\x1a\n' + header + body
+
+    padding = size_bytes - len(png) - len(end) - 12
+    if padding > 0:
+        filler = (digest * (padding // len(digest) + 1))[:padding]
+        png += _png_chunk(b'bnPd', filler)
+    return png + end
+
+
+class FakeDoubaoServer:
+    """在后台线程中运行的模拟豆包站点（聊天页面 + 图片CDN）"""
+    def __init__(self, host='127.0.0.1', port=0, delay=3.0, images=4, thumb_kb=40, original_kb=400, cdn_latency=0.0):
+        """初始化模拟站点
+
+        Args:
+            host (str): 监听地址
+            port (int): 监听端口，0表示自动分配
+            delay (float): 发送提示词后到图片出现的生成耗时（秒）
+            images (int): 每次生成的图片数量
+            thumb_kb (int): 缩略图大小（KB）
+            original_kb (int): 原图大小（KB）
+            cdn_latency (float): CDN每个请求额外增加的延迟（秒）
+        """
+        self.delay = delay
+        self.images = images
+        self.thumb_kb = thumb_kb
+        self.original_kb = original_kb
+        self.cdn_latency = cdn_latency
+        self.requests = {'page': 0, 'thumbnail': 0, 'original': 0, 'head': 0}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def chat_url(self):
+        return self.base_url + '/chat'
+
+    def _count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _image(self, path):
+                object_part = path[len(CDN_PREFIX):]
+                is_original = '~tplv-' not in object_part
+                object_id = object_part.split('~', 1)[0].split('.', 1)[0]
+                size_kb = server.original_kb if is_original else server.thumb_kb
+                seed = object_id + (':original' if is_original else ':thumb')
+                return make_png(seed, size_kb * 1024), is_original
+
+            def _send(self, body, content_type, include_body=True):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                if include_body:
+                    self.wfile.write(body)
+
+            def _handle(self, include_body):
+                path = urlsplit(self.path).path
+                if path in ('/', '/chat'):
+                    server._count('page')
+                    config = {
+                        'delayMs': int(server.delay * 1000),
+                        'images': server.images,
+                        'cdn': server.base_url + CDN_PREFIX,
+                        'thumbSuffix': THUMB_SUFFIX,
+                    }
+                    page = CHAT_PAGE.replace('__CONFIG__', json.dumps(config))
+                    self._send(page.encode('utf-8'), 'text/html; charset=utf-8', include_body)
+                elif path.startswith(CDN_PREFIX):
+                    if server.cdn_latency:
+                        time.sleep(server.cdn_latency)
+                    body, is_original = self._image(path)
+                    server._count('head' if not include_body else ('original' if is_original else 'thumbnail'))
+                    self._send(body, 'image/png', include_body)
+                else:
+                    self.send_error(404)
+
+            def do_GET(self):
+                self._handle(True)
+
+            def do_HEAD(self):
+                self._handle(False)
+
+        return Handler
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-doubao', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """在当前线程中运行服务（命令行使用）"""
+        self._httpd.serve_forever()
+
+    def stop(self):
+        """停止服务"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def image_url(self, object_id, original=False):
+        """构造某个对象的图片URL（用于不经过浏览器的下载基准）"""
+        suffix = '.jpeg' if original else THUMB_SUFFIX
+        return (f"{self.base_url}{CDN_PREFIX}{object_id}{suffix}"
+                f"?rk3s=8e244e95&x-expires={int(time.time()) + 86400}&x-signature=bench")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的豆包聊天页面和图片CDN")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=3.0, help="生成耗时（秒）")
+    parser.add_argument('--images', type=int, default=4, help="每次生成的图片数量")
+    parser.add_argument('--thumb-kb', type=int, default=40)
+    parser.add_argument('--original-kb', type=int, default=400)
+    parser.add_argument('--cdn-latency', type=float, default=0.0, help="CDN每个请求的额外延迟（秒）")
+    args = parser.parse_args()
+
+    server = FakeDoubaoServer(args.host, args.port, args.delay, args.images,
+                              args.thumb_kb, args.original_kb, args.cdn_latency)
+    print(f"模拟豆包聊天页面: {server.chat_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
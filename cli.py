@@ -0,0 +1,167 @@
+"""豆包图片批量生成命令行
+
+从文件或标准输入逐行读取提示词（纯文本每行一个，或JSON Lines中的 prompt 字段；空行和 # 开头的行忽略），
+每个提示词完成后立即向结果文件追加一行JSON记录并刷新，批次运行期间可以用 tail -f 查看结果。
+提示词按需读取，结果逐条写出，内存占用与提示词文件大小无关。
+
+用法:
+    python cli.py prompts.txt --results results.jsonl --output-dir images
+    cat prompts.txt | python cli.py - --concurrency 3 --headless > results.jsonl
+    python cli.py prompts.jsonl --job-db jobs.db --retry-failed --store image_store
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+from doubao_image_generator import DoubaoImageGenerator, DoubaoGeneratorPool
+from generation_scheduler import GenerationScheduler
+from image_downloader import ImageDownloader
+from image_store import ImageStore
+from job_store import JobStore
+from metrics import Metrics
+from resolution_cache import ResolutionCache
+from transcoder import ImageTranscoder, TARGET_FORMATS
+
+
+def read_prompts(stream):
+    """逐行读取提示词：JSON对象取 prompt 字段，其余按纯文本处理"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            try:
+                prompt = json.loads(line).get('prompt')
+            except ValueError as e:
+                print(f"⚠️ 第 {line_number} 行不是有效的JSON，已跳过: {e}", file=sys.stderr)
+                continue
+            if not prompt:
+                print(f"⚠️ 第 {line_number} 行缺少 prompt 字段，已跳过", file=sys.stderr)
+                continue
+            yield prompt
+        else:
+            yield line
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="通过豆包批量生成图片，结果以JSON Lines逐条输出")
+    parser.add_argument('input', nargs='?', default='-', help="提示词文件，- 表示标准输入（默认）")
+    parser.add_argument('--results', default='-', help="JSON Lines结果文件（追加写入），- 表示标准输出（默认）")
+    parser.add_argument('--output-dir', default='images', help="图片保存目录（默认 images）")
+    parser.add_argument('--store', help="改用按内容寻址的图片仓库目录，重复图片只保存一份")
+    parser.add_argument('--concurrency', type=int, default=1, help="同时生成的提示词数量（默认 1）")
+    parser.add_argument('--mode', choices=['tabs', 'browsers'], default='tabs',
+                        help="并发方式：同一浏览器的多个标签页（默认），或多个浏览器实例")
+    parser.add_argument('--timeout', type=float,
+                        help="单个提示词等待生成的最长时间（秒），默认根据历史耗时自适应")
+    parser.add_argument('--download-timeout', type=float, default=30, help="单次下载请求的超时时间（秒）")
+    parser.add_argument('--headless', action='store_true', help="使用无头模式")
+    parser.add_argument('--user-data-dir', help="持久化的Chrome用户数据目录")
+    parser.add_argument('--session-file', help="登录会话快照文件")
+    parser.add_argument('--job-db', help="持久化任务库，中断后重新运行会跳过已完成的提示词")
+    parser.add_argument('--retry-failed', action='store_true', help="使用任务库时重试之前失败的任务")
+    parser.add_argument('--transcode', choices=sorted(TARGET_FORMATS), help="下载后在本地转码为指定格式")
+    parser.add_argument('--quality', type=int, default=90, help="转码质量（默认 90）")
+    parser.add_argument('--max-dimension', type=int, help="转码时限制最长边（像素）")
+    parser.add_argument('--state-dir', default='.',
+                        help="解析缓存、生成耗时历史和指标文件所在目录（默认当前目录）")
+    return parser.parse_args(argv)
+
+
+def run(args, results_file):
+    """启动浏览器并逐条生成，返回 (成功数, 失败数)"""
+    os.makedirs(args.state_dir, exist_ok=True)
+
+    def state(name):
+        return os.path.join(args.state_dir, name)
+
+    metrics = Metrics(state('image_generation_metrics.jsonl'), state('image_generation_metrics.prom'))
+    resolution_cache = ResolutionCache(state('resolution_cache.db'))
+    if args.timeout:
+        # 自适应超时不超过指定值
+        generation_scheduler = GenerationScheduler(state('generation_times.json'), default_timeout=args.timeout,
+                                                   min_timeout=min(30, args.timeout), max_timeout=args.timeout)
+    else:
+        generation_scheduler = GenerationScheduler(state('generation_times.json'))
+    image_store = ImageStore(args.store) if args.store else None
+    transcoder = (ImageTranscoder(args.transcode, quality=args.quality, max_dimension=args.max_dimension)
+                  if args.transcode else None)
+    job_store = JobStore(args.job_db) if args.job_db else None
+    components = dict(image_store=image_store, resolution_cache=resolution_cache, metrics=metrics,
+                      generation_scheduler=generation_scheduler, transcoder=transcoder,
+                      output_dir=None if image_store else args.output_dir,
+                      user_data_dir=args.user_data_dir, session_file=args.session_file)
+
+    downloader = None
+    generator = None
+    pool = None
+    succeeded = failed = 0
+    try:
+        if args.mode == 'browsers' and args.concurrency > 1:
+            pool = DoubaoGeneratorPool(size=args.concurrency, headless=args.headless,
+                                       download_timeout=args.download_timeout, **components)
+            if not pool.start():
+                raise Exception("没有浏览器实例登录成功")
+            results = pool.iter_generate(read_prompts(args.prompt_stream), job_store, args.retry_failed)
+        else:
+            downloader = ImageDownloader(timeout=args.download_timeout, metrics=metrics)
+            generator = DoubaoImageGenerator(headless=args.headless, downloader=downloader, **components)
+            if not generator.login_and_extract_params():
+                raise Exception("登录失败")
+            results = generator.iter_generate(read_prompts(args.prompt_stream), job_store, args.retry_failed,
+                                              tabs=args.concurrency)
+
+        for index, result in results:
+            record = dict(index=index, completed_at=round(time.time(), 3), **result)
+            results_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            results_file.flush()
+            if result['success']:
+                succeeded += 1
+            else:
+                failed += 1
+    finally:
+        if pool:
+            pool.close()
+        if generator:
+            generator.close()
+        if downloader:
+            downloader.close()
+        for component in (transcoder, job_store, image_store, resolution_cache):
+            if component:
+                component.close()
+        metrics.print_summary()
+        metrics.close()
+    return succeeded, failed
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results_to_stdout = args.results == '-'
+    results_file = sys.stdout if results_to_stdout else open(args.results, 'a', encoding='utf-8')
+    args.prompt_stream = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+
+    # 结果写到标准输出时，进度信息改写到标准错误，保证标准输出是纯粹的JSON Lines
+    progress = contextlib.redirect_stdout(sys.stderr) if results_to_stdout else contextlib.nullcontext()
+    try:
+        with progress:
+            succeeded, failed = run(args, results_file)
+            print(f"\n批次完成：成功 {succeeded} 个，失败 {failed} 个")
+    except KeyboardInterrupt:
+        print("\n已中断；使用 --job-db 时重新运行会从中断处继续", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"程序执行出现错误: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.prompt_stream is not sys.stdin:
+            args.prompt_stream.close()
+        if not results_to_stdout:
+            results_file.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
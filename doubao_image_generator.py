@@ -1,6 +1,10 @@
 import logging
 import time
 import json
+import os
+import queue
+import shutil
+import threading
 import requests
 import re
 from selenium import webdriver
@@ -12,22 +16,328 @@ from selenium.webdriver.common.keys import Keys
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.service import Service
 from urllib.parse import urlparse, parse_qs
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from image_downloader import ImageDownloader, detect_image_format
+from image_url_rewriter import convert_to_original_url
+from network_capture import NetworkImageCapture
+from url_verifier import UrlVerifier
+from webdriver_profiler import WebDriverProfiler
+from generation_scheduler import GenerationScheduler
+from waiting import DOWNLOAD_CONTROL_PREDICATE, Waiter, WaitLedger
+from metrics import (Metrics, STAGE_INPUT_LOOKUP, STAGE_SUBMIT, STAGE_GENERATION_WAIT, STAGE_IMAGE_SCAN,
+                     STAGE_URL_RESOLUTION, STAGE_DOWNLOAD_BATCH, STAGE_TRANSCODE)
+from resolution_cache import (ResolutionCache, STRATEGY_NETWORK, STRATEGY_PICTURE, STRATEGY_ATTRIBUTE,
+                              STRATEGY_DOWNLOAD_BUTTON, STRATEGY_CONTEXT_MENU)
+from job_store import (JobStore, STATE_PENDING, STATE_SUBMITTED, STATE_GENERATED, STATE_RESOLVED,
+                       STATE_DOWNLOADED, STATE_FAILED, STAGE_GENERATE, STAGE_RESOLVE, STAGE_DOWNLOAD)
+from image_url_classifier import (classify_many, is_likely_generated_image, is_valid_image_url,
+                                  GENERATED_URL_RULES, REASON_EXCLUDED)
 
 # 配置日志记录
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s')
 logger = logging.getLogger(__name__)
 
+# chromedriver路径的持久化缓存，避免每次启动都访问网络检查版本
+CHROMEDRIVER_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'doubao', 'chromedriver.json')
+_chromedriver_lock = threading.Lock()
+_chromedriver_path = None
+
+
+def resolve_chromedriver_path(refresh=False):
+    """解析chromedriver可执行文件路径，结果在进程内和磁盘上缓存
+    
+    依次尝试：环境变量 CHROMEDRIVER_PATH、进程内缓存、磁盘缓存、PATH中的chromedriver，
+    最后才通过 ChromeDriverManager 联网下载。全部失败时返回None，由Selenium自行解析。
+    
+    Args:
+        refresh (bool): 忽略缓存重新解析（例如缓存的驱动与浏览器版本不匹配时）
+    """
+    global _chromedriver_path
+    
+    env_path = os.environ.get('CHROMEDRIVER_PATH')
+    if env_path and os.path.exists(env_path):
+        return env_path
+    
+    with _chromedriver_lock:
+        if not refresh:
+            if _chromedriver_path and os.path.exists(_chromedriver_path):
+                return _chromedriver_path
+            try:
+                with open(CHROMEDRIVER_CACHE_FILE, encoding='utf-8') as f:
+                    cached_path = json.load(f).get('path')
+                if cached_path and os.path.exists(cached_path):
+                    _chromedriver_path = cached_path
+                    return cached_path
+            except (OSError, ValueError):
+                pass
+            
+            which_path = shutil.which('chromedriver')
+            if which_path:
+                _chromedriver_path = which_path
+                return which_path
+        
+        try:
+            installed_path = ChromeDriverManager().install()
+        except Exception as e:
+            print(f"ChromeDriver下载失败: {e}")
+            return None
+        
+        _chromedriver_path = installed_path
+        try:
+            os.makedirs(os.path.dirname(CHROMEDRIVER_CACHE_FILE), exist_ok=True)
+            with open(CHROMEDRIVER_CACHE_FILE, 'w', encoding='utf-8') as f:
+                json.dump({'path': installed_path, 'resolved_at': time.time()}, f)
+        except OSError as e:
+            print(f"⚠️ 写入chromedriver缓存失败: {e}")
+        return installed_path
+
+
+DOUBAO_HOST = 'www.doubao.com'
+DOUBAO_CHAT_URL = 'https://www.doubao.com/chat/'
+LOGIN_BUTTON_XPATH = "//button[contains(text(), '登录') or contains(text(), '登陆')]|//a[contains(text(), '登录') or contains(text(), '登陆')]"
+
+# 登录状态检查：一次往返返回是否有可见的登录按钮和输入框
+SESSION_STATE_SCRIPT = """
+const visible = (el) => !!(el && (el.offsetWidth || el.offsetHeight || el.getClientRects().length));
+const login = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+const input = document.querySelector("textarea, div[contenteditable='true']");
+return {login: visible(login), input: visible(input)};
+"""
+
+# 在页面脚本执行前恢复localStorage（不覆盖页面已有的值）
+RESTORE_LOCAL_STORAGE_SCRIPT = """
+(() => {
+    if (location.hostname !== %s) return;
+    const items = %s;
+    for (const [key, value] of Object.entries(items)) {
+        if (localStorage.getItem(key) === null) localStorage.setItem(key, value);
+    }
+})();
+"""
+
+# 恢复cookie时保留的字段（Network.setCookies 的 CookieParam）
+SNAPSHOT_COOKIE_FIELDS = ['name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires']
+
+# 页面内图片完成监听器：MutationObserver 发现新图片，load 事件记录加载完成时间
+# arguments[0] 为 true 时把当前页面上已有的图片作为基线忽略（发送提示词前调用），返回基线图片的src列表；
+# 为数组时表示监听器丢失后重新注入，忽略数组中的src（发送前记录的基线）并重新扫描页面
+# arguments[1] 为 image_url_classifier.GENERATED_URL_RULES，URL判定与 is_generated_image_url 一致
+IMAGE_WATCHER_SCRIPT = """
+const baseline = arguments[0];
+const rules = arguments[1];
+let w = window.__doubaoImageWatcher;
+if (!w) {
+    w = window.__doubaoImageWatcher = {images: [], seen: new Set(), ignored: new Set(), lastImageAt: 0};
+    const isGeneratedUrl = (src) => {
+        const lower = src.toLowerCase();
+        const path = lower.split('?', 1)[0];
+        return src.startsWith('http') &&
+            !rules.exclude.some(k => path.includes(k)) &&
+            (rules.generated.some(k => lower.includes(k)) ||
+             rules.generatedPairs.some(([a, b]) => lower.includes(a) && lower.includes(b)) ||
+             rules.doubao.some(k => lower.includes(k)));
+    };
+    const isGenerated = (img) => {
+        const cls = img.getAttribute('class') || '';
+        return isGeneratedUrl(img.src || '') &&
+            (cls.includes('image-') || img.getAttribute('imagex-type') === 'react');
+    };
+    w.record = (img) => {
+        const src = img.src;
+        if (!src || w.seen.has(src) || w.ignored.has(src) || !isGenerated(img)) return;
+        if (img.complete && img.naturalWidth > 0) {
+            w.seen.add(src);
+            w.lastImageAt = Date.now();
+            w.images.push({src: src, loadedAt: w.lastImageAt, width: img.naturalWidth, height: img.naturalHeight});
+        } else if (!img.__doubaoWatched) {
+            img.__doubaoWatched = true;
+            img.addEventListener('load', () => { img.__doubaoWatched = false; w.record(img); }, {once: true});
+        }
+    };
+    w.scan = (node) => {
+        if (node.tagName === 'IMG') w.record(node);
+        if (node.querySelectorAll) node.querySelectorAll('img').forEach(w.record);
+    };
+    const visible = (el) => !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+    w.isGenerating = () => {
+        const byClass = document.querySelectorAll(
+            "div[class*='loading'], div[class*='generating'], div[class*='spinner'], div[class*='progress']");
+        for (const el of byClass) if (visible(el)) return true;
+        const byText = document.evaluate("//div[contains(text(), '生成中') or contains(text(), '正在生成')]",
+            document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (let i = 0; i < byText.snapshotLength; i++) if (visible(byText.snapshotItem(i))) return true;
+        return false;
+    };
+    w.observer = new MutationObserver((mutations) => {
+        for (const m of mutations) {
+            if (m.type === 'attributes') w.scan(m.target);
+            else m.addedNodes.forEach(w.scan);
+        }
+    });
+    w.observer.observe(document.body, {childList: true, subtree: true, attributes: true, attributeFilter: ['src', 'class']});
+}
+if (Array.isArray(baseline)) {
+    w.images = [];
+    w.seen = new Set();
+    w.ignored = new Set(baseline);
+    w.lastImageAt = 0;
+    w.scan(document.body);
+} else if (baseline) {
+    w.images = [];
+    w.seen = new Set();
+    w.ignored = new Set(Array.from(document.images).map(img => img.src));
+    w.lastImageAt = 0;
+    return Array.from(w.ignored);
+} else {
+    w.scan(document.body);
+}
+return w.images.length;
+"""
+
+# 等待监听器判定生成完成：有已完成的图片、没有可见的加载指示器、且最后一张图片加载后静默 settleMs
+# 返回 null 表示监听器不存在（页面已刷新）
+WAIT_FOR_IMAGES_SCRIPT = """
+const maxWaitMs = arguments[0];
+const settleMs = arguments[1];
+const done = arguments[arguments.length - 1];
+const w = window.__doubaoImageWatcher;
+if (!w) { done(null); return; }
+const started = Date.now();
+const finish = (complete) => {
+    clearInterval(timer);
+    const order = new Map(Array.from(document.images).map((img, i) => [img.src, i]));
+    const images = w.images.slice().sort((a, b) => (order.get(a.src) ?? 1e9) - (order.get(b.src) ?? 1e9));
+    done({complete: complete, generating: w.isGenerating(), images: images});
+};
+const timer = setInterval(() => {
+    const now = Date.now();
+    if (w.images.length && now - w.lastImageAt >= settleMs && !w.isGenerating()) finish(true);
+    else if (now - started >= maxWaitMs) finish(false);
+}, 100);
+"""
+
+# 立即返回监听器当前的判定结果（不阻塞），多标签页轮流检查时使用；监听器不存在时返回 null
+IMAGES_STATE_SCRIPT = """
+const settleMs = arguments[0];
+const w = window.__doubaoImageWatcher;
+if (!w) return null;
+const generating = w.isGenerating();
+const order = new Map(Array.from(document.images).map((img, i) => [img.src, i]));
+const images = w.images.slice().sort((a, b) => (order.get(a.src) ?? 1e9) - (order.get(b.src) ?? 1e9));
+return {complete: images.length > 0 && Date.now() - w.lastImageAt >= settleMs && !generating,
+        generating: generating, images: images};
+"""
+
+# 批量扫描页面上所有img：一次往返返回元素引用及筛选所需的全部属性
+SCAN_IMAGES_SCRIPT = """
+const visible = (el) => !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+return Array.from(document.images).map((img, index) => {
+    let picture = img.closest('picture');
+    if (!picture) {
+        const box = img.parentElement && img.parentElement.closest("[class*='image'], [class*='img']");
+        picture = box ? box.querySelector('picture') : null;
+    }
+    const sources = picture ? Array.from(picture.querySelectorAll('source')).map(source => ({
+        type: source.getAttribute('type') || '',
+        srcset: source.getAttribute('srcset') || source.getAttribute('src') || ''
+    })) : [];
+    return {
+        element: img,
+        index: index,
+        src: img.src || '',
+        srcset: img.getAttribute('srcset') || '',
+        'class': img.getAttribute('class') || '',
+        imagex_type: img.getAttribute('imagex-type'),
+        alt: img.alt || '',
+        data_original: img.getAttribute('data-original'),
+        data_src: img.getAttribute('data-src'),
+        data_full_url: img.getAttribute('data-full-url'),
+        natural_width: img.naturalWidth,
+        natural_height: img.naturalHeight,
+        width: img.offsetWidth,
+        height: img.offsetHeight,
+        complete: img.complete && img.naturalWidth > 0,
+        visible: visible(img),
+        sources: sources,
+        in_picture: !!img.closest('picture'),
+        in_grid_item: !!img.closest("div[class*='image-box-grid-item']"),
+        in_mdbox: !!img.closest("div[data-testid='mdbox_image']"),
+        in_wrapper: !!img.closest("div[class*='image-wrapper']")
+    };
+});
+"""
+
+# 与原XPath图片选择器等价的筛选规则，作用于 scan_page_images 返回的数据
+IMAGE_SELECTOR_RULES = [
+    ("image-box-grid-item 中的 image- 图片", lambda img: img['in_grid_item'] and 'image-' in img['class'] and 'http' in img['src']),
+    ("data-testid=mdbox_image 中的图片", lambda img: img['in_mdbox'] and 'http' in img['src']),
+    ("image-wrapper 中的图片", lambda img: img['in_wrapper'] and 'http' in img['src']),
+    ("byteimg.com + image_skill", lambda img: 'byteimg.com' in img['src'] and 'image_skill' in img['src']),
+    ("flow-imagex-sign.byteimg.com", lambda img: 'flow-imagex-sign.byteimg.com' in img['src']),
+    ("ocean-cloud-tos", lambda img: 'ocean-cloud-tos' in img['src']),
+    ("imagex-type='react'", lambda img: img['imagex_type'] == 'react'),
+    ("class 包含 image-", lambda img: 'image-' in img['class']),
+    ("picture 中的图片", lambda img: img['in_picture'] and 'http' in img['src']),
+]
+
 class DoubaoImageGenerator:
-    def __init__(self, headless=False):
+    def __init__(self, headless=False, downloader=None, capture_network=True,
+                 user_data_dir=None, session_file=None, startup_budget=10, network_logging=False,
+                 image_store=None, resolution_cache=None, metrics=None, profile_webdriver=False,
+                 profile_report_path=None, generation_scheduler=None, transcoder=None, output_dir=None,
+                 url_verifier=None):
         """初始化豆包图片生成器
         
         Args:
             headless (bool): 是否使用无头模式（建议设为False以便调试）
+            downloader (ImageDownloader): 共享的下载引擎，为None时创建自有实例
+            capture_network (bool): 是否启动后台CDP网络监听，实时索引原图URL
+            user_data_dir (str): 持久化的Chrome用户数据目录，登录状态随目录保留
+            session_file (str): 登录会话快照文件（cookies + localStorage），启动时恢复，登录后保存
+            startup_budget (float): 浏览器冷启动的时间预算（秒），超出时打印各阶段耗时告警
+            network_logging (bool): 启动时开启performance日志（goog:loggingPrefs），无需重启浏览器即可读取网络请求
+            image_store (ImageStore): 按内容寻址的图片仓库；提供时图片按SHA-256去重保存，已保存的图片不再下载
+            resolution_cache (ResolutionCache): 缩略图到原图的解析缓存，为None时使用仅在内存中的缓存
+            metrics (Metrics): 分阶段计时指标收集器，为None时只在内存中聚合
+            profile_webdriver (bool): 是否统计每个提示词发出的WebDriver命令数和往返延迟
+            profile_report_path (str): WebDriver命令报告的JSON Lines输出文件
+            generation_scheduler (GenerationScheduler): 根据历史生成耗时安排等待间隔和超时，为None时使用仅在内存中的调度器
+            transcoder (ImageTranscoder): 下载后的本地转码阶段；可用时原图解析保留CDN原有格式，由本地统一转码
+            output_dir (str): 不使用图片仓库时图片的保存目录，None表示当前目录
+            url_verifier (UrlVerifier): 共享的URL校验器，为None时基于下载引擎的会话自动创建
         """
         self.driver = None
         self.headless = headless
-        self.session = requests.Session()
+        self.user_data_dir = user_data_dir
+        self.session_file = session_file
+        self.startup_budget = startup_budget
+        self.startup_timings = {}
+        self.capture_network = capture_network
+        self.network_logging = network_logging
+        self.network_capture = None
+        self.profile_webdriver = profile_webdriver
+        self.profile_report_path = profile_report_path
+        self.profiler = None
+        self.waiter = None
+        self.wait_ledger = WaitLedger()
+        # 窗口句柄 -> 发送提示词前页面上已有图片的src列表
+        self.watcher_baselines = {}
+        self.metrics = metrics or Metrics()
+        self._owns_downloader = downloader is None
+        self.downloader = downloader or ImageDownloader(metrics=self.metrics)
+        self.session = self.downloader.session
+        self._owns_url_verifier = url_verifier is None
+        self.url_verifier = url_verifier or UrlVerifier(self.session)
+        self.image_store = image_store
+        self.resolution_cache = resolution_cache or ResolutionCache()
+        self.generation_scheduler = generation_scheduler or GenerationScheduler()
+        self.transcoder = transcoder
+        self.output_dir = output_dir
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.cookie_jar = None
         self.device_id = None
         self.web_id = None
         self.msToken = None
@@ -35,7 +345,9 @@ class DoubaoImageGenerator:
         self.setup_driver()
     
     def setup_driver(self):
-        """设置Chrome浏览器驱动"""
+        """设置Chrome浏览器驱动，并记录各启动阶段的耗时"""
+        timings = {}
+        phase_start = startup_start = time.time()
         chrome_options = Options()
         
         if self.headless:
@@ -46,39 +358,107 @@ class DoubaoImageGenerator:
         chrome_options.add_argument('--disable-dev-shm-usage')
         chrome_options.add_argument('--disable-gpu')
         chrome_options.add_argument('--window-size=1920,1080')
+        # 多标签页并发时后台标签页的定时器和渲染不降频，页面内监听器照常工作
+        chrome_options.add_argument('--disable-background-timer-throttling')
+        chrome_options.add_argument('--disable-backgrounding-occluded-windows')
+        chrome_options.add_argument('--disable-renderer-backgrounding')
         chrome_options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
         
+        # 持久化用户数据目录，重启后保留登录状态
+        if self.user_data_dir:
+            os.makedirs(self.user_data_dir, exist_ok=True)
+            chrome_options.add_argument(f'--user-data-dir={os.path.abspath(self.user_data_dir)}')
+        
         # 添加更多稳定性选项
         chrome_options.add_argument('--disable-blink-features=AutomationControlled')
         chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
         chrome_options.add_experimental_option('useAutomationExtension', False)
         
+        # 网络日志必须在启动时声明，之后无法在同一个浏览器上开启
+        if self.network_logging:
+            chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        
+        # 解析chromedriver（优先使用缓存，不联网）
+        driver_path = resolve_chromedriver_path()
+        timings['resolve_driver'] = time.time() - phase_start
+        
+        phase_start = time.time()
         try:
-            service = Service(ChromeDriverManager().install())
-            self.driver = webdriver.Chrome(service=service, options=chrome_options)
+            if driver_path:
+                self.driver = webdriver.Chrome(service=Service(driver_path), options=chrome_options)
+            else:
+                self.driver = webdriver.Chrome(options=chrome_options)
         except Exception as e:
             print(f"ChromeDriver设置失败: {e}")
             try:
-                self.driver = webdriver.Chrome(options=chrome_options)
+                # 缓存的驱动可能与浏览器版本不匹配，重新解析后再试一次
+                driver_path = resolve_chromedriver_path(refresh=True)
+                service = Service(driver_path) if driver_path else Service()
+                self.driver = webdriver.Chrome(service=service, options=chrome_options)
             except Exception as e2:
                 raise Exception(f"无法初始化ChromeDriver: {e2}")
+        timings['launch_browser'] = time.time() - phase_start
         
+        phase_start = time.time()
+        if self.profile_webdriver:
+            self.profiler = WebDriverProfiler(self.driver, self.profile_report_path).install()
+        self.waiter = Waiter(self.driver, self.wait_ledger)
         self.driver.implicitly_wait(10)
         self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        timings['configure'] = time.time() - phase_start
+        
+        if self.capture_network:
+            phase_start = time.time()
+            self.start_network_capture()
+            timings['network_capture'] = time.time() - phase_start
+        
+        timings['total'] = time.time() - startup_start
+        self.startup_timings = timings
+        
+        summary = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in timings.items())
+        if self.startup_budget and timings['total'] > self.startup_budget:
+            print(f"⚠️ 浏览器启动耗时超出预算 {self.startup_budget}s: {summary}")
+        else:
+            print(f"🚀 浏览器启动完成: {summary}")
     
-    def login_and_extract_params(self):
-        """登录豆包并提取必要的参数"""
+    def start_network_capture(self):
+        """启动后台CDP网络监听器，失败时不影响其他功能"""
+        try:
+            self.network_capture = NetworkImageCapture.for_driver(self.driver).start()
+            print(f"✅ 后台网络监听已启动: {self.network_capture.debugger_address}")
+        except Exception as e:
+            self.network_capture = None
+            print(f"⚠️ 启动后台网络监听失败: {e}")
+    
+    def login_and_extract_params(self, allow_manual_login=True):
+        """登录豆包并提取必要的参数
+        
+        Args:
+            allow_manual_login (bool): 会话无效时是否等待人工登录；为False时直接返回False，
+                适用于无人值守的工作进程
+        """
         try:
+            # 先恢复会话快照，命中时无需任何固定等待
+            if self.restore_session():
+                print("已恢复登录会话快照")
+            
             print("正在访问豆包网站...")
-            self.driver.get('https://www.doubao.com/chat/')
+            self.driver.get(DOUBAO_CHAT_URL)
+            
+            if self.is_session_valid():
+                print("✅ 登录会话有效，跳过登录流程")
+                self.extract_dynamic_params()
+                self.save_session()
+                return True
             
-            # 等待页面加载
-            time.sleep(5)
+            if not allow_manual_login:
+                print("❌ 登录会话无效，且未允许人工登录")
+                return False
             
             # 检查是否需要登录
             try:
                 login_button = WebDriverWait(self.driver, 5).until(
-                    EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), '登录') or contains(text(), '登陆')]|//a[contains(text(), '登录') or contains(text(), '登陆')]"))
+                    EC.element_to_be_clickable((By.XPATH, LOGIN_BUTTON_XPATH))
                 )
                 print("检测到需要登录，请手动完成登录过程...")
                 print("登录完成后，程序将自动继续...")
@@ -93,10 +473,11 @@ class DoubaoImageGenerator:
                 print("可能已经登录或无需登录")
             
             # 等待页面完全加载
-            time.sleep(3)
+            self.waiter.network_idle(timeout=3, label='login_page_load')
             
             # 提取参数
             self.extract_dynamic_params()
+            self.save_session()
             
             return True
             
@@ -104,6 +485,83 @@ class DoubaoImageGenerator:
             print(f"登录过程中出现错误: {e}")
             return False
     
+    def is_session_valid(self, timeout=3):
+        """快速检查当前页面的登录状态：出现输入框且没有登录按钮即视为有效
+        
+        每次检查只有一次execute_script往返，页面就绪后立即返回。
+        """
+        try:
+            state = WebDriverWait(self.driver, timeout, poll_frequency=0.2).until(
+                lambda driver: (lambda s: s if s['login'] or s['input'] else False)(
+                    driver.execute_script(SESSION_STATE_SCRIPT, LOGIN_BUTTON_XPATH))
+            )
+        except Exception:
+            return False
+        return state['input'] and not state['login']
+    
+    def save_session(self):
+        """保存登录会话快照（cookies + doubao.com 的 localStorage）"""
+        if not self.session_file:
+            return False
+        try:
+            cookies = self.driver.execute_cdp_cmd('Network.getAllCookies', {}).get('cookies', [])
+            local_storage = {}
+            if urlparse(self.driver.current_url).hostname == DOUBAO_HOST:
+                local_storage = self.driver.execute_script(
+                    "return Object.assign({}, window.localStorage);"
+                ) or {}
+            
+            snapshot = {'saved_at': time.time(), 'cookies': cookies, 'local_storage': local_storage}
+            directory = os.path.dirname(os.path.abspath(self.session_file))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.session_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.session_file)
+            print(f"💾 登录会话已保存: {self.session_file} ({len(cookies)} 个cookie)")
+            return True
+        except Exception as e:
+            print(f"⚠️ 保存登录会话失败: {e}")
+            return False
+    
+    def restore_session(self):
+        """在首次导航前恢复登录会话快照
+        
+        cookies 通过CDP直接写入浏览器，localStorage 通过注入到新文档的脚本在
+        doubao.com 页面脚本执行前写入，因此无需先打开页面再刷新。
+        """
+        if not self.session_file or not os.path.exists(self.session_file):
+            return False
+        try:
+            with open(self.session_file, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            
+            now = time.time()
+            cookies = []
+            for cookie in snapshot.get('cookies', []):
+                param = {key: cookie[key] for key in SNAPSHOT_COOKIE_FIELDS if key in cookie}
+                # session cookie 的 expires 为 -1，恢复时不带过期时间；跳过已过期的cookie
+                expires = param.pop('expires', -1)
+                if expires > 0:
+                    if expires < now:
+                        continue
+                    param['expires'] = expires
+                cookies.append(param)
+            if cookies:
+                self.driver.execute_cdp_cmd('Network.setCookies', {'cookies': cookies})
+            
+            local_storage = snapshot.get('local_storage') or {}
+            if local_storage:
+                self.driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
+                    'source': RESTORE_LOCAL_STORAGE_SCRIPT % (json.dumps(DOUBAO_HOST), json.dumps(local_storage))
+                })
+            
+            self.cookie_jar = None
+            return bool(cookies)
+        except Exception as e:
+            print(f"⚠️ 恢复登录会话失败: {e}")
+            return False
+    
     def extract_dynamic_params(self):
         """从当前页面提取动态参数"""
         try:
@@ -118,11 +576,11 @@ class DoubaoImageGenerator:
             if 'web_id' in query_params:
                 self.web_id = query_params['web_id'][0]
             
-            # 从cookies中提取msToken
-            cookies = self.driver.get_cookies()
-            for cookie in cookies:
-                if cookie['name'] == 'msToken':
-                    self.msToken = cookie['value']
+            # 同步cookies并从中提取msToken
+            jar = self.sync_cookies()
+            for cookie in jar:
+                if cookie.name == 'msToken':
+                    self.msToken = cookie.value
                     break
             
             # 如果URL中没有参数，尝试从页面脚本中提取
@@ -172,9 +630,117 @@ class DoubaoImageGenerator:
             print(f"生成a_bogus时出现错误: {e}")
             return "Dj0nDtUEQxR5cplSYCmSHUo5q2A%252FNBuyusi2W7r57KugG7lPeA15xKpKbxTrCumiVmsiiF279jCjTdnOKb-yU81pqmkkSxvbf0IAV66L2qi4G0iQLrf0CukYeJtclQJwmQo6JA6V1UDOIVA1w3a0UdlyyKaxsO0pzNNfdcUGYIz6gMs9FNqQuPGdNXMC0U2b"
     
-    def wait_for_image_generation(self, timeout=120):
-        """等待图片生成完成"""
-        print(f"⏳ 开始等待图片生成完成，超时时间: {timeout}秒")
+    def install_image_watcher(self, baseline=False):
+        """在页面中注入图片完成监听器（重复调用是幂等的）
+        
+        Args:
+            baseline (bool|list): 是否把页面上已有的图片作为基线忽略，发送提示词前应设为True（返回基线src列表）；
+                为列表时按给定的基线重新注入
+        """
+        return self.driver.execute_script(IMAGE_WATCHER_SCRIPT, baseline, GENERATED_URL_RULES)
+    
+    def reinstall_image_watcher(self):
+        """页面刷新导致监听器丢失时重新注入
+        
+        标签页会连续用于多个提示词，重新注入时沿用当前标签页发送前记录的基线，
+        避免把之前提示词的图片当作本次的结果。
+        """
+        baseline = self.watcher_baselines.get(self.driver.current_window_handle)
+        return self.install_image_watcher(baseline if baseline is not None else False)
+    
+    def wait_for_images_with_watcher(self, timeout=120, settle=1.0, slice_seconds=30):
+        """通过页面内监听器等待生成完成
+        
+        每次 execute_async_script 最多阻塞 slice_seconds 秒，条件满足时立即返回，
+        单次等待的开销与页面上的图片数量无关。
+        
+        Returns:
+            list: 生成完成的图片URL列表；超时返回None
+        """
+        start_time = time.time()
+        deadline = start_time + timeout
+        self.install_image_watcher()
+        self.driver.set_script_timeout(slice_seconds + 10)
+        
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            
+            state = self.driver.execute_async_script(
+                WAIT_FOR_IMAGES_SCRIPT, int(min(remaining, slice_seconds) * 1000), int(settle * 1000)
+            )
+            elapsed = int(time.time() - start_time)
+            
+            if state is None:
+                # 页面已刷新，监听器丢失，重新注入
+                print(f"⚠️ [{elapsed}s] 页面监听器丢失，重新注入")
+                self.reinstall_image_watcher()
+                continue
+            
+            if state['complete']:
+                for i, image in enumerate(state['images'], 1):
+                    print(f"  ✅ 图片[{i}] 加载完成 ({image['width']}x{image['height']}): {image['src'][:60]}...")
+                return [image['src'] for image in state['images']]
+            
+            print(f"🔄 [{elapsed}s] 仍在生成中，已加载 {len(state['images'])} 张图片")
+    
+    def wait_for_image_generation(self, timeout=None, filename_prefix="generated_image", download=True):
+        """等待图片生成完成
+
+        Args:
+            timeout (int): 超时时间（秒），为None时由生成耗时调度器根据历史数据决定
+            filename_prefix (str): 下载文件名前缀，并发执行时用于区分不同提示词
+            download (bool): 是否立即下载；为False时只返回图片URL列表，由调用方分阶段处理
+        """
+        if timeout is None:
+            timeout = self.generation_scheduler.timeout()
+        print(f"⏳ 开始等待图片生成完成，超时时间: {timeout:.0f}秒（{self.generation_scheduler.describe()}）")
+        
+        start_time = time.time()
+        try:
+            valid_images = self.wait_for_images_with_watcher(timeout)
+        except Exception as e:
+            print(f"⚠️ 页面监听器不可用，回退到轮询方式: {str(e)[:100]}")
+            return self.wait_for_image_generation_polling(timeout, filename_prefix, download)
+        
+        if valid_images is None:
+            self.generation_scheduler.observe(time.time() - start_time, timed_out=True)
+            print(f"⏰ 等待超时 ({timeout:.0f}秒)，尝试获取当前页面的图片")
+            return self.get_current_images()
+        
+        self.generation_scheduler.observe(time.time() - start_time)
+        print(f"🎉 图片生成完成！总共找到 {len(valid_images)} 张有效图片")
+        if not download:
+            return valid_images
+        return self.download_generated_images(valid_images, filename_prefix)
+    
+    def download_generated_images(self, valid_images, filename_prefix):
+        """并行下载生成完成的图片，返回成功保存的文件名列表"""
+        filenames = [self.output_path(f"{filename_prefix}_{i}") for i in range(1, len(valid_images) + 1)]
+        downloaded_images = []
+        try:
+            saved_paths = self.save_images(valid_images, filenames)
+        except Exception as e:
+            print(f"❌ 下载图片时出错: {str(e)}")
+            saved_paths = [None] * len(valid_images)
+        
+        for i, filename in enumerate(saved_paths, 1):
+            if filename:
+                downloaded_images.append(filename)  # 添加实际文件名
+                print(f"✅ 图片 {i} 下载成功: {filename}")
+            else:
+                print(f"❌ 图片 {i} 下载失败")
+        
+        return downloaded_images
+    
+    def wait_for_image_generation_polling(self, timeout=None, filename_prefix="generated_image", download=True):
+        """轮询方式等待图片生成完成（页面监听器不可用时的回退方案）
+        
+        检查间隔由生成耗时调度器决定：预计完成之前稀疏检查，预计完成区间内密集检查。
+        """
+        if timeout is None:
+            timeout = self.generation_scheduler.timeout()
         start_time = time.time()
         
         while time.time() - start_time < timeout:
@@ -209,91 +775,59 @@ class DoubaoImageGenerator:
                     if elapsed % 5 == 0:  # 每5秒打印一次
                         print(f"🔍 [{elapsed}s] 没有发现生成指示器，开始查找图片...")
                     
-                    # 查找图片元素 - 更新选择器以匹配实际的生成图片
-                    image_elements = self.driver.find_elements(By.XPATH, "//img[contains(@src, 'http')]")
+                    # 一次往返扫描所有图片 - 更新选择器以匹配实际的生成图片
+                    image_elements = [img for img in self.scan_page_images() if 'http' in img['src']]
                     print(f"📊 [{elapsed}s] 页面上共找到 {len(image_elements)} 个img元素")
                     
+                    # 批量分类所有图片URL
+                    classifications = classify_many(img['src'] for img in image_elements)
+                    
                     # 检查图片是否真正加载完成
                     valid_images = []
-                    for i, img in enumerate(image_elements):
-                        try:
-                            src = img.get_attribute('src')
-                            if not src:
-                                continue
-                                
-                            # 打印每个图片的详细信息
-                            if elapsed % 10 == 0:  # 每10秒详细打印
-                                print(f"  img[{i}]: {src[:60]}...")
-                            
-                            # 更新图片识别逻辑 - 检查是否为生成的图片
-                            is_generated_image = (
-                                # 检查域名和路径
-                                ('byteimg.com' in src and 'image_skill' in src) or
-                                # 保留原有的检查逻辑作为备用
-                                ('doubao' in src or 'bytedance' in src or 'mcs' in src)
-                            )
-                            is_not_svg = not src.endswith('.svg')
-                            is_not_placeholder = 'placeholder' not in src.lower()
-                            is_not_loading = 'loading' not in src.lower()
-                            is_not_logo = not any(x in src.lower() for x in ['logo', 'icon', 'avatar'])
-                            
-                            # 检查CSS类和属性
-                            css_class = img.get_attribute('class') or ''
-                            imagex_type = img.get_attribute('imagex-type')
-                            is_react_image = 'image-' in css_class or imagex_type == 'react'
-                            
-                            if elapsed % 10 == 0:  # 每10秒详细打印
-                                print(f"    生成图片: {is_generated_image}, 非SVG: {is_not_svg}, 非占位符: {is_not_placeholder}")
-                                print(f"    非加载中: {is_not_loading}, 非Logo: {is_not_logo}, React图片: {is_react_image}")
-                            
-                            if (src and is_generated_image and is_not_svg and is_not_placeholder and 
-                                is_not_loading and is_not_logo and is_react_image):
-                                # 检查图片是否真正加载完成
-                                is_complete = self.driver.execute_script(
-                                    "return arguments[0].complete && arguments[0].naturalWidth > 0;", img
-                                )
-                                
-                                if elapsed % 10 == 0:  # 每10秒详细打印
-                                    print(f"    图片加载完成: {is_complete}")
-                                
-                                if is_complete:
-                                    valid_images.append(src)
-                                    if elapsed % 5 == 0:  # 每5秒打印找到的有效图片
-                                        print(f"  ✅ 找到有效图片[{len(valid_images)}]: {src[:60]}...")
-                        except Exception as e:
-                            if elapsed % 20 == 0:  # 每20秒打印一次错误
-                                print(f"    ⚠️ 处理图片元素时出错: {str(e)[:50]}")
-                            continue
+                    for i, (img, url_class) in enumerate(zip(image_elements, classifications)):
+                        src = img['src']
+                        
+                        # 打印每个图片的详细信息
+                        if elapsed % 10 == 0:  # 每10秒详细打印
+                            print(f"  img[{i}]: {src[:60]}...")
+                        
+                        # 检查是否为生成的图片（未命中排除规则，且带有豆包生成图片或豆包域名特征）
+                        is_generated_image = (url_class.reason != REASON_EXCLUDED and
+                                              (url_class.generated or url_class.doubao))
+                        
+                        # 检查CSS类和属性
+                        is_react_image = 'image-' in img['class'] or img['imagex_type'] == 'react'
+                        
+                        if elapsed % 10 == 0:  # 每10秒详细打印
+                            print(f"    分类: {url_class.reason}{' (' + url_class.keyword + ')' if url_class.keyword else ''}, "
+                                  f"生成图片: {is_generated_image}, React图片: {is_react_image}")
+                            print(f"    图片加载完成: {img['complete']}")
+                        
+                        if is_generated_image and is_react_image and img['complete']:
+                            valid_images.append(src)
+                            if elapsed % 5 == 0:  # 每5秒打印找到的有效图片
+                                print(f"  ✅ 找到有效图片[{len(valid_images)}]: {src[:60]}...")
                     
                     if valid_images:
+                        self.generation_scheduler.observe(time.time() - start_time)
                         print(f"🎉 图片生成完成！总共找到 {len(valid_images)} 张有效图片")
                         for i, url in enumerate(valid_images, 1):
                             print(f"  有效图片[{i}]: {url[:80]}...")
                     
-                    # 直接下载找到的有效图片
-                    downloaded_images = []
-                    for i, url in enumerate(valid_images, 1):
-                        try:
-                            print(f"正在下载图片 {i}/{len(valid_images)}: {url[:60]}...")
-                            actual_filename = f"generated_image_{i}"
-                            success = self.download_image(url, actual_filename)
-                            if success:
-                                downloaded_images.append(actual_filename)  # 添加实际文件名
-                                print(f"✅ 图片 {i} 下载成功: {actual_filename}")
-                            else:
-                                print(f"❌ 图片 {i} 下载失败")
-                        except Exception as e:
-                            print(f"❌ 下载图片 {i} 时出错: {str(e)}")
+                    if not download:
+                        return valid_images
                     
-                    return downloaded_images
+                    # 并行下载找到的有效图片
+                    return self.download_generated_images(valid_images, filename_prefix)
                 
-                time.sleep(2)
+                time.sleep(self.generation_scheduler.next_interval(time.time() - start_time))
                 
             except Exception as e:
                 print(f"❌ 等待图片生成时出错: {str(e)}")
-                time.sleep(2)
+                time.sleep(self.generation_scheduler.next_interval(time.time() - start_time))
         
-        print(f"⏰ 等待超时 ({timeout}秒)，尝试获取当前页面的图片")
+        self.generation_scheduler.observe(time.time() - start_time, timed_out=True)
+        print(f"⏰ 等待超时 ({timeout:.0f}秒)，尝试获取当前页面的图片")
         return self.get_current_images()
     
     def get_current_images(self):
@@ -309,186 +843,131 @@ class DoubaoImageGenerator:
         print("网络监控失败，使用传统方法...")
         return self.get_current_images_traditional()
 
-    def find_images_with_javascript(self):
-        """使用JavaScript查找图片"""
-        script = """
-        // 查找所有包含特定域名的图片
-        const images = Array.from(document.querySelectorAll('img'))
-            .filter(img => {
-                const src = img.src || '';
-                return src.includes('byteimg.com') && 
-                       src.includes('image_skill') &&
-                       img.offsetWidth > 100 && 
-                       img.offsetHeight > 100;
-            })
-            .map(img => ({
-                src: img.src,
-                alt: img.alt,
-                width: img.offsetWidth,
-                height: img.offsetHeight,
-                visible: img.offsetParent !== null
-            }));
-        return images;
+    def scan_page_images(self):
+        """一次execute_script批量获取页面上所有图片的数据
+        
+        每项包含 element(WebElement)、src、srcset、class、imagex_type、data-*属性、
+        picture/source子元素、natural尺寸和加载完成标志，后续筛选全部在Python中
+        对纯数据进行，不再逐元素逐属性访问浏览器。
         """
+        with self.metrics.span(STAGE_IMAGE_SCAN) as span:
+            try:
+                images = self.driver.execute_script(SCAN_IMAGES_SCRIPT) or []
+            except Exception as e:
+                print(f"批量扫描图片失败: {e}")
+                span.set('failed')
+                return []
+            span.set(images=len(images))
+            return images
+    
+    def select_images(self, images, rules):
+        """按筛选规则从扫描结果中选出图片，保持页面顺序"""
+        selected = set()
+        for description, rule in rules:
+            matched = [img['index'] for img in images if rule(img)]
+            selected.update(matched)
+            print(f"选择器 '{description}' 找到 {len(matched)} 张图片")
+        return [img for img in images if img['index'] in selected]
+    
+    def find_images_with_javascript(self, images=None):
+        """使用JavaScript查找图片（直接返回扫描数据，其中包含元素引用）"""
+        if images is None:
+            images = self.scan_page_images()
         
-        try:
-            image_data = self.driver.execute_script(script)
-            print(f"JavaScript找到 {len(image_data)} 张图片")
-            
-            # 根据JavaScript返回的数据查找实际元素
-            all_images = []
-            for data in image_data:
-                try:
-                    img_element = self.driver.find_element(By.XPATH, f"//img[@src='{data['src']}']")
-                    all_images.append(img_element)
-                except:
-                    continue
-                    
-            return all_images
-        except Exception as e:
-            print(f"JavaScript查找失败: {e}")
-            return []
+        found = [img for img in images
+                 if 'byteimg.com' in img['src'] and 'image_skill' in img['src']
+                 and img['width'] > 100 and img['height'] > 100]
+        print(f"JavaScript找到 {len(found)} 张图片")
+        return found
 
     def get_current_images_traditional(self):
         """传统的图片获取方法（通过多种策略获取所有生成的原图）"""
         try:
-            from selenium.webdriver.common.action_chains import ActionChains
-            
             # 等待页面完全加载
-            time.sleep(3)
+            self.waiter.network_idle(timeout=3, label='images_page_load')
+            
+            # 一次往返获取页面上所有图片的数据
+            page_images = self.scan_page_images()
             
             # 首先尝试JavaScript方法
-            js_images = self.find_images_with_javascript()
+            js_images = self.find_images_with_javascript(page_images)
             if js_images:
                 print(f"JavaScript方法找到 {len(js_images)} 张图片")
                 all_images = js_images
             else:
                 print("JavaScript方法失败，使用传统选择器")
-                # 针对豆包新版界面的精确选择器（更新后的选择器）
-                image_selectors = [
-                    # 主要选择器：图片网格项中的图片
-                    "//div[contains(@class, 'image-box-grid-item')]//img[contains(@class, 'image-') and contains(@src, 'http')]",
-                    # 备用选择器：通过data-testid定位
-                    "//div[@data-testid='mdbox_image']//img[contains(@src, 'http')]",
-                    # 图片包装器中的图片
-                    "//div[contains(@class, 'image-wrapper')]//img[contains(@src, 'http')]",
-                    # 更新的豆包域名图片选择器 - 关键：byteimg.com + image_skill
-                    "//img[contains(@src, 'byteimg.com') and contains(@src, 'image_skill')]",
-                    "//img[contains(@src, 'flow-imagex-sign.byteimg.com')]",
-                    "//img[contains(@src, 'ocean-cloud-tos')]",
-                    # 通过特殊属性定位 - imagex-type='react'是关键特征
-                    "//img[@imagex-type='react']",
-                    "//img[contains(@class, 'image-')]",
-                    # picture元素中的img
-                    "//picture//img[contains(@src, 'http')]"
-                ]
-                
-                all_images = []
-                
-                # 收集所有可能的图片元素
-                for selector in image_selectors:
-                    try:
-                        elements = self.driver.find_elements(By.XPATH, selector)
-                        all_images.extend(elements)
-                        print(f"选择器 '{selector}' 找到 {len(elements)} 张图片")
-                    except Exception as e:
-                        print(f"选择器 '{selector}' 执行失败: {e}")
-                        continue
+                # 针对豆包新版界面的筛选规则，在扫描数据上执行
+                all_images = self.select_images(page_images, IMAGE_SELECTOR_RULES)
             
             # 添加调试信息
             print("\n=== 调试信息：所有找到的图片 ===")
             for i, img in enumerate(all_images):
-                try:
-                    src = img.get_attribute('src')
-                    imagex_type = img.get_attribute('imagex-type')
-                    img_class = img.get_attribute('class')
-                    print(f"图片 {i+1}:")
-                    print(f"  URL: {src}")
-                    print(f"  imagex-type: {imagex_type}")
-                    print(f"  class: {img_class}")
-                    print(f"  is_likely_generated: {self.is_likely_generated_image(src)}")
-                    print("---")
-                except Exception as e:
-                    print(f"获取图片 {i+1} 信息失败: {e}")
+                print(f"图片 {i+1}:")
+                print(f"  URL: {img['src']}")
+                print(f"  imagex-type: {img['imagex_type']}")
+                print(f"  class: {img['class']}")
+                print(f"  is_likely_generated: {self.is_likely_generated_image(img['src'])}")
+                print("---")
             
             # 去重并筛选有效图片
             unique_images = []
             seen_srcs = set()
             
             for img in all_images:
-                try:
-                    src = img.get_attribute('src')
-                    if not src or src in seen_srcs:
-                        continue
-                    
-                    # 检查特殊属性 - 这些是豆包生成图片的关键标识
-                    has_imagex_type = img.get_attribute('imagex-type') == 'react'
-                    has_image_class = 'image-' in (img.get_attribute('class') or '')
-                    
-                    # 更严格的图片URL验证 - 排除logo等非生成图片
-                    is_not_logo = 'logo' not in src.lower()
-                    is_not_icon = 'icon' not in src.lower()
-                    is_not_avatar = 'avatar' not in src.lower()
-                    
-                    if (self.is_likely_generated_image(src) and 
-                        (has_imagex_type or has_image_class) and
-                        is_not_logo and is_not_icon and is_not_avatar):
-                        unique_images.append(img)
-                        seen_srcs.add(src)
-                        print(f"发现有效图片: {src[:60]}...")
-                        if has_imagex_type:
-                            print(f"  ✓ 包含imagex-type='react'属性")
-                        if has_image_class:
-                            print(f"  ✓ 包含image-类名")
-                        print(f"  ✓ 已排除logo/icon/avatar")
-                except:
+                src = img['src']
+                if not src or src in seen_srcs:
                     continue
                 
+                # 检查特殊属性 - 这些是豆包生成图片的关键标识
+                has_imagex_type = img['imagex_type'] == 'react'
+                has_image_class = 'image-' in img['class']
+                
+                # is_likely_generated_image 已排除logo/icon/avatar等非生成图片
+                if self.is_likely_generated_image(src) and (has_imagex_type or has_image_class):
+                    unique_images.append(img)
+                    seen_srcs.add(src)
+                    print(f"发现有效图片: {src[:60]}...")
+                    if has_imagex_type:
+                        print(f"  ✓ 包含imagex-type='react'属性")
+                    if has_image_class:
+                        print(f"  ✓ 包含image-类名")
+                    print(f"  ✓ 已排除logo/icon/avatar")
+                
             print(f"\n总共找到 {len(unique_images)} 张有效的生成图片")
-            print("强制测试原图获取功能...")
-            
-            if unique_images:
-                test_img = unique_images[0]
-                test_src = test_img.get_attribute('src')
-                print(f"测试图片URL: {test_src}")
-                original_url = self.get_original_image_url(test_img, test_src)
-                print(f"原图获取结果: {original_url}")
-            else:
+            
+            if not unique_images:
                 print("未找到任何图片，尝试等待更长时间...")
-                time.sleep(5)
-                # 重新尝试最基本的选择器
-                basic_images = self.driver.find_elements(By.XPATH, "//img[contains(@src, 'http')]")
+                # 重新扫描最基本的图片，出现即返回
+                basic_images = self.waiter.until(
+                    lambda: [img for img in self.scan_page_images() if 'http' in img['src']],
+                    5, 'images_retry', interval=0.5
+                ) or []
                 print(f"基础选择器找到 {len(basic_images)} 张图片")
                 for img in basic_images:
-                    try:
-                        src = img.get_attribute('src')
-                        imagex_type = img.get_attribute('imagex-type')
-                        img_class = img.get_attribute('class')
-                        print(f"  - {src[:80]}...")
-                        print(f"    imagex-type: {imagex_type}")
-                        print(f"    class: {img_class}")
-                    except:
-                        pass
+                    print(f"  - {img['src'][:80]}...")
+                    print(f"    imagex-type: {img['imagex_type']}")
+                    print(f"    class: {img['class']}")
                 return []
             
             print("\n开始处理图片，获取原图URL...")  # 添加这行调试信息
             
             valid_images = []
+            # 原图获取失败的图片：(在valid_images中的位置, 候选URL列表)，处理完后统一并行验证
+            fallback_candidates = []
                 
             # 处理每张图片
             for i, img in enumerate(unique_images, 1):
                 try:
-                    src = img.get_attribute('src')
+                    src = img['src']
                     print(f"\n=== 处理第 {i} 张图片 ===")
                     print(f"缩略图URL: {src}")
                     
                     # 滚动到图片位置
-                    self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", img)
-                    time.sleep(1)
+                    self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", img['element'])
+                    self.waiter.in_viewport(img['element'])
                     
                     # 尝试多种方法获取原图
-                    original_url = self.get_original_image_url(img, src)
-                    
+                    original_url = self.get_original_image_url(img['element'], src, img)
                     if original_url and original_url != src:
                         print(f"✅ 成功获取原图URL: {original_url}")
                         print(f"📏 URL长度对比 - 缩略图: {len(src)}, 原图: {len(original_url)}")
@@ -499,6 +978,7 @@ class DoubaoImageGenerator:
                         converted_url = self.convert_to_original_url_enhanced(src)
                         if converted_url != src:
                             print(f"🔄 尝试URL转换: {converted_url}")
+                            fallback_candidates.append((len(valid_images), [converted_url, src]))
                             valid_images.append(converted_url)
                         else:
                             valid_images.append(src)
@@ -507,6 +987,16 @@ class DoubaoImageGenerator:
                     print(f"处理第 {i} 张图片时出现错误: {e}")
                     continue
             
+            # 一次并行验证所有改写URL，不可访问时退回缩略图
+            if fallback_candidates:
+                all_candidates = [url for _, candidates in fallback_candidates for url in candidates]
+                accessible = dict(zip(all_candidates, self.verify_images_accessibility(all_candidates)))
+                for position, candidates in fallback_candidates:
+                    chosen = next((url for url in candidates if accessible.get(url)), None)
+                    if chosen and chosen != valid_images[position]:
+                        print(f"↩️ 改写URL不可访问，使用: {chosen[:80]}...")
+                        valid_images[position] = chosen
+            
             print(f"\n最终获取到 {len(valid_images)} 张原图URL")
             return valid_images
             
@@ -514,24 +1004,58 @@ class DoubaoImageGenerator:
             print(f"获取图片时出现错误: {e}")
             return []
 
-    def get_original_image_url(self, img_element, thumbnail_url):
-        """获取图片的原图URL"""
+    def get_original_image_url(self, img_element, thumbnail_url, image_info=None):
+        """获取图片的原图URL，已解析过的图片对象直接从解析缓存返回，不再悬停或点击
+        
+        Args:
+            img_element: 图片的WebElement
+            thumbnail_url (str): 缩略图URL
+            image_info (dict): scan_page_images 返回的该图片数据，提供时方法1和方法2不再访问浏览器
+        """
+        with self.metrics.span(STAGE_URL_RESOLUTION) as span:
+            cached = self.resolution_cache.get(thumbnail_url)
+            if cached:
+                print(f"[get_original_image_url] ✅ 解析缓存命中（{cached['strategy']}）: {cached['original_url']}")
+                span.set(strategy=cached['strategy'], cached=True)
+                return cached['original_url']
+            
+            original_url, strategy = self.find_original_image_url(img_element, thumbnail_url, image_info)
+            if strategy and original_url and original_url != thumbnail_url:
+                self.resolution_cache.put(thumbnail_url, original_url, strategy)
+                span.set(strategy=strategy, cached=False)
+            else:
+                span.set('failed')
+            return original_url
+    
+    def find_original_image_url(self, img_element, thumbnail_url, image_info=None):
+        """依次尝试各策略获取原图URL
+        
+        Returns:
+            tuple: (原图URL, 成功的策略)；全部失败时返回 (thumbnail_url, None)
+        """
         from selenium.webdriver.common.action_chains import ActionChains
         actions = ActionChains(self.driver)
         original_url_found = None
         
         try:
+            # 方法0: 从后台网络监听器的索引中直接查找（字典命中，不需要任何页面操作）
+            if self.network_capture:
+                captured_url = self.network_capture.lookup(thumbnail_url)
+                if captured_url:
+                    print(f"[get_original_image_url] ✅ 从网络请求索引获取到原图URL: {captured_url}")
+                    return captured_url, STRATEGY_NETWORK
+            
             # 方法1: 从picture元素的source标签获取原图
             print("[get_original_image_url] 尝试方法1: 从picture元素获取原图")
-            picture_url = self.get_original_url_from_picture_element(img_element)
+            picture_url = self.get_original_url_from_picture_element(img_element, image_info)
             if picture_url and picture_url != thumbnail_url:
                 print(f"[get_original_image_url] ✅ 从picture元素获取到原图URL: {picture_url}")
-                return picture_url
+                return picture_url, STRATEGY_PICTURE
             
             # 方法2: 尝试从图片元素属性获取并转换
             print("[get_original_image_url] 尝试方法2: 从元素属性获取并转换")
             try:
-                real_url = self.get_image_real_url(img_element)
+                real_url = self.get_image_real_url(img_element, image_info)
                 if real_url and real_url != thumbnail_url:
                     print(f"[get_original_image_url] ✅ 通过元素属性获取到原图URL: {real_url}")
                     original_url_found = real_url
@@ -539,23 +1063,21 @@ class DoubaoImageGenerator:
                 print(f"[get_original_image_url] 从元素属性获取URL时出错: {e}")
             
             if original_url_found:
-                return original_url_found
+                return original_url_found, STRATEGY_ATTRIBUTE
             
             # 方法3: 查找下载按钮
             print("[get_original_image_url] 尝试方法3: 查找下载按钮")
             
             # 先滚动到图片位置
             self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", img_element)
-            time.sleep(1)
+            self.waiter.in_viewport(img_element)
             
-            # 鼠标悬停到图片上
-            actions.move_to_element(img_element).perform()
-            time.sleep(3)
+            # 鼠标悬停到图片上，等待悬停操作栏中的下载控件出现
+            self.waiter.hover_controls(img_element, lambda: actions.move_to_element(img_element).perform())
             
             # 下载按钮选择器
             download_selectors = [
-                "//div[contains(@class, 'image-') or contains(@class, 'img-')]//button[contains(@class, 'download') or contains(@title, 'download') or contains(@aria-label, 'download')]",
-                "//div[contains(@class, 'image-') or contains(@class, 'img-')]//a[contains(@class, 'download') or contains(@title, 'download')]",
+                f"//div[contains(@class, 'image-') or contains(@class, 'img-')]//*[self::button or self::a][{DOWNLOAD_CONTROL_PREDICATE}]",
                 ".//ancestor::div[contains(@class, 'image') or contains(@class, 'img') or contains(@class, 'picture')]//button",
                 ".//ancestor::div[1]//button[contains(@class, 'download') or contains(@title, '下载') or contains(@aria-label, 'download') or contains(text(), '下载') or contains(@class, 'btn')]",
                 ".//ancestor::div[2]//button[contains(@class, 'download') or contains(@title, '下载') or contains(@aria-label, 'download') or contains(text(), '下载') or contains(@class, 'btn')]",
@@ -584,10 +1106,15 @@ class DoubaoImageGenerator:
                                 except:
                                     self.driver.execute_script("arguments[0].click();", button)
                                 
-                                time.sleep(4)
-                                
-                                # 检查是否有新窗口或下载链接
-                                download_url = self.get_download_url_from_browser()
+                                # 原图请求出现在网络索引中即返回，否则检查新窗口或下载链接
+                                download_url = None
+                                if self.network_capture:
+                                    download_url = self.network_capture.wait_for_original(thumbnail_url, timeout=4)
+                                else:
+                                    # 点击触发的请求（新窗口或下载）结束即继续
+                                    self.waiter.network_idle(timeout=4, label='download_click')
+                                if not download_url:
+                                    download_url = self.get_download_url_from_browser()
                                 if download_url and download_url != thumbnail_url:
                                     print(f"[get_original_image_url] ✅ 通过下载按钮获取到原图URL: {download_url}")
                                     original_url_found = download_url
@@ -601,26 +1128,27 @@ class DoubaoImageGenerator:
                     continue
             
             if original_url_found:
-                return original_url_found
+                return original_url_found, STRATEGY_DOWNLOAD_BUTTON
             
             # 方法4: 右键菜单获取原图
             print("[get_original_image_url] 尝试方法4: 右键菜单获取原图")
             try:
                 actions.context_click(img_element).perform()
-                time.sleep(1)
                 
                 # 查找"在新标签页中打开图片"选项
                 context_options = [
                     "//div[contains(text(), '在新标签页中打开图片') or contains(text(), 'Open image in new tab')]",
                     "//span[contains(text(), '在新标签页中打开图片') or contains(text(), 'Open image in new tab')]"
                 ]
+                self.waiter.xpath_visible(' | '.join(context_options), timeout=1, label='context_menu')
                 
                 for option_xpath in context_options:
                     try:
                         option = self.driver.find_element(By.XPATH, option_xpath)
                         if option.is_displayed():
+                            known_handles = self.driver.window_handles
                             option.click()
-                            time.sleep(2)
+                            self.waiter.new_window(known_handles, timeout=2, label='context_menu_tab')
                             
                             # 切换到新标签页获取URL
                             if len(self.driver.window_handles) > 1:
@@ -646,18 +1174,24 @@ class DoubaoImageGenerator:
                 actions.send_keys(Keys.ESCAPE).perform()
                 
                 if original_url_found:
-                    return original_url_found
+                    return original_url_found, STRATEGY_CONTEXT_MENU
             except Exception as e:
                 print(f"[get_original_image_url] 右键菜单方法出错: {e}")
             
         except Exception as e:
             print(f"[get_original_image_url] 获取原图URL时出现错误: {e}")
         
-        return thumbnail_url
+        return thumbnail_url, None
 
-    def get_original_url_from_picture_element(self, img_element):
+    def get_original_url_from_picture_element(self, img_element, image_info=None):
         """从picture元素中获取原图URL"""
         try:
+            # 已有扫描数据时直接使用其中的source列表
+            if image_info is not None:
+                if image_info['sources']:
+                    print(f"[get_original_url_from_picture_element] 找到picture元素")
+                return self.pick_picture_source_url(image_info['sources'])
+            
             # 查找父级的picture元素
             picture_element = None
             current = img_element
@@ -679,244 +1213,128 @@ class DoubaoImageGenerator:
                 except:
                     return None
             
-            if picture_element:
-                print(f"[get_original_url_from_picture_element] 找到picture元素")
-                
-                # 优先获取AVIF格式的source元素
-                source_selectors = [
-                    ".//source[@type='image/avif']",
-                    ".//source[contains(@srcset, 'avif')]",
-                    ".//source[@type='image/webp']", 
-                    ".//source[contains(@srcset, 'webp')]"
-                ]
-                
-                for selector in source_selectors:
-                    try:
-                        sources = picture_element.find_elements(By.XPATH, selector)
-                        for source in sources:
-                            # 获取srcset或src属性
-                            srcset = source.get_attribute('srcset') or source.get_attribute('src')
-                            if srcset:
-                                # 从srcset中提取第一个URL（通常是1x的版本）
-                                url = srcset.split(' ')[0].split(',')[0].strip()
-                                if url and 'byteimg.com' in url:
-                                    print(f"[get_original_url_from_picture_element] 从{source.get_attribute('type')}获取到URL: {url}")
-                                    
-                                    # 转换为原图URL（去除水印标识）
-                                    original_url = self.convert_to_original_url_enhanced(url)
-                                    if original_url != url:
-                                        print(f"[get_original_url_from_picture_element] 转换后的原图URL: {original_url}")
-                                        return original_url
-                                    else:
-                                        return url
-                    except Exception as e:
-                        print(f"[get_original_url_from_picture_element] 处理source元素时出错: {e}")
-                        continue
-            
-            return None
+            print(f"[get_original_url_from_picture_element] 找到picture元素")
+            sources = [
+                {
+                    'type': source.get_attribute('type') or '',
+                    'srcset': source.get_attribute('srcset') or source.get_attribute('src') or ''
+                }
+                for source in picture_element.find_elements(By.XPATH, ".//source")
+            ]
+            return self.pick_picture_source_url(sources)
             
         except Exception as e:
             print(f"[get_original_url_from_picture_element] 获取picture元素URL时出错: {e}")
             return None
+    
+    def pick_picture_source_url(self, sources):
+        """从picture的source列表中按 AVIF > WEBP 的优先级选出原图URL"""
+        # 优先获取AVIF格式的source元素
+        source_rules = [
+            lambda source: source['type'] == 'image/avif',
+            lambda source: 'avif' in source['srcset'],
+            lambda source: source['type'] == 'image/webp',
+            lambda source: 'webp' in source['srcset'],
+        ]
+        
+        for rule in source_rules:
+            for source in sources:
+                if not rule(source) or not source['srcset']:
+                    continue
+                # 从srcset中提取第一个URL（通常是1x的版本）
+                url = source['srcset'].split(' ')[0].split(',')[0].strip()
+                if url and 'byteimg.com' in url:
+                    print(f"[get_original_url_from_picture_element] 从{source['type']}获取到URL: {url}")
+                    
+                    # 转换为原图URL（去除水印标识）
+                    original_url = self.convert_to_original_url_enhanced(url)
+                    if original_url != url:
+                        print(f"[get_original_url_from_picture_element] 转换后的原图URL: {original_url}")
+                        return original_url
+                    else:
+                        return url
+        
+        return None
+
+    def transcodes_locally(self):
+        """是否会在本地转码（配置了转码器且已安装Pillow）"""
+        return bool(self.transcoder and self.transcoder.available)
 
     def convert_to_original_url_enhanced(self, thumbnail_url):
-        """增强的URL转换方法"""
+        """增强的URL转换方法（预编译的单遍改写器，按图片对象缓存结果）
+        
+        确实会在本地转码时保留CDN原有格式，不再把 .avif/.webp 改写为 .jpeg 依赖CDN转码；
+        未安装Pillow时转码阶段只是原样放行，仍需改写为 .jpeg。
+        """
         try:
-            import re
-            original_url = thumbnail_url
-            
-            print(f"原始缩略图URL: {thumbnail_url}")
-            
-            # 豆包特定的转换规则 - 更全面的缩略图转原图处理
-            doubao_conversions = [
-                # 移除所有类型的缩略图和水印标识
-                (r'~tplv-[^?]+', ''),  # 移除整个tplv参数
-                
-                # 专门处理各种水印和缩略图标识
-                (r'-web-thumb-watermark-v2', ''),  # v2版本水印
-                (r'-web-thumb-watermark', ''),     # 标准水印
-                (r'-web-thumb-wm', ''),            # 简化水印标识
-                (r'-watermark-v2', ''),            # v2水印
-                (r'-watermark', ''),               # 水印
-                (r'-thumb', ''),                   # 缩略图
-                (r'-wm', ''),                      # 简化水印
-                
-                # 移除格式转换后缀
-                (r'-avif\.avif$', ''),            # 移除avif格式
-                (r'-webp\.webp$', ''),            # 移除webp格式
-                (r'\.avif$', '.jpeg'),            # avif转jpeg
-                (r'\.webp$', '.jpeg'),            # webp转jpeg
-                
-                # 移除URL参数中的处理参数
-                (r'\?[^?]*tplv[^&]*', ''),         # 移除URL参数中的tplv
-                (r'&[^&]*tplv[^&]*', ''),
-                
-                # 移除尺寸和质量限制参数
-                (r'[?&]w=\d+', ''),
-                (r'[?&]h=\d+', ''),
-                (r'[?&]s=\d+', ''),
-                (r'[?&]size=\d+', ''),
-                (r'[?&]quality=\d+', ''),
-                (r'[?&]format=\w+', ''),
-                (r'[?&]f=\w+', ''),
-                
-                # 移除签名参数（这些参数可能导致原图访问失败）
-                (r'[?&]rk3s=[^&]*', ''),
-                (r'[?&]x-expires=[^&]*', ''),
-                (r'[?&]x-signature=[^&]*', ''),
-            ]
-            
-            # 应用转换规则
-            for pattern, replacement in doubao_conversions:
-                old_url = original_url
-                original_url = re.sub(pattern, replacement, original_url)
-                if old_url != original_url:
-                    print(f"✓ 应用规则 '{pattern}': 移除了缩略图标识")
-            
-            # 清理多余的参数分隔符
-            original_url = re.sub(r'[?&]+$', '', original_url)
-            original_url = re.sub(r'[?]&', '?', original_url)
-            original_url = re.sub(r'&&+', '&', original_url)
-            
-            print(f"转换后原图URL: {original_url}")
-            
-            # 如果转换后的URL与原URL相同，尝试更激进的方法
-            if original_url == thumbnail_url:
-                print("常规转换无效，尝试提取基础URL...")
-                # 提取基础URL（去掉所有处理参数）
-                base_match = re.match(r'(https://[^~?]+)', thumbnail_url)
-                if base_match:
-                    base_url = base_match.group(1)
-                    # 确保是jpeg格式
-                    if not base_url.endswith(('.jpg', '.jpeg', '.png')):
-                        base_url += '.jpeg'
-                    print(f"使用基础URL: {base_url}")
-                    return base_url
-                else:
-                    print("无法提取基础URL，尝试手动构建...")
-                    # 手动构建原图URL
-                    # 从缩略图URL中提取图片ID
-                    id_match = re.search(r'image_skill/([^~]+)', thumbnail_url)
-                    if id_match:
-                        image_id = id_match.group(1)
-                        # 构建原图URL（不带任何处理参数）
-                        domain_match = re.match(r'(https://[^/]+)', thumbnail_url)
-                        if domain_match:
-                            domain = domain_match.group(1)
-                            constructed_url = f"{domain}/ocean-cloud-tos/image_skill/{image_id}.jpeg"
-                            print(f"构建的原图URL: {constructed_url}")
-                            return constructed_url
-            
-            return original_url
-            
+            return convert_to_original_url(thumbnail_url, keep_format=self.transcodes_locally())
         except Exception as e:
             print(f"URL转换失败: {e}")
             return thumbnail_url
 
     def is_likely_generated_image(self, url):
         """判断URL是否为生成的图片"""
-        if not url or not isinstance(url, str):
-            return False
-        
-        # 排除明显的非图片URL
-        exclude_patterns = [
-            'data:image/svg+xml',  # SVG占位符
-            'avatar',              # 头像
-            'icon',                # 图标
-            'logo',                # 标志
-            'placeholder',         # 占位符
-            'loading',             # 加载图片
-            'default',             # 默认图片
-            'thumb_',              # 某些缩略图前缀
-            'profile',             # 个人资料图片
-        ]
+        return is_likely_generated_image(url)
+
+    def enable_network_logging(self):
+        """启用网络请求记录（不重启浏览器，保留登录状态）
         
-        url_lower = url.lower()
-        for pattern in exclude_patterns:
-            if pattern in url_lower:
-                return False
+        performance日志只能在启动时通过 network_logging=True 开启；
+        未开启时改用后台CDP网络监听，它可以在运行中的浏览器上随时启动。
+        """
+        if self.network_logging:
+            print("✅ 网络日志记录已在启动时启用")
+            return True
         
-        # 豆包生成图片的特征（更新后的识别条件）
-        doubao_patterns = [
-            # 新的域名识别 - 关键特征：byteimg.com + image_skill
-            ('byteimg.com', 'image_skill'),  # 需要同时包含这两个
-            ('doubao', 'generated'),
-            ('bytedance', 'ai'),
-            # 原有的模式
-            'flow-imagex-sign.byteimg.com',
-            'ocean-cloud-tos',
-            'tplv-',
-            'web-thumb-watermark',
-            'web-watermark'
-        ]
+        if not (self.network_capture and self.network_capture.running):
+            self.start_network_capture()
         
-        # 检查是否包含豆包图片特征
-        for pattern in doubao_patterns:
-            if isinstance(pattern, tuple):
-                # 需要同时包含两个条件
-                if all(p in url for p in pattern):
-                    return True
-            else:
-                # 单个条件
-                if pattern in url:
-                    return True
+        if self.network_capture and self.network_capture.running:
+            print("✅ 网络请求记录已启用（后台CDP监听）")
+            return True
         
-        # 通用图片URL检查
-        image_extensions = ['.jpg', '.jpeg', '.png', '.webp', '.avif']
-        return any(ext in url_lower for ext in image_extensions)
+        print("❌ 启用网络日志失败: 请在创建生成器时传入 network_logging=True")
+        return False
 
-    def enable_network_logging(self):
-        """启用网络请求日志记录"""
-        try:
-            # 如果浏览器已经启动，需要重新启动
-            if hasattr(self, 'driver') and self.driver:
-                self.driver.quit()
-            
-            # 重新创建带有日志功能的浏览器
-            options = webdriver.ChromeOptions()
-            options.add_argument('--no-sandbox')
-            options.add_argument('--disable-dev-shm-usage')
-            options.add_argument('--disable-gpu')
-            options.add_argument('--enable-logging')
-            options.add_argument('--log-level=0')
-            
-            # 使用新的Selenium 4.x语法启用性能日志
-            options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
-            
-            self.driver = webdriver.Chrome(options=options)
-            print("✅ 网络日志记录已启用")
-            
-        except Exception as e:
-            print(f"❌ 启用网络日志失败: {e}")
+    def get_network_responses(self):
+        """读取浏览器的网络响应记录，按时间顺序返回 Network.responseReceived 中的response字典
+        
+        优先读取启动时开启的performance日志，否则使用后台CDP监听捕获的图片请求。
+        """
+        if self.network_logging:
+            responses = []
+            for log in self.driver.get_log('performance'):
+                message = json.loads(log['message']).get('message', {})
+                if message.get('method') == 'Network.responseReceived':
+                    responses.append(message['params']['response'])
+            return responses
+        
+        if self.network_capture and self.network_capture.running:
+            return self.network_capture.recent_responses()
+        
+        return []
 
     def get_network_requests(self, filter_pattern=None):
         """获取网络请求记录"""
         try:
-            logs = self.driver.get_log('performance')
             requests = []
             
-            for log in logs:
-                message = json.loads(log['message'])
-                if message['message']['method'] == 'Network.responseReceived':
-                    response = message['message']['params']['response']
-                    url = response['url']
-                    
-                    # 过滤图片请求
-                    if filter_pattern:
-                        if filter_pattern in url.lower():
-                            requests.append({
-                                'url': url,
-                                'mimeType': response.get('mimeType', ''),
-                                'status': response.get('status', 0),
-                                'headers': response.get('headers', {})
-                            })
-                    elif any(img_type in response.get('mimeType', '').lower() for img_type in ['image/', 'png', 'jpg', 'jpeg', 'webp']):
-                        requests.append({
-                            'url': url,
-                            'mimeType': response.get('mimeType', ''),
-                            'status': response.get('status', 0),
-                            'headers': response.get('headers', {})
-                        })
+            for response in self.get_network_responses():
+                url = response['url']
+                
+                # 过滤图片请求
+                if filter_pattern:
+                    matched = filter_pattern in url.lower()
+                else:
+                    matched = any(img_type in response.get('mimeType', '').lower() for img_type in ['image/', 'png', 'jpg', 'jpeg', 'webp'])
+                
+                if matched:
+                    requests.append({
+                        'url': url,
+                        'mimeType': response.get('mimeType', ''),
+                        'status': response.get('status', 0),
+                        'headers': response.get('headers', {})
+                    })
             
             return requests
             
@@ -930,41 +1348,26 @@ class DoubaoImageGenerator:
             from selenium.webdriver.common.action_chains import ActionChains
             
             # 等待页面完全加载
-            time.sleep(3)
+            self.waiter.network_idle(timeout=3, label='images_page_load')
             
             # 优先使用JavaScript方法查找图片
             print("=== 使用JavaScript方法查找图片 ===")
-            unique_images = self.find_images_with_javascript()
+            page_images = self.scan_page_images()
+            unique_images = self.find_images_with_javascript(page_images)
             
             if not unique_images:
                 print("JavaScript方法未找到图片，回退到传统选择器方法")
-                # 回退到传统选择器方法
-                image_selectors = [
-                    "//div[contains(@class, 'image-box-grid-item')]//img[contains(@class, 'image-') and contains(@src, 'http')]",
-                    "//div[@data-testid='mdbox_image']//img[contains(@src, 'http')]",
-                    "//div[contains(@class, 'image-wrapper')]//img[contains(@src, 'http')]"
-                ]
-                
-                all_images = []
-                for selector in image_selectors:
-                    try:
-                        elements = self.driver.find_elements(By.XPATH, selector)
-                        all_images.extend(elements)
-                        print(f"选择器找到 {len(elements)} 张图片")
-                    except Exception as e:
-                        continue
+                # 回退到图片容器筛选规则
+                all_images = self.select_images(page_images, IMAGE_SELECTOR_RULES[:3])
                 
                 # 去重
                 unique_images = []
                 seen_srcs = set()
                 for img in all_images:
-                    try:
-                        src = img.get_attribute('src')
-                        if src and src not in seen_srcs and self.is_likely_generated_image(src):
-                            unique_images.append(img)
-                            seen_srcs.add(src)
-                    except:
-                        continue
+                    src = img['src']
+                    if src and src not in seen_srcs and self.is_likely_generated_image(src):
+                        unique_images.append(img)
+                        seen_srcs.add(src)
             
             print(f"找到 {len(unique_images)} 张有效图片")
             
@@ -976,15 +1379,15 @@ class DoubaoImageGenerator:
                     print(f"\n=== 处理第 {i+1} 张图片 ===")
                     
                     # 获取缩略图URL
-                    thumbnail_url = img.get_attribute('src')
+                    thumbnail_url = img['src']
                     print(f"缩略图URL: {thumbnail_url[:80]}...")
                     
                     # 滚动到图片位置
-                    self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", img)
-                    time.sleep(1)
+                    self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", img['element'])
+                    self.waiter.in_viewport(img['element'])
                     
                     # 尝试获取原图URL
-                    original_url = self.get_original_image_url(img, thumbnail_url)
+                    original_url = self.get_original_image_url(img['element'], thumbnail_url, img)
                     
                     if original_url and original_url != thumbnail_url:
                         print(f"✅ 获取到原图URL: {original_url[:80]}...")
@@ -996,11 +1399,7 @@ class DoubaoImageGenerator:
                 except Exception as e:
                     print(f"处理第 {i+1} 张图片时出错: {e}")
                     # 如果出错，至少保存缩略图
-                    try:
-                        thumbnail_url = img.get_attribute('src')
-                        valid_image_urls.append(thumbnail_url)
-                    except:
-                        continue
+                    valid_image_urls.append(img['src'])
             
             print(f"\n最终获取到 {len(valid_image_urls)} 张图片URL")
             return valid_image_urls
@@ -1034,14 +1433,10 @@ class DoubaoImageGenerator:
             
             # 检查浏览器的下载历史或网络请求
             # 这里可以通过浏览器的开发者工具API获取最新的网络请求
-            logs = self.driver.get_log('performance')
-            for log in logs[-10:]:  # 检查最近的10个网络请求
-                message = json.loads(log['message'])
-                if (message.get('message', {}).get('method') == 'Network.responseReceived'):
-                    response = message['message']['params']['response']
-                    url = response.get('url', '')
-                    if self.is_valid_image_url(url) and 'download' in url.lower():
-                        return url
+            for response in self.get_network_responses()[-10:]:  # 检查最近的10个网络请求
+                url = response.get('url', '')
+                if self.is_valid_image_url(url) and 'download' in url.lower():
+                    return url
             
             return None
             
@@ -1049,16 +1444,24 @@ class DoubaoImageGenerator:
             print(f"获取下载URL时出现错误: {e}")
             return None
     
-    def get_image_real_url(self, img_element):
+    def get_image_real_url(self, img_element, image_info=None):
         """获取图片元素的真实URL"""
         try:
-            # 尝试多种方法获取真实URL
-            methods = [
-                lambda: img_element.get_attribute('data-original'),
-                lambda: img_element.get_attribute('data-src'),
-                lambda: img_element.get_attribute('data-full-url'),
-                lambda: img_element.get_attribute('src'),
-            ]
+            # 尝试多种方法获取真实URL，有扫描数据时直接读取
+            if image_info is not None:
+                methods = [
+                    lambda: image_info['data_original'],
+                    lambda: image_info['data_src'],
+                    lambda: image_info['data_full_url'],
+                    lambda: image_info['src'],
+                ]
+            else:
+                methods = [
+                    lambda: img_element.get_attribute('data-original'),
+                    lambda: img_element.get_attribute('data-src'),
+                    lambda: img_element.get_attribute('data-full-url'),
+                    lambda: img_element.get_attribute('src'),
+                ]
             
             for method in methods:
                 try:
@@ -1089,12 +1492,18 @@ class DoubaoImageGenerator:
             original_window = self.driver.current_window_handle
             
             # 在新标签页中打开图片
+            known_handles = self.driver.window_handles
             self.driver.execute_script(f"window.open('{image_url}', '_blank');")
-            time.sleep(2)
+            new_window = self.waiter.new_window(known_handles, timeout=2, label='open_image_tab')
+            if not new_window:
+                raise Exception("新标签页未打开")
             
-            # 切换到新标签页
-            new_window = [handle for handle in self.driver.window_handles if handle != original_window][0]
+            # 切换到新标签页，等待图片加载完成
             self.driver.switch_to.window(new_window)
+            self.waiter.until(
+                lambda: self.driver.execute_script("return document.readyState") == 'complete',
+                2, 'open_image_tab_load'
+            )
             
             # 获取新标签页的URL（可能是重定向后的真实图片URL）
             real_url = self.driver.current_url
@@ -1112,46 +1521,30 @@ class DoubaoImageGenerator:
     
     def is_valid_image_url(self, url):
         """检查URL是否为有效的图片URL"""
-        if not url or not url.startswith('http'):
-            return False
-        
-        # 排除明显的非图片URL
-        invalid_patterns = [
-            '.svg', 'placeholder', 'loading', 'icon', 'avatar',
-            'logo', 'banner', 'background'
-        ]
-        
-        url_lower = url.lower()
-        for pattern in invalid_patterns:
-            if pattern in url_lower:
-                return False
-        
-        # 检查是否包含图片相关的域名或路径
-        valid_patterns = [
-            'doubao', 'bytedance', 'mcs', 'image', 'img', 'photo',
-            'picture', 'generated', '.jpg', '.jpeg', '.png', '.webp'
-        ]
-        
-        for pattern in valid_patterns:
-            if pattern in url_lower:
-                return True
+        return is_valid_image_url(url)
+    
+    def is_valid_image_content(self, content):
+        """通过文件头验证图片格式"""
+        format_name = detect_image_format(content)
+        if format_name:
+            print(f"✅ 检测到有效的{format_name}格式图片")
+            return True
         
+        print(f"❌ 未识别的图片格式，文件头: {content[:16].hex()}")
         return False
     
-
-    
     def check_for_new_images(self):
         """检查页面上是否出现了新的图片"""
         try:
-            # 等待一下让新内容加载
-            time.sleep(2)
+            # 等待新内容加载完成
+            self.waiter.network_idle(timeout=2, label='new_images_load')
             
             # 查找最近添加的图片元素
             new_images = []
-            recent_images = self.driver.find_elements(By.XPATH, "//img[contains(@src, 'http')]")
+            recent_images = [img for img in self.scan_page_images() if 'http' in img['src']]
             
             for img in recent_images[-5:]:  # 只检查最后5个图片元素
-                src = img.get_attribute('src')
+                src = img['src']
                 if src and self.is_valid_image_url(src):
                     new_images.append(src)
             
@@ -1162,51 +1555,34 @@ class DoubaoImageGenerator:
     
     def verify_image_accessibility(self, url):
         """验证图片URL是否可访问且为有效图片"""
+        return self.verify_images_accessibility([url])[0]
+    
+    def verify_images_accessibility(self, urls, budget=8):
+        """并行验证多个图片URL（使用同步好的cookie jar，不访问浏览器），返回与urls顺序一致的结果"""
         try:
-            # 使用HEAD请求检查图片是否存在
-            cookies = self.driver.get_cookies()
-            cookie_dict = {cookie['name']: cookie['value'] for cookie in cookies}
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Referer': 'https://www.doubao.com/'
-            }
-            
-            response = requests.head(url, headers=headers, cookies=cookie_dict, timeout=10)
-            
-            if response.status_code == 200:
-                content_type = response.headers.get('content-type', '')
-                content_length = response.headers.get('content-length')
-                
-                # 检查是否为图片类型且大小合理
-                if ('image' in content_type and 
-                    content_length and 
-                    int(content_length) > 10240):  # 大于10KB
-                    print(f"验证通过: {url[:50]}... (大小: {int(content_length)/1024:.1f}KB)")
-                    return True
-            
-            return False
-            
+            return self.url_verifier.verify_many(urls, self.get_cookie_jar(), budget)
         except Exception as e:
             print(f"验证图片URL时出现错误: {e}")
-            return False
+            return [False] * len(urls)
     
-    def send_image_request_via_browser(self, prompt):
-        """通过浏览器发送图片生成请求"""
-        try:
-            print(f"🚀 开始生成图片: {prompt}")
-            print(f"📍 当前页面URL: {self.driver.current_url}")
-            
-            # 查找输入框
-            input_selectors = [
-                "//textarea[@placeholder*='输入' or @placeholder*='消息' or @placeholder*='问题']",
-                "//input[@placeholder*='输入' or @placeholder*='消息' or @placeholder*='问题']",
-                "//div[@contenteditable='true']",
-                "textarea",
-                "input[type='text']"
-            ]
-            
-            print(f"🔍 开始查找输入框，共有 {len(input_selectors)} 个选择器")
+    def submit_prompt(self, prompt):
+        """在当前标签页查找输入框并发送提示词，失败时抛出异常
+        
+        发送前注入图片监听器并把页面上已有的图片作为基线，发送后同步cookies。
+        """
+        print(f"📍 当前页面URL: {self.driver.current_url}")
+        
+        # 查找输入框
+        input_selectors = [
+            "//textarea[@placeholder*='输入' or @placeholder*='消息' or @placeholder*='问题']",
+            "//input[@placeholder*='输入' or @placeholder*='消息' or @placeholder*='问题']",
+            "//div[@contenteditable='true']",
+            "textarea",
+            "input[type='text']"
+        ]
+        
+        print(f"🔍 开始查找输入框，共有 {len(input_selectors)} 个选择器")
+        with self.metrics.span(STAGE_INPUT_LOOKUP) as lookup_span:
             input_element = None
             for i, selector in enumerate(input_selectors):
                 try:
@@ -1225,36 +1601,49 @@ class DoubaoImageGenerator:
                     print(f"  ❌ 选择器失败: {str(e)[:100]}")
                     continue
             
-            if not input_element:
-                print("❌ 所有输入框选择器都失败了")
-                # 尝试打印页面上所有可能的输入元素
-                all_inputs = self.driver.find_elements(By.TAG_NAME, "input")
-                all_textareas = self.driver.find_elements(By.TAG_NAME, "textarea")
-                all_contenteditable = self.driver.find_elements(By.XPATH, "//div[@contenteditable='true']")
-                
-                print(f"📊 页面统计: input元素{len(all_inputs)}个, textarea元素{len(all_textareas)}个, contenteditable元素{len(all_contenteditable)}个")
-                
-                for i, inp in enumerate(all_inputs[:3]):  # 只显示前3个
-                    try:
-                        placeholder = inp.get_attribute('placeholder') or '无'
-                        input_type = inp.get_attribute('type') or '无'
-                        print(f"  input[{i}]: type={input_type}, placeholder={placeholder}")
-                    except:
-                        pass
-                        
-                for i, ta in enumerate(all_textareas[:3]):  # 只显示前3个
-                    try:
-                        placeholder = ta.get_attribute('placeholder') or '无'
-                        print(f"  textarea[{i}]: placeholder={placeholder}")
-                    except:
-                        pass
-                
-                raise Exception("找不到输入框")
+            lookup_span.set('ok' if input_element else 'failed', selector=i + 1)
+        
+        if not input_element:
+            print("❌ 所有输入框选择器都失败了")
+            # 尝试打印页面上所有可能的输入元素
+            all_inputs = self.driver.find_elements(By.TAG_NAME, "input")
+            all_textareas = self.driver.find_elements(By.TAG_NAME, "textarea")
+            all_contenteditable = self.driver.find_elements(By.XPATH, "//div[@contenteditable='true']")
             
-            # 清空输入框并输入提示词
+            print(f"📊 页面统计: input元素{len(all_inputs)}个, textarea元素{len(all_textareas)}个, contenteditable元素{len(all_contenteditable)}个")
+            
+            for i, inp in enumerate(all_inputs[:3]):  # 只显示前3个
+                try:
+                    placeholder = inp.get_attribute('placeholder') or '无'
+                    input_type = inp.get_attribute('type') or '无'
+                    print(f"  input[{i}]: type={input_type}, placeholder={placeholder}")
+                except:
+                    pass
+                    
+            for i, ta in enumerate(all_textareas[:3]):  # 只显示前3个
+                try:
+                    placeholder = ta.get_attribute('placeholder') or '无'
+                    print(f"  textarea[{i}]: placeholder={placeholder}")
+                except:
+                    pass
+            
+            raise Exception("找不到输入框")
+        
+        # 发送前注入监听器，把页面上已有的图片作为基线并按标签页记录，监听器丢失时沿用
+        try:
+            self.watcher_baselines[self.driver.current_window_handle] = self.install_image_watcher(baseline=True)
+        except Exception as e:
+            print(f"⚠️ 注入图片监听器失败: {str(e)[:100]}")
+        
+        # 清空输入框并输入提示词；清空或输入时抛出的异常由span记录为 error
+        send_error = None
+        with self.metrics.span(STAGE_SUBMIT) as submit_span:
             print(f"📝 清空输入框并输入提示词: {prompt[:50]}...")
             input_element.clear()
-            time.sleep(0.5)  # 等待清空完成
+            self.waiter.until(
+                lambda: not (input_element.get_attribute('value') or input_element.text),
+                0.5, 'input_clear', interval=0.05
+            )
             input_element.send_keys(prompt)
             print(f"✅ 提示词输入完成")
             
@@ -1281,12 +1670,31 @@ class DoubaoImageGenerator:
                             print(f"  button[{i}]: {btn_text[:30]}")
                         except:
                             pass
-                    raise Exception(f"无法发送消息: {e2}")
-            
+                    submit_span.set('failed')
+                    send_error = e2
+        if send_error is not None:
+            raise Exception(f"无法发送消息: {send_error}")
+        
+        # 每次生成同步一次cookies，之后的下载和验证都不再访问浏览器
+        self.sync_cookies()
+    
+    def send_image_request_via_browser(self, prompt, filename_prefix="generated_image", download=True):
+        """通过浏览器发送图片生成请求
+        
+        Args:
+            prompt (str): 提示词
+            filename_prefix (str): 下载文件名前缀
+            download (bool): 是否在生成完成后立即下载；为False时返回图片URL列表
+        """
+        try:
+            print(f"🚀 开始生成图片: {prompt}")
+            self.submit_prompt(prompt)
             print(f"⏳ 消息已发送，开始等待图片生成...")
             
             # 等待图片真正生成完成
-            result = self.wait_for_image_generation()
+            with self.metrics.span(STAGE_GENERATION_WAIT) as span:
+                result = self.wait_for_image_generation(filename_prefix=filename_prefix, download=download)
+                span.set('ok' if result else 'failed', images=len(result or []))
             
             # 检查返回结果的类型
             if isinstance(result, list) and result:
@@ -1311,377 +1719,664 @@ class DoubaoImageGenerator:
             print(f"📋 详细错误信息:\n{traceback.format_exc()}")
             return []
     
+    def sync_cookies(self):
+        """将浏览器cookies同步到长期复用的cookie jar（必须在驱动所在线程调用）
+        
+        优先通过CDP的Network.getAllCookies获取所有域名的cookies（含HttpOnly），
+        失败时回退到当前页面域名的get_cookies。每次同步构建新的jar并整体替换，
+        下载线程持有的旧引用不会被并发修改。
+        """
+        try:
+            cookies = self.driver.execute_cdp_cmd('Network.getAllCookies', {}).get('cookies', [])
+        except Exception:
+            cookies = self.driver.get_cookies()
+        
+        jar = requests.cookies.RequestsCookieJar()
+        for cookie in cookies:
+            jar.set(cookie['name'], cookie['value'],
+                    domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+        self.cookie_jar = jar
+        return jar
+    
+    def get_cookie_jar(self):
+        """返回已同步的cookie jar，尚未同步时才访问浏览器"""
+        if self.cookie_jar is None:
+            return self.sync_cookies()
+        return self.cookie_jar
+    
     def download_image(self, image_url, filename):
         """下载图片"""
         try:
-            print(f"正在下载图片: {image_url[:50]}...")
-            
-            # 使用浏览器的cookies来下载图片
-            cookies = self.driver.get_cookies()
-            cookie_dict = {cookie['name']: cookie['value'] for cookie in cookies}
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Referer': 'https://www.doubao.com/',
-                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
-            }
-            
-            response = requests.get(image_url, headers=headers, cookies=cookie_dict, timeout=30)
-            
-            if response.status_code == 200:
-                # 检查响应内容是否为有效图片
-                content_type = response.headers.get('content-type', '')
-                content_length = len(response.content)
-                
-                print(f"响应状态: {response.status_code}")
-                print(f"内容类型: {content_type}")
-                print(f"文件大小: {content_length} 字节")
-                
-                # 验证是否为有效图片（大小应该大于10KB）
-                if content_length > 10240 and 'image' in content_type:
-                    with open(filename, 'wb') as f:
-                        f.write(response.content)
-                    print(f"✅ 图片已保存为: {filename} (大小: {content_length/1024:.1f}KB)")
-                    return True
-                else:
-                    print(f"❌ 下载的文件不是有效图片 (大小: {content_length} 字节, 类型: {content_type})")
-                    return False
-            else:
-                print(f"❌ 下载图片失败，状态码: {response.status_code}")
-                return False
-                
+            cookie_jar = self.get_cookie_jar()
         except Exception as e:
             print(f"❌ 下载图片时出现错误: {e}")
             return False
+        return self.downloader.download(image_url, filename, cookie_jar)
+    
+    def download_images(self, items):
+        """通过共享下载引擎并行下载多张图片
+        
+        Args:
+            items (list): (image_url, filename) 元组列表
+        
+        Returns:
+            list: 与items顺序一致的下载结果（True/False）
+        """
+        if not items:
+            return []
+        print(f"📥 并行下载 {len(items)} 张图片...")
+        return self.downloader.download_many(items, self.get_cookie_jar())
+    
+    def finish_prompt(self, label):
+        """一个提示词处理完后：写出指标，报告条件等待节省的时间，启用了命令分析时输出并清空该提示词的WebDriver命令报告"""
+        self.metrics.flush()
+        self.wait_ledger.dump(label)
+        if self.profiler:
+            self.profiler.dump(label)
+    
+    def save_images(self, image_urls, filenames, prompt=None):
+        """保存一组图片，返回与image_urls顺序一致的保存路径（失败为None）
+        
+        配置了图片仓库时按内容寻址保存（忽略filenames），已保存的图片对象直接复用；
+        否则按给定文件名并行下载。
+        """
+        if not image_urls:
+            return []
+        with self.metrics.span(STAGE_DOWNLOAD_BATCH, images=len(image_urls)) as span:
+            if self.image_store:
+                print(f"📥 并行获取 {len(image_urls)} 张图片（图片仓库: {self.image_store.root}）...")
+                paths = self.image_store.fetch_many(self.downloader, image_urls, prompt, self.get_cookie_jar())
+            else:
+                download_results = self.download_images(list(zip(image_urls, filenames)))
+                paths = [filename if ok else None for filename, ok in zip(filenames, download_results)]
+            saved = [path for path in paths if path]
+            span.set('ok' if len(saved) == len(paths) else 'failed', saved=len(saved),
+                     bytes=sum(os.path.getsize(path) for path in saved if os.path.exists(path)))
+        return self.transcode_images(paths)
+    
+    def transcode_images(self, paths):
+        """对已保存的图片执行本地转码阶段，未配置转码器时原样返回
+        
+        图片仓库中的对象按内容寻址，转码结果另存为带尺寸后缀的派生文件，不覆盖原对象。
+        """
+        if not self.transcoder or not any(paths):
+            return paths
+        with self.metrics.span(STAGE_TRANSCODE, images=len([path for path in paths if path])) as span:
+            paths = self.transcoder.transcode_many(paths, keep_original=True if self.image_store else None)
+            span.set(bytes=sum(os.path.getsize(path) for path in paths if path and os.path.exists(path)))
+        return paths
+    
+    def generate_single_prompt(self, index, prompt):
+        """生成单个提示词的图片并返回结果记录
 
-    def is_valid_image_content(self, content):
-        """通过文件头验证图片格式"""
-        if len(content) < 8:
-            return False
+        Args:
+            index (int): 提示词在批次中的序号（从0开始），用于生成不冲突的文件名
+            prompt (str): 提示词
+        """
+        print(f"\n=== 测试 {index+1}: {prompt} ===")
+        
+        # 通过浏览器生成图片
+        # 使用图片仓库时由本方法统一保存，以便在索引中记录提示词
+        image_urls = self.send_image_request_via_browser(prompt, filename_prefix=f"generated_image_{index+1}",
+                                                         download=self.image_store is None)
         
-        # 检查常见图片格式的文件头
-        image_signatures = {
-            b'\xff\xd8\xff': 'JPEG',
-            b'\x89PNG\r\n\x1a\n': 'PNG',
-            b'GIF87a': 'GIF',
-            b'GIF89a': 'GIF',
-            b'RIFF': 'WEBP',  # WEBP files start with RIFF
-            b'\x00\x00\x00 ftypavif': 'AVIF'
+        if not image_urls:
+            print(f"❌ 生成失败")
+            return {
+                'prompt': prompt,
+                'success': False,
+                'image_urls': [],
+                'downloaded_files': []
+            }
+        
+        # 检查返回结果类型
+        if isinstance(image_urls[0], str) and not image_urls[0].startswith('http'):
+            # 如果返回的是文件名列表，说明已经下载完成，不需要重复下载
+            downloaded_files = image_urls
+            print(f"✅ 图片已下载完成，共 {len(downloaded_files)} 张图片")
+        else:
+            # 如果返回的是URL列表，需要下载
+            return self.save_prompt_images(index, prompt, image_urls)
+        
+        return {
+            'prompt': prompt,
+            'success': True,
+            'image_urls': image_urls,
+            'downloaded_files': downloaded_files
         }
+    
+    def output_path(self, filename):
+        """图片文件的保存路径（位于 output_dir 下）"""
+        return os.path.join(self.output_dir, filename) if self.output_dir else filename
+    
+    def save_prompt_images(self, index, prompt, image_urls):
+        """保存一个提示词生成的图片URL并返回结果记录（不访问浏览器，可在其他线程执行）"""
+        filenames = [self.output_path(f"generated_image_{index+1}_{j+1}.jpg") for j in range(len(image_urls))]
+        downloaded_files = [path for path in self.save_images(image_urls, filenames, prompt) if path]
+        print(f"✅ 提示词 {index+1} 生成成功，保存了 {len(downloaded_files)} 张图片")
+        return {
+            'prompt': prompt,
+            'success': True,
+            'image_urls': image_urls,
+            'downloaded_files': downloaded_files
+        }
+    
+    def resolve_original_urls(self, image_urls):
+        """把生成阶段拿到的图片URL解析为原图URL，无法解析时保留原URL"""
+        original_urls = []
+        for url in image_urls:
+            cached = self.resolution_cache.get(url)
+            if cached:
+                original_urls.append(cached['original_url'])
+                continue
+            original_url = self.network_capture.lookup(url) if self.network_capture else None
+            if original_url:
+                self.resolution_cache.put(url, original_url, STRATEGY_NETWORK)
+            original_urls.append(original_url or url)
+        return original_urls
+    
+    def run_job(self, job_store, job_id):
+        """按阶段推进单个持久化任务，每个阶段完成后写入检查点
         
-        for signature, format_name in image_signatures.items():
-            if content.startswith(signature):
-                print(f"✅ 检测到有效的{format_name}格式图片")
-                return True
+        已完成的阶段不会重复执行：generated 状态的任务只做解析和下载，
+        resolved 状态的任务只重新下载。
+        
+        Returns:
+            dict: 任务的最新记录
+        """
+        job = job_store.get(job_id)
+        index = job['prompt_index']
+        
+        if job['state'] in (STATE_PENDING, STATE_SUBMITTED):
+            print(f"\n=== 任务 {index+1}: {job['prompt']} ===")
+            job_store.mark_submitted(job_id)
+            image_urls = self.send_image_request_via_browser(job['prompt'], download=False)
+            if not image_urls:
+                print(f"❌ 生成失败")
+                job_store.fail(job_id, STAGE_GENERATE, "未获取到生成的图片")
+                return job_store.get(job_id)
+            job_store.update(job_id, STATE_GENERATED, image_urls=image_urls)
+            job = job_store.get(job_id)
+        
+        if job['state'] == STATE_GENERATED:
+            try:
+                original_urls = self.resolve_original_urls(job['image_urls'])
+            except Exception as e:
+                print(f"❌ 任务 {index+1} 解析原图失败: {e}")
+                job_store.fail(job_id, STAGE_RESOLVE, e)
+                return job_store.get(job_id)
+            job_store.update(job_id, STATE_RESOLVED, original_urls=original_urls)
+            job = job_store.get(job_id)
+        
+        if job['state'] == STATE_RESOLVED:
+            urls = job['original_urls']
+            filenames = [self.output_path(f"generated_image_{index+1}_{j+1}.jpg") for j in range(len(urls))]
+            try:
+                saved_paths = self.save_images(urls, filenames, job['prompt'])
+            except Exception as e:
+                print(f"❌ 任务 {index+1} 下载失败: {e}")
+                saved_paths = [None] * len(urls)
+            downloaded_files = [path for path in saved_paths if path]
             
-            # 特殊处理WEBP
-            if signature == b'RIFF' and len(content) >= 12:
-                if content[8:12] == b'WEBP':
-                    print(f"✅ 检测到有效的WEBP格式图片")
-                    return True
+            if saved_paths and all(saved_paths):
+                print(f"✅ 任务 {index+1} 完成，保存了 {len(downloaded_files)} 张图片")
+                job_store.update(job_id, STATE_DOWNLOADED, downloaded_files=downloaded_files)
+            else:
+                print(f"❌ 任务 {index+1} 下载不完整: {len(downloaded_files)}/{len(urls)}")
+                job_store.fail(job_id, STAGE_DOWNLOAD, f"下载成功 {len(downloaded_files)}/{len(urls)} 张",
+                               downloaded_files=downloaded_files)
         
-        print(f"❌ 未识别的图片格式，文件头: {content[:16].hex()}")
-        return False
-
-
+        return job_store.get(job_id)
     
-    def check_for_new_images(self):
-        """检查页面上是否出现了新的图片"""
-        try:
-            # 等待一下让新内容加载
-            time.sleep(2)
-            
-            # 查找最近添加的图片元素
-            new_images = []
-            recent_images = self.driver.find_elements(By.XPATH, "//img[contains(@src, 'http')]")
-            
-            for img in recent_images[-5:]:  # 只检查最后5个图片元素
-                src = img.get_attribute('src')
-                if src and self.is_valid_image_url(src):
-                    new_images.append(src)
-            
-            return new_images
-            
-        except Exception as e:
-            return []
+    def generate_images(self, prompts, job_store=None, retry_failed=False, tabs=1):
+        """批量生成图片，结果按输入顺序返回
+        
+        Args:
+            prompts (list): 提示词列表
+            job_store (JobStore): 持久化任务库；提供时每个阶段写入检查点，重新运行会跳过已完成的任务
+            retry_failed (bool): 使用任务库时，是否重试之前失败的阶段
+            tabs (int): 同时生成的聊天标签页数量，大于1时在同一个浏览器中多标签页并发
+        """
+        results = dict(self.iter_generate(prompts, job_store, retry_failed, tabs))
+        return [results[index] for index in sorted(results)]
     
-    def verify_image_accessibility(self, url):
-        """验证图片URL是否可访问且为有效图片"""
-        try:
-            # 使用HEAD请求检查图片是否存在
-            cookies = self.driver.get_cookies()
-            cookie_dict = {cookie['name']: cookie['value'] for cookie in cookies}
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Referer': 'https://www.doubao.com/'
-            }
-            
-            response = requests.head(url, headers=headers, cookies=cookie_dict, timeout=10)
-            
-            if response.status_code == 200:
-                content_type = response.headers.get('content-type', '')
-                content_length = response.headers.get('content-length')
-                
-                # 检查是否为图片类型且大小合理
-                if ('image' in content_type and 
-                    content_length and 
-                    int(content_length) > 10240):  # 大于10KB
-                    print(f"验证通过: {url[:50]}... (大小: {int(content_length)/1024:.1f}KB)")
-                    return True
-            
-            return False
-            
-        except Exception as e:
-            print(f"验证图片URL时出现错误: {e}")
-            return False
+    def wait_between_prompts(self, timeout=3):
+        """相邻两个提示词之间等待输入框可用且页面不在生成中，最长等待原来的固定间隔"""
+        print("⏳ 等待输入框就绪...")
+        self.waiter.input_ready(timeout=timeout, label='between_prompts')
     
-    def send_image_request_via_browser(self, prompt):
-        """通过浏览器发送图片生成请求"""
-        try:
-            print(f"🚀 开始生成图片: {prompt}")
-            print(f"📍 当前页面URL: {self.driver.current_url}")
-            
-            # 查找输入框
-            input_selectors = [
-                "//textarea[@placeholder*='输入' or @placeholder*='消息' or @placeholder*='问题']",
-                "//input[@placeholder*='输入' or @placeholder*='消息' or @placeholder*='问题']",
-                "//div[@contenteditable='true']",
-                "textarea",
-                "input[type='text']"
-            ]
-            
-            print(f"🔍 开始查找输入框，共有 {len(input_selectors)} 个选择器")
-            input_element = None
-            for i, selector in enumerate(input_selectors):
+    def iter_generate(self, prompts, job_store=None, retry_failed=False, tabs=1):
+        """流式批量生成：按需读取提示词，每个提示词结束时产出 (序号, 结果记录)
+        
+        prompts 可以是任意可迭代对象（例如逐行读取的文件），内存占用与提示词总数无关。
+        单标签页时按输入顺序产出，多标签页时按完成顺序产出。参数同 generate_images。
+        """
+        if tabs > 1:
+            yield from self.iter_generate_in_tabs(prompts, tabs, job_store, retry_failed)
+            return
+        
+        if job_store is not None:
+            job_store.resume()
+        
+        generated = False
+        for index, prompt in enumerate(prompts):
+            if job_store is None:
+                # 等待输入框就绪再处理下一个
+                if generated:
+                    self.wait_between_prompts()
+                generated = True
+                result = self.generate_single_prompt(index, prompt)
+                self.finish_prompt(f"提示词 {index+1}")
+                yield index, result
+                continue
+            
+            job_id = job_store.add_prompts([prompt], start=index, retry_failed=retry_failed)[0]
+            job = job_store.get(job_id)
+            if job['state'] not in (STATE_DOWNLOADED, STATE_FAILED):
+                # 需要重新生成的任务之间等待输入框就绪
+                needs_generation = job['state'] in (STATE_PENDING, STATE_SUBMITTED)
+                if needs_generation and generated:
+                    self.wait_between_prompts()
+                generated = generated or needs_generation
+                
                 try:
-                    print(f"  尝试选择器 {i+1}: {selector}")
-                    if selector.startswith('//'):
-                        input_element = WebDriverWait(self.driver, 5).until(
-                            EC.element_to_be_clickable((By.XPATH, selector))
-                        )
-                    else:
-                        input_element = WebDriverWait(self.driver, 5).until(
-                            EC.element_to_be_clickable((By.CSS_SELECTOR, selector))
-                        )
-                    print(f"  ✅ 成功找到输入框: {selector}")
-                    break
+                    self.run_job(job_store, job_id)
                 except Exception as e:
-                    print(f"  ❌ 选择器失败: {str(e)[:100]}")
-                    continue
-            
-            if not input_element:
-                print("❌ 所有输入框选择器都失败了")
-                # 尝试打印页面上所有可能的输入元素
-                all_inputs = self.driver.find_elements(By.TAG_NAME, "input")
-                all_textareas = self.driver.find_elements(By.TAG_NAME, "textarea")
-                all_contenteditable = self.driver.find_elements(By.XPATH, "//div[@contenteditable='true']")
-                
-                print(f"📊 页面统计: input元素{len(all_inputs)}个, textarea元素{len(all_textareas)}个, contenteditable元素{len(all_contenteditable)}个")
-                
-                for i, inp in enumerate(all_inputs[:3]):  # 只显示前3个
-                    try:
-                        placeholder = inp.get_attribute('placeholder') or '无'
-                        input_type = inp.get_attribute('type') or '无'
-                        print(f"  input[{i}]: type={input_type}, placeholder={placeholder}")
-                    except:
-                        pass
-                        
-                for i, ta in enumerate(all_textareas[:3]):  # 只显示前3个
-                    try:
-                        placeholder = ta.get_attribute('placeholder') or '无'
-                        print(f"  textarea[{i}]: placeholder={placeholder}")
-                    except:
-                        pass
-                
-                raise Exception("找不到输入框")
-            
-            # 清空输入框并输入提示词
-            print(f"📝 清空输入框并输入提示词: {prompt[:50]}...")
-            input_element.clear()
-            time.sleep(0.5)  # 等待清空完成
-            input_element.send_keys(prompt)
-            print(f"✅ 提示词输入完成")
-            
-            # 发送消息
-            print(f"📤 尝试发送消息")
+                    print(f"❌ 任务 {index+1} 执行出错: {e}")
+                    job_store.fail_current_stage(job_id, e)
+                self.finish_prompt(f"任务 {index+1}")
+            yield index, JobStore.to_result(job_store.get(job_id))
+    
+    def open_chat_tabs(self, count):
+        """在当前浏览器中打开 count 个聊天标签页（含当前标签页），返回窗口句柄列表
+        
+        新标签页与当前标签页共用同一个浏览器配置，登录状态无需重新建立。
+        """
+        main_handle = self.driver.current_window_handle
+        
+        # 额外的标签页都打开新对话，而不是当前标签页所在的对话，各标签页的提示词互不干扰
+        handles = [main_handle]
+        for i in range(count - 1):
             try:
-                input_element.send_keys(Keys.RETURN)
-                print(f"✅ 通过回车键发送成功")
+                self.driver.switch_to.new_window('tab')
+                self.driver.get(DOUBAO_CHAT_URL)
+                handles.append(self.driver.current_window_handle)
             except Exception as e:
-                print(f"❌ 回车键发送失败: {e}")
-                print(f"🔍 尝试查找发送按钮")
-                try:
-                    send_button = self.driver.find_element(By.XPATH, "//button[contains(text(), '发送') or contains(text(), '提交')]")
-                    send_button.click()
-                    print(f"✅ 通过发送按钮发送成功")
-                except Exception as e2:
-                    print(f"❌ 发送按钮也失败: {e2}")
-                    # 尝试查找所有按钮
-                    all_buttons = self.driver.find_elements(By.TAG_NAME, "button")
-                    print(f"📊 页面上共有 {len(all_buttons)} 个按钮")
-                    for i, btn in enumerate(all_buttons[:5]):  # 只显示前5个
-                        try:
-                            btn_text = btn.text or btn.get_attribute('aria-label') or '无文本'
-                            print(f"  button[{i}]: {btn_text[:30]}")
-                        except:
-                            pass
-                    raise Exception(f"无法发送消息: {e2}")
-            
-            print(f"⏳ 消息已发送，开始等待图片生成...")
-            
-            # 等待图片真正生成完成
-            result = self.wait_for_image_generation()
-            
-            # 检查返回结果的类型
-            if isinstance(result, list) and result:
-                # 如果返回的是文件名列表（新的下载逻辑），直接返回
-                if isinstance(result[0], str) and not result[0].startswith('http'):
-                    print(f"🎯 图片生成完成，共下载 {len(result)} 张图片")
-                    for i, filename in enumerate(result):
-                        print(f"  图片[{i+1}]: {filename}")
-                    return result  # 直接返回，不再重复下载
-                # 如果返回的是URL列表（旧的逻辑），继续下载
-                else:
-                    print(f"🎯 图片生成完成，共获取到 {len(result)} 个图片URL")
-                    # 这里可以添加下载逻辑
-                    return result
-            else:
-                print("❌ 未获取到有效的图片结果")
-                return []
-            
-        except Exception as e:
-            print(f"❌ 通过浏览器生成图片时出现错误: {e}")
-            import traceback
-            print(f"📋 详细错误信息:\n{traceback.format_exc()}")
-            return []
+                print(f"⚠️ 打开第 {i+2} 个标签页失败: {str(e)[:100]}")
+                break
+        for handle in handles[1:]:
+            self.driver.switch_to.window(handle)
+            self.waiter.network_idle(timeout=5, label='tab_page_load')
+        self.driver.switch_to.window(main_handle)
+        print(f"🗂️ 已打开 {len(handles)} 个聊天标签页")
+        return handles
     
-    def download_image(self, image_url, filename):
-        """下载图片"""
+    def close_chat_tabs(self, handles):
+        """关闭 open_chat_tabs 打开的额外标签页并切回第一个标签页"""
+        for handle in handles[1:]:
+            self.watcher_baselines.pop(handle, None)
+            try:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            except Exception as e:
+                print(f"关闭标签页时出现错误: {e}")
+        self.driver.switch_to.window(handles[0])
+    
+    def poll_tab(self, handle, settle=1.0):
+        """切换到标签页并读取页面内监听器的当前状态（不阻塞），监听器丢失时重新注入并返回None"""
+        self.driver.switch_to.window(handle)
+        state = self.driver.execute_script(IMAGES_STATE_SCRIPT, int(settle * 1000))
+        if state is None:
+            print("⚠️ 标签页监听器丢失，重新注入")
+            self.reinstall_image_watcher()
+        return state
+    
+    def iter_generate_in_tabs(self, prompts, tabs=3, job_store=None, retry_failed=False, submit_interval=3):
+        """在同一个浏览器的多个聊天标签页中并发生成图片，按完成顺序产出 (序号, 结果记录)
+        
+        WebDriver命令只在当前线程发出：空闲标签页依次提交提示词，生成中的标签页轮流用一次
+        execute_script 读取页面内监听器的状态。生成完成的图片交给后台线程解析和下载，
+        标签页立即提交下一个提示词。所有标签页共用一个浏览器进程和登录会话，
+        每个并发提示词只多占一个渲染进程，而不是一整套浏览器和驱动。
+        提示词只在有空闲标签页时才读取，后台未完成的保存任务也有上限，内存占用与批次大小无关。
+        
+        Args:
+            prompts (iterable): 提示词
+            tabs (int): 聊天标签页数量
+            job_store (JobStore): 持久化任务库；提供时每个阶段写入检查点
+            retry_failed (bool): 使用任务库时，是否重试之前失败的阶段
+            submit_interval (float): 相邻两次提交之间的最短间隔（秒）
+        """
+        source = enumerate(prompts)
+        exhausted = False
+        # 已读取、等待空闲标签页的工作项 (序号, 提示词, 任务ID)
+        queued = None
+        # 标签页句柄 -> 正在生成的工作项 (序号, 提示词, 任务ID, 开始时间, 超时, 等待计时span)
+        active = {}
+        # 正在后台解析和下载的工作项：序号 -> (Future, 提示词, 任务ID)
+        finishing = {}
+        # 已结束、等待产出的结果
+        ready = deque()
+        handles = []
+        last_submit = 0
+        executor = ThreadPoolExecutor(max_workers=tabs, thread_name_prefix='tab-finish')
+        
+        def failed(prompt):
+            return {'prompt': prompt, 'success': False, 'image_urls': [], 'downloaded_files': []}
+        
+        def take():
+            """读取一个提示词：需要生成的返回工作项，已完成或只需下载的任务就地处理后返回None"""
+            nonlocal exhausted
+            try:
+                position, prompt = next(source)
+            except StopIteration:
+                exhausted = True
+                return None
+            if job_store is None:
+                return position, prompt, None
+            job_id = job_store.add_prompts([prompt], start=position, retry_failed=retry_failed)[0]
+            job = job_store.get(job_id)
+            if job['state'] in (STATE_PENDING, STATE_SUBMITTED):
+                return position, prompt, job_id
+            if job['state'] in (STATE_GENERATED, STATE_RESOLVED):
+                # 已生成的任务只需解析和下载，不占用标签页
+                finishing[position] = (executor.submit(self.run_job, job_store, job_id), prompt, job_id)
+            else:
+                ready.append((position, JobStore.to_result(job)))
+            return None
+        
+        def complete(position, prompt, job_id, image_urls):
+            """生成阶段结束：失败时直接产出，成功时交给后台线程保存"""
+            self.finish_prompt(f"任务 {position+1}" if job_id is not None else f"提示词 {position+1}")
+            if job_id is not None:
+                if not image_urls:
+                    job_store.fail(job_id, STAGE_GENERATE, "未获取到生成的图片")
+                    ready.append((position, JobStore.to_result(job_store.get(job_id))))
+                    return
+                job_store.update(job_id, STATE_GENERATED, image_urls=image_urls)
+                finishing[position] = (executor.submit(self.run_job, job_store, job_id), prompt, job_id)
+            elif image_urls:
+                finishing[position] = (executor.submit(self.save_prompt_images, position, prompt, image_urls),
+                                       prompt, job_id)
+            else:
+                print(f"❌ 提示词 {position+1} 生成失败")
+                ready.append((position, failed(prompt)))
+        
+        def collect(position, future, prompt, job_id):
+            """取出后台保存的结果"""
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"❌ 第 {position+1} 项保存出错: {e}")
+                if job_id is None:
+                    return failed(prompt)
+                job_store.fail_current_stage(job_id, e)
+                result = job_store.get(job_id)
+            return JobStore.to_result(result) if job_id is not None else result
+        
+        if job_store is not None:
+            job_store.resume()
+        
         try:
-            print(f"正在下载图片: {image_url[:50]}...")
-            
-            # 使用浏览器的cookies来下载图片
-            cookies = self.driver.get_cookies()
-            cookie_dict = {cookie['name']: cookie['value'] for cookie in cookies}
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Referer': 'https://www.doubao.com/',
-                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
-            }
-            
-            response = requests.get(image_url, headers=headers, cookies=cookie_dict, timeout=30)
-            
-            if response.status_code == 200:
-                # 检查响应内容是否为有效图片
-                content_type = response.headers.get('content-type', '')
-                content_length = len(response.content)
+            while True:
+                # 产出已结束的结果
+                while ready:
+                    yield ready.popleft()
+                for position, (future, prompt, job_id) in list(finishing.items()):
+                    if future.done():
+                        del finishing[position]
+                        yield position, collect(position, future, prompt, job_id)
                 
-                print(f"响应状态: {response.status_code}")
-                print(f"内容类型: {content_type}")
-                print(f"文件大小: {content_length} 字节")
+                # 后台保存积压时暂停读取新的提示词
+                if queued is None and not exhausted and len(finishing) < tabs * 2:
+                    queued = take()
+                if exhausted and queued is None and not active and not finishing and not ready:
+                    break
                 
-                # 验证是否为有效图片（大小应该大于10KB）
-                if content_length > 10240 and 'image' in content_type:
-                    with open(filename, 'wb') as f:
-                        f.write(response.content)
-                    print(f"✅ 图片已保存为: {filename} (大小: {content_length/1024:.1f}KB)")
-                    return True
-                else:
-                    print(f"❌ 下载的文件不是有效图片 (大小: {content_length} 字节, 类型: {content_type})")
-                    return False
-            else:
-                print(f"❌ 下载图片失败，状态码: {response.status_code}")
-                return False
+                # 空闲标签页提交下一个提示词，相邻提交之间保持间隔
+                idle = [handle for handle in handles if handle not in active]
+                if queued and (idle or not handles) and time.time() - last_submit >= submit_interval:
+                    if not handles:
+                        handles = idle = self.open_chat_tabs(tabs)
+                    position, prompt, job_id = queued
+                    queued = None
+                    handle = idle[0]
+                    print(f"\n=== [{handles.index(handle)+1}号标签页] 提示词 {position+1}: {prompt} ===")
+                    try:
+                        self.driver.switch_to.window(handle)
+                        if job_id is not None:
+                            job_store.mark_submitted(job_id)
+                        self.submit_prompt(prompt)
+                        wait_span = self.metrics.span(STAGE_GENERATION_WAIT, tab=handles.index(handle) + 1).begin()
+                        active[handle] = (position, prompt, job_id, time.time(),
+                                          self.generation_scheduler.timeout(), wait_span)
+                    except Exception as e:
+                        print(f"❌ 提示词 {position+1} 提交失败: {e}")
+                        complete(position, prompt, job_id, [])
+                    last_submit = time.time()
                 
-        except Exception as e:
-            print(f"❌ 下载图片时出现错误: {e}")
-            return False
-    
-    def generate_images(self, prompts):
-        """批量生成图片"""
-        results = []
-        
-        for i, prompt in enumerate(prompts):
-            print(f"\n=== 测试 {i+1}: {prompt} ===")
-            
-            # 通过浏览器生成图片
-            image_urls = self.send_image_request_via_browser(prompt)
-            
-            if image_urls:
-                # 检查返回结果类型
-                if isinstance(image_urls[0], str) and not image_urls[0].startswith('http'):
-                    # 如果返回的是文件名列表，说明已经下载完成，不需要重复下载
-                    downloaded_files = image_urls
-                    print(f"✅ 图片已下载完成，共 {len(downloaded_files)} 张图片")
-                else:
-                    # 如果返回的是URL列表，需要下载
-                    downloaded_files = []
-                    for j, url in enumerate(image_urls):
-                        filename = f"generated_image_{i+1}_{j+1}.jpg"
-                        if self.download_image(url, filename):
-                            downloaded_files.append(filename)
-                    print(f"✅ 生成成功，保存了 {len(downloaded_files)} 张图片")
+                # 轮流检查生成中的标签页
+                for handle, (position, prompt, job_id, started, timeout, wait_span) in list(active.items()):
+                    elapsed = time.time() - started
+                    try:
+                        state = self.poll_tab(handle)
+                    except Exception as e:
+                        print(f"⚠️ 检查标签页时出错: {str(e)[:100]}")
+                        state = None
+                    
+                    if state and state['complete']:
+                        self.generation_scheduler.observe(elapsed)
+                        image_urls = [image['src'] for image in state['images']]
+                        print(f"🎉 提示词 {position+1} 生成完成 ({elapsed:.1f}s)，共 {len(image_urls)} 张图片")
+                    elif elapsed >= timeout:
+                        self.generation_scheduler.observe(elapsed, timed_out=True)
+                        image_urls = [image['src'] for image in state['images']] if state else []
+                        print(f"⏰ 提示词 {position+1} 等待超时 ({timeout:.0f}秒)，已加载 {len(image_urls)} 张图片")
+                    else:
+                        continue
+                    del active[handle]
+                    wait_span.end('ok' if image_urls else 'failed', images=len(image_urls))
+                    complete(position, prompt, job_id, image_urls)
                 
-                results.append({
-                    'prompt': prompt,
-                    'success': True,
-                    'image_urls': image_urls,
-                    'downloaded_files': downloaded_files
-                })
-            else:
-                results.append({
-                    'prompt': prompt,
-                    'success': False,
-                    'image_urls': [],
-                    'downloaded_files': []
-                })
-                print(f"❌ 生成失败")
-            
-            # 等待一段时间再处理下一个
-            if i < len(prompts) - 1:
-                print("等待3秒...")
-                time.sleep(3)
-        
-        return results
+                if ready or (queued is None and not exhausted and len(finishing) < tabs * 2):
+                    continue
+                # 下一轮检查的间隔由最需要密集检查的标签页决定；有空闲标签页时不晚于下次可提交的时间
+                delays = [self.generation_scheduler.next_interval(time.time() - item[3]) for item in active.values()]
+                if queued and len(active) < len(handles):
+                    delays.append(submit_interval - (time.time() - last_submit))
+                if finishing:
+                    delays.append(0.2)
+                time.sleep(max(0, min(delays)) if delays else 0)
+        finally:
+            if handles:
+                self.close_chat_tabs(handles)
+            executor.shutdown(wait=True)
+    
+    def generate_images_in_tabs(self, prompts, tabs=3, job_store=None, retry_failed=False, submit_interval=3):
+        """在同一个浏览器的多个聊天标签页中并发生成图片，结果按输入顺序返回（参数见 iter_generate_in_tabs）"""
+        results = dict(self.iter_generate_in_tabs(prompts, tabs, job_store, retry_failed, submit_interval))
+        return [results[index] for index in sorted(results)]
     
     def close(self):
         """关闭浏览器"""
+        if self._owns_url_verifier:
+            self.url_verifier.close()
+        self.metrics.flush()
+        if self.network_capture:
+            self.network_capture.stop()
+            self.network_capture = None
         if self.driver:
             self.driver.quit()
+        if self._owns_downloader:
+            self.downloader.close()
 
-# 使用示例
-if __name__ == "__main__":
-    # 创建图片生成器实例
-    generator = DoubaoImageGenerator(headless=False)  # 设置为False以便看到浏览器界面
+
+class DoubaoGeneratorPool:
+    """多个已登录浏览器实例组成的生成器池
+
+    每个实例独立执行 setup_driver 和 login_and_extract_params，
+    generate_images 将提示词分发到空闲实例上并发执行，结果按输入顺序返回。
+    """
+    def __init__(self, size=2, headless=False, download_workers=8, download_timeout=30,
+                 user_data_dir=None, session_file=None, allow_manual_login=True, image_store=None,
+                 resolution_cache=None, metrics=None, generation_scheduler=None, transcoder=None, output_dir=None):
+        """初始化生成器池
+        
+        Args:
+            size (int): 浏览器实例数量
+            headless (bool): 是否使用无头模式
+            download_workers (int): 共享下载引擎的并行线程数
+            download_timeout (int): 单次下载请求的超时时间（秒）
+            user_data_dir (str): 持久化用户数据根目录，每个实例使用其下独立的子目录
+            session_file (str): 所有实例共享的登录会话快照文件
+            allow_manual_login (bool): 会话无效时是否等待人工登录
+            image_store (ImageStore): 所有实例共享的内容寻址图片仓库
+            resolution_cache (ResolutionCache): 所有实例共享的原图解析缓存
+            metrics (Metrics): 所有实例共享的分阶段计时指标收集器
+            generation_scheduler (GenerationScheduler): 所有实例共享的生成耗时调度器
+            transcoder (ImageTranscoder): 所有实例共享的本地转码阶段
+            output_dir (str): 不使用图片仓库时图片的保存目录
+        """
+        self.size = size
+        self.headless = headless
+        self.user_data_dir = user_data_dir
+        self.session_file = session_file
+        self.allow_manual_login = allow_manual_login
+        self.image_store = image_store
+        self.resolution_cache = resolution_cache or ResolutionCache()
+        self.metrics = metrics or Metrics()
+        self.generation_scheduler = generation_scheduler or GenerationScheduler()
+        self.transcoder = transcoder
+        self.output_dir = output_dir
+        self.downloader = ImageDownloader(max_workers=download_workers, timeout=download_timeout,
+                                          metrics=self.metrics)
+        # 所有实例共用一个校验器，每个主机的并发上限对整个池生效，而不是随实例数成倍增加
+        self.url_verifier = UrlVerifier(self.downloader.session)
+        self.generators = []
+        self._idle = queue.Queue()
     
-    try:
-        # 登录并提取参数
-        if generator.login_and_extract_params():
-            # 测试图片生成
-            test_prompts = [
-                 "生成一朵空谷幽兰"
-                # "生成一朵空谷幽兰",
-                # # "画一只可爱的小猫咪",
-                # # "创作一幅山水画",
-                # "设计一个现代建筑"
-            ]
-            
-            results = generator.generate_images(test_prompts)
-            
-            # 保存结果
-            with open('image_generation_results.json', 'w', encoding='utf-8') as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
-            
-            print("\n所有测试完成！结果已保存到 image_generation_results.json")
-        else:
-            print("登录失败，无法继续")
-            
-    except Exception as e:
-        print(f"程序执行出现错误: {e}")
+    def _start_generator(self, index):
+        """启动并登录单个生成器实例，失败时返回None"""
+        generator = None
+        try:
+            print(f"🚀 启动浏览器实例 {index+1}/{self.size}")
+            # Chrome不允许多个进程共用同一个用户数据目录
+            user_data_dir = os.path.join(self.user_data_dir, f"worker-{index+1}") if self.user_data_dir else None
+            generator = DoubaoImageGenerator(headless=self.headless, downloader=self.downloader,
+                                             user_data_dir=user_data_dir, session_file=self.session_file,
+                                             image_store=self.image_store,
+                                             resolution_cache=self.resolution_cache,
+                                             metrics=self.metrics,
+                                             generation_scheduler=self.generation_scheduler,
+                                             transcoder=self.transcoder,
+                                             output_dir=self.output_dir,
+                                             url_verifier=self.url_verifier)
+            if generator.login_and_extract_params(allow_manual_login=self.allow_manual_login):
+                return generator
+            print(f"❌ 浏览器实例 {index+1} 登录失败")
+        except Exception as e:
+            print(f"❌ 浏览器实例 {index+1} 启动失败: {e}")
+        if generator:
+            generator.close()
+        return None
+    
+    def start(self):
+        """并发启动所有浏览器实例，返回成功登录的实例数量"""
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            started = list(executor.map(self._start_generator, range(self.size)))
+        
+        for generator in started:
+            if generator:
+                self.generators.append(generator)
+                self._idle.put(generator)
+        
+        print(f"✅ 生成器池就绪: {len(self.generators)}/{self.size} 个实例")
+        return len(self.generators)
     
-    finally:
-        generator.close()
\ No newline at end of file
+    def _run_prompt(self, index, prompt):
+        """借出一个空闲实例执行提示词，完成后归还"""
+        generator = self._idle.get()
+        try:
+            return generator.generate_single_prompt(index, prompt)
+        except Exception as e:
+            print(f"❌ 提示词 {index+1} 执行出错: {e}")
+            return {
+                'prompt': prompt,
+                'success': False,
+                'image_urls': [],
+                'downloaded_files': []
+            }
+        finally:
+            generator.finish_prompt(f"提示词 {index+1}")
+            self._idle.put(generator)
+    
+    def _run_job(self, job_store, job_id):
+        """借出一个空闲实例推进持久化任务，完成后归还"""
+        job = job_store.get(job_id)
+        if job['state'] not in (STATE_DOWNLOADED, STATE_FAILED):
+            generator = self._idle.get()
+            try:
+                job = generator.run_job(job_store, job_id)
+            except Exception as e:
+                print(f"❌ 任务 {job['prompt_index']+1} 执行出错: {e}")
+                job_store.fail_current_stage(job_id, e)
+                job = job_store.get(job_id)
+            finally:
+                generator.finish_prompt(f"任务 {job['prompt_index']+1}")
+                self._idle.put(generator)
+        return JobStore.to_result(job)
+    
+    def generate_images(self, prompts, job_store=None, retry_failed=False):
+        """将提示词分发到池中各实例并发生成，结果按输入顺序返回
+        
+        Args:
+            prompts (list): 提示词列表
+            job_store (JobStore): 持久化任务库；提供时每个阶段写入检查点，重新运行会跳过已完成的任务
+            retry_failed (bool): 使用任务库时，是否重试之前失败的阶段
+        """
+        results = dict(self.iter_generate(prompts, job_store, retry_failed))
+        return [results[index] for index in sorted(results)]
+    
+    def iter_generate(self, prompts, job_store=None, retry_failed=False):
+        """流式分发提示词：同时执行的提示词不超过实例数，按完成顺序产出 (序号, 结果记录)
+        
+        提示词只在有实例空闲时才读取，内存占用与提示词总数无关。参数同 generate_images。
+        """
+        if not self.generators:
+            raise Exception("生成器池中没有可用的浏览器实例，请先调用start()")
+        if job_store is not None:
+            job_store.resume()
+        
+        with ThreadPoolExecutor(max_workers=len(self.generators)) as executor:
+            in_flight = {}
+            for index, prompt in enumerate(prompts):
+                if job_store is not None:
+                    job_id = job_store.add_prompts([prompt], start=index, retry_failed=retry_failed)[0]
+                    future = executor.submit(self._run_job, job_store, job_id)
+                else:
+                    future = executor.submit(self._run_prompt, index, prompt)
+                in_flight[future] = index
+                if len(in_flight) >= len(self.generators):
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield in_flight.pop(future), future.result()
+            for future in as_completed(list(in_flight)):
+                yield in_flight.pop(future), future.result()
+    
+    def close(self):
+        """关闭池中所有浏览器"""
+        for generator in self.generators:
+            try:
+                generator.close()
+            except Exception as e:
+                print(f"关闭浏览器时出现错误: {e}")
+        self.generators = []
+        self._idle = queue.Queue()
+        self.url_verifier.close()
+        self.downloader.close()
+        self.metrics.flush()
+
+# 命令行入口见 cli.py，例如: python cli.py prompts.txt --results results.jsonl
+if __name__ == "__main__":
+    from cli import main
+    raise SystemExit(main())
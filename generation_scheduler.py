@@ -0,0 +1,139 @@
+import json
+import os
+import tempfile
+import threading
+from collections import deque
+
+
+class GenerationScheduler:
+    """根据历史生成耗时自适应安排轮询间隔和超时
+
+    记录最近若干次生成的耗时，估计其分布：
+    预计最早完成之前稀疏轮询，预计完成区间内密集轮询，超出常见耗时后逐渐放缓；
+    超时取历史P99的倍数并限制在上下限之间。样本不足时退回固定间隔和默认超时。
+    超时的生成按删失样本记录：已等待的时长是真实耗时的下限，同样计入历史，
+    并在下一次成功之前把超时至少放宽到该下限的1.5倍，避免P99只由成功样本决定而越估越短。
+    """
+    def __init__(self, history_path=None, default_timeout=120, min_timeout=30, max_timeout=300,
+                 min_interval=1.0, max_interval=8.0, default_interval=2.0, min_samples=5, history_size=200):
+        """初始化调度器
+
+        Args:
+            history_path (str): 历史耗时的持久化JSON文件，None表示只保存在内存中
+            default_timeout (float): 样本不足时的超时时间（秒）
+            min_timeout (float): 自适应超时的下限（秒）
+            max_timeout (float): 自适应超时的上限（秒）
+            min_interval (float): 最短轮询间隔（秒）
+            max_interval (float): 最长轮询间隔（秒）
+            default_interval (float): 样本不足时的固定轮询间隔（秒）
+            min_samples (int): 启用自适应所需的最少样本数
+            history_size (int): 保留的历史样本数
+        """
+        self.history_path = history_path
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        # 串行化文件写入；与 _lock 分开，写文件时不阻塞读取分位数
+        self._save_lock = threading.Lock()
+        self._durations = deque(maxlen=history_size)
+        # 最近一次超时后要求的最小超时，成功生成后清除
+        self._timeout_floor = None
+        self._load()
+
+    def _load(self):
+        """读取持久化的历史耗时"""
+        if not self.history_path or not os.path.exists(self.history_path):
+            return
+        try:
+            with open(self.history_path, encoding='utf-8') as f:
+                self._durations.extend(float(d) for d in json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            print(f"⚠️ 读取生成耗时历史失败: {e}")
+
+    def _save(self):
+        """原子写入历史耗时
+
+        调度器由生成器池、多标签页和异步生成器的多个线程共用：写入串行进行，
+        每次在写锁内读取最新样本，并使用唯一的临时文件，避免并发写入互相截断。
+        """
+        with self._save_lock:
+            with self._lock:
+                durations = list(self._durations)
+            tmp_path = None
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.history_path)),
+                                                prefix=os.path.basename(self.history_path) + '.', suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump([round(d, 3) for d in durations], f)
+                os.replace(tmp_path, self.history_path)
+                tmp_path = None
+            except OSError as e:
+                print(f"⚠️ 保存生成耗时历史失败: {e}")
+            finally:
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def observe(self, duration, timed_out=False):
+        """记录一次生成的耗时（秒）
+
+        Args:
+            duration (float): 从开始等待到完成（或放弃）的时长
+            timed_out (bool): 是否等待超时；超时时 duration 只是真实耗时的下限
+        """
+        with self._lock:
+            self._durations.append(duration)
+            if timed_out:
+                self._timeout_floor = min(self.max_timeout, max(self._timeout_floor or 0, duration * 1.5))
+            else:
+                self._timeout_floor = None
+        if self.history_path:
+            self._save()
+
+    def quantile(self, fraction):
+        """历史耗时的分位数，样本不足时返回None"""
+        with self._lock:
+            durations = sorted(self._durations)
+        if len(durations) < self.min_samples:
+            return None
+        return durations[min(len(durations) - 1, int(fraction * len(durations)))]
+
+    def timeout(self):
+        """本次等待的超时时间：历史P99的1.5倍，限制在 [min_timeout, max_timeout] 内
+
+        上一次等待超时后（尚未再次成功），不低于那次已等待时长的1.5倍。
+        """
+        p99 = self.quantile(0.99)
+        timeout = self.default_timeout if p99 is None else min(self.max_timeout, max(self.min_timeout, p99 * 1.5))
+        with self._lock:
+            floor = self._timeout_floor
+        return max(timeout, floor) if floor else timeout
+
+    def next_interval(self, elapsed):
+        """已等待 elapsed 秒后，距下一次检查的间隔（秒）"""
+        p10 = self.quantile(0.1)
+        if p10 is None:
+            return self.default_interval
+        p90 = self.quantile(0.9)
+
+        window_start = p10 * 0.8
+        if elapsed < window_start:
+            # 预计最早完成之前：直接睡到窗口开始，但不超过最长间隔
+            return max(self.min_interval, min(self.max_interval, window_start - elapsed))
+        if elapsed <= p90 * 1.2:
+            # 预计完成区间内：密集检查，区间越窄检查越密
+            return min(self.default_interval, max(self.min_interval, (p90 - p10) / 10))
+        # 超出常见耗时：随超出时长逐渐放缓
+        return min(self.max_interval, self.min_interval + (elapsed - p90 * 1.2) * 0.25)
+
+    def describe(self):
+        """当前估计的简要描述，用于日志"""
+        p50 = self.quantile(0.5)
+        if p50 is None:
+            return f"样本不足，固定间隔 {self.default_interval}s，超时 {self.default_timeout}s"
+        return (f"P10 {self.quantile(0.1):.1f}s / P50 {p50:.1f}s / P90 {self.quantile(0.9):.1f}s，"
+                f"超时 {self.timeout():.0f}s")
@@ -0,0 +1,218 @@
+import hashlib
+import os
+import tempfile
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from metrics import STAGE_DOWNLOAD
+
+
+# 判断文件头至少需要的字节数
+SIGNATURE_BYTES = 16
+
+# 常见图片格式的文件头
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+]
+
+
+def detect_image_format(content):
+    """通过文件头识别图片格式，无法识别时返回None"""
+    if len(content) < 8:
+        return None
+
+    for signature, format_name in IMAGE_SIGNATURES:
+        if content.startswith(signature):
+            return format_name
+
+    # WEBP: RIFF....WEBP
+    if content.startswith(b'RIFF') and content[8:12] == b'WEBP':
+        return 'WEBP'
+
+    # AVIF/HEIC: ISO BMFF，第4-8字节为ftyp，后跟品牌
+    if content[4:8] == b'ftyp' and content[8:12] in (b'avif', b'avis'):
+        return 'AVIF'
+
+    return None
+
+
+class ImageDownloader:
+    """共享的图片下载引擎
+
+    所有提示词和浏览器实例共用同一个 requests.Session，
+    按主机保持长连接，避免每张图片都重新进行TCP+TLS握手；
+    下载任务在有界线程池中并行执行。
+    """
+    DEFAULT_HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Referer': 'https://www.doubao.com/',
+        'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+    }
+
+    def __init__(self, max_workers=8, pool_maxsize=16, timeout=30, chunk_size=64 * 1024, min_size=10240,
+                 metrics=None):
+        """初始化下载引擎
+
+        Args:
+            max_workers (int): 并行下载的最大线程数
+            pool_maxsize (int): 每个主机保持的最大连接数
+            timeout (int): 单次请求超时时间（秒）
+            chunk_size (int): 流式下载的分块大小（字节），决定单个下载的内存占用
+            min_size (int): 有效图片的最小字节数
+            metrics (Metrics): 指标收集器，提供时每张图片的下载记录为一个 download 阶段
+        """
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.min_size = min_size
+        self.metrics = metrics
+        self.session = requests.Session()
+        self.session.headers.update(self.DEFAULT_HEADERS)
+
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-download')
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def fetch_to_temp(self, image_url, directory, cookies=None, prefix='.download.'):
+        """流式下载单张图片到临时文件（见 _fetch_to_temp），配置了指标收集器时记录耗时和字节数"""
+        if not self.metrics:
+            return self._fetch_to_temp(image_url, directory, cookies, prefix)
+        with self.metrics.span(STAGE_DOWNLOAD, host=urlsplit(image_url).netloc) as span:
+            result = self._fetch_to_temp(image_url, directory, cookies, prefix)
+            span.set('ok' if result else 'failed', result['size'] if result else 0)
+        return result
+
+    def _fetch_to_temp(self, image_url, directory, cookies=None, prefix='.download.'):
+        """流式下载单张图片到目录下的临时文件，边写边计算SHA-256
+
+        响应体按块写入临时文件，首块即校验文件头，
+        HTML错误页或SVG占位图在读到几个字节后就会中止。
+
+        Returns:
+            dict: {'path', 'size', 'format', 'sha256', 'content_type'}；失败返回None（临时文件已删除）
+        """
+        tmp_path = None
+        try:
+            print(f"正在下载图片: {image_url[:50]}...")
+
+            with self.session.get(image_url, cookies=cookies, timeout=self.timeout, stream=True) as response:
+                if response.status_code != 200:
+                    print(f"❌ 下载图片失败，状态码: {response.status_code}")
+                    return None
+
+                content_type = response.headers.get('content-type', '')
+                print(f"响应状态: {response.status_code}")
+                print(f"内容类型: {content_type}")
+
+                if 'image' not in content_type:
+                    print(f"❌ 下载的文件不是有效图片 (类型: {content_type})")
+                    return None
+
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix='.part')
+
+                digest = hashlib.sha256()
+                image_format = None
+                content_length = 0
+                head = b''
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if not chunk:
+                            continue
+                        # 凑够文件头字节后立即校验格式
+                        if head is not None:
+                            head += chunk
+                            if len(head) < SIGNATURE_BYTES:
+                                continue
+                            image_format = detect_image_format(head)
+                            if not image_format:
+                                print(f"❌ 未识别的图片格式，文件头: {head[:16].hex()}，中止下载")
+                                return None
+                            chunk, head = head, None
+                        f.write(chunk)
+                        digest.update(chunk)
+                        content_length += len(chunk)
+
+                    # 响应体不足文件头长度
+                    if head is not None:
+                        image_format = detect_image_format(head)
+                        if not image_format:
+                            print(f"❌ 未识别的图片格式，文件头: {head[:16].hex()}")
+                            return None
+                        f.write(head)
+                        digest.update(head)
+                        content_length += len(head)
+
+            print(f"文件大小: {content_length} 字节")
+
+            # 验证是否为有效图片（大小应该大于10KB）
+            if content_length <= self.min_size:
+                print(f"❌ 下载的文件不是有效图片 (大小: {content_length} 字节, 类型: {content_type})")
+                return None
+
+            result = {'path': tmp_path, 'size': content_length, 'format': image_format,
+                      'sha256': digest.hexdigest(), 'content_type': content_type}
+            tmp_path = None
+            return result
+
+        except Exception as e:
+            print(f"❌ 下载图片时出现错误: {e}")
+            return None
+
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def download(self, image_url, filename, cookies=None):
+        """流式下载单张图片，成功返回True
+
+        先写入同目录下的临时文件，全部写完并通过校验后再原子地重命名为目标文件。
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        result = self.fetch_to_temp(image_url, directory, cookies, prefix='.' + os.path.basename(filename) + '.')
+        if not result:
+            return False
+
+        try:
+            os.replace(result['path'], filename)
+        except Exception as e:
+            print(f"❌ 保存图片时出现错误: {e}")
+            os.remove(result['path'])
+            return False
+        print(f"✅ 图片已保存为: {filename} (大小: {result['size']/1024:.1f}KB)")
+        return True
+
+    def submit(self, image_url, filename, cookies=None):
+        """提交后台下载任务，返回Future"""
+        return self.executor.submit(self.download, image_url, filename, cookies)
+
+    def download_many(self, items, cookies=None):
+        """并行下载多张图片
+
+        Args:
+            items (list): (image_url, filename) 元组列表
+            cookies (dict): 所有请求共用的cookies
+
+        Returns:
+            list: 与items顺序一致的下载结果（True/False）
+        """
+        futures = [self.submit(url, filename, cookies) for url, filename in items]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """关闭线程池和连接池"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self.executor.shutdown(wait=True)
+        self.session.close()
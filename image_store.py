@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import threading
+import time
+
+from image_url_rewriter import OriginalUrlRewriter, extract_object_id
+
+
+# 图片格式对应的文件扩展名
+FORMAT_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+    'AVIF': 'avif',
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    format TEXT,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    object_key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    prompt TEXT NOT NULL DEFAULT '',
+    sha256 TEXT NOT NULL REFERENCES blobs (sha256),
+    created_at REAL NOT NULL,
+    UNIQUE (object_key, prompt)
+);
+CREATE INDEX IF NOT EXISTS refs_object_key ON refs (object_key);
+"""
+
+
+def object_key(url):
+    """计算图片对象的稳定键，与签名参数无关
+
+    豆包图片使用 image_skill 对象ID加处理参数（~tplv-...），同一对象的原图和缩略图是不同的键；
+    其他URL使用去掉签名参数后的URL。
+    """
+    object_id = extract_object_id(url)
+    if not object_id:
+        return OriginalUrlRewriter.cache_key(url)
+    path = url.split('?', 1)[0]
+    tilde = path.find('~')
+    return object_id + (path[tilde:] if tilde != -1 else '')
+
+
+class ImageStore:
+    """按内容寻址的图片仓库
+
+    图片以SHA-256命名，存放在 objects/ab/cd/<sha256>.<ext> 分片目录中，相同内容只保存一份；
+    index.db 记录 提示词 + 图片对象 → 内容哈希 的映射。下载前先按对象键查找，
+    已经保存过的图片直接复用，重新运行或批次重叠时不再消耗带宽和磁盘。
+    索引中只保存内容哈希和格式，文件路径由 blob_path() 按当前根目录重建，
+    从其他工作目录打开或整体移动仓库后仍然有效。
+    """
+    def __init__(self, root='image_store'):
+        """打开（或创建）图片仓库
+
+        Args:
+            root (str): 仓库根目录
+        """
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, 'index.db'), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+
+    def blob_path(self, sha256, image_format=None):
+        """内容哈希对应的分片存储路径"""
+        extension = FORMAT_EXTENSIONS.get(image_format, 'bin')
+        return os.path.join(self.objects_dir, sha256[:2], sha256[2:4], f"{sha256}.{extension}")
+
+    def lookup(self, url):
+        """按图片对象查找已保存的文件，未保存或文件已丢失时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT blobs.sha256, blobs.format FROM refs JOIN blobs ON refs.sha256 = blobs.sha256 '
+                'WHERE refs.object_key = ? LIMIT 1', (object_key(url),)
+            ).fetchone()
+        if row:
+            path = self.blob_path(*row)
+            if os.path.exists(path):
+                return row[0], path
+        return None
+
+    def add_ref(self, url, sha256, prompt=None):
+        """记录 提示词 + 图片对象 → 内容哈希 的映射
+
+        没有提示词时记为空字符串而不是NULL，重复获取同一对象只更新同一行。
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO refs (object_key, url, prompt, sha256, created_at) VALUES (?, ?, ?, ?, ?)',
+                (object_key(url), url, prompt or '', sha256, time.time())
+            )
+
+    def add_file(self, tmp_path, sha256, image_format, size, url, prompt=None):
+        """把下载好的临时文件放入仓库，内容已存在时丢弃临时文件，返回仓库中的路径"""
+        with self._lock:
+            row = self._conn.execute('SELECT format FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        if row and os.path.exists(self.blob_path(sha256, row[0])):
+            os.remove(tmp_path)
+            path = self.blob_path(sha256, row[0])
+            print(f"♻️ 内容已存在，复用: {path}")
+        else:
+            path = self.blob_path(sha256, image_format)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            with self._lock, self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO blobs (sha256, format, size, created_at) VALUES (?, ?, ?, ?)',
+                    (sha256, image_format, size, time.time())
+                )
+            print(f"✅ 图片已存入仓库: {path} (大小: {size/1024:.1f}KB)")
+        self.add_ref(url, sha256, prompt)
+        return path
+
+    def fetch(self, downloader, url, prompt=None, cookies=None):
+        """获取图片：已保存的对象直接返回路径，否则下载后存入仓库；失败返回None
+
+        Args:
+            downloader (ImageDownloader): 共享下载引擎
+            url (str): 图片URL
+            prompt (str): 生成该图片的提示词，写入索引
+            cookies: 下载请求使用的cookies
+        """
+        stored = self.lookup(url)
+        if stored:
+            sha256, path = stored
+            self.add_ref(url, sha256, prompt)
+            print(f"⏭️ 图片已在仓库中，跳过下载: {path}")
+            return path
+
+        result = downloader.fetch_to_temp(url, self.tmp_dir, cookies)
+        if not result:
+            return None
+        try:
+            return self.add_file(result['path'], result['sha256'], result['format'], result['size'], url, prompt)
+        except Exception as e:
+            print(f"❌ 存入图片仓库时出现错误: {e}")
+            if os.path.exists(result['path']):
+                os.remove(result['path'])
+            return None
+
+    def fetch_many(self, downloader, urls, prompt=None, cookies=None):
+        """在下载引擎的线程池中并行获取多张图片，返回与urls顺序一致的路径列表（失败为None）"""
+        futures = [downloader.executor.submit(self.fetch, downloader, url, prompt, cookies) for url in urls]
+        return [future.result() for future in futures]
+
+    def files_for_prompt(self, prompt):
+        """列出某个提示词对应的所有已保存文件"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT blobs.sha256, blobs.format FROM refs JOIN blobs ON refs.sha256 = blobs.sha256 '
+                'WHERE refs.prompt = ? ORDER BY refs.id', (prompt,)
+            ).fetchall()
+        return list(dict.fromkeys(self.blob_path(*row) for row in rows))
+
+    def close(self):
+        """关闭索引数据库"""
+        with self._lock:
+            self._conn.close()
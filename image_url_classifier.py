@@ -0,0 +1,131 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+
+# 分类原因
+REASON_EMPTY = 'empty'                      # 空值或非字符串
+REASON_EXCLUDED = 'excluded'                # 路径命中排除关键词（SVG、头像、图标、logo、占位符等）
+REASON_GENERATED = 'generated'              # 豆包生成图片特征（byteimg.com + image_skill、tplv-、水印等）
+REASON_DOUBAO = 'doubao_host'               # 豆包/字节相关域名或路径
+REASON_IMAGE_EXTENSION = 'image_extension'  # 常见图片扩展名
+REASON_IMAGE_HINT = 'image_hint'            # 图片相关关键词（image、img、photo等）
+REASON_UNKNOWN = 'unknown'
+
+UrlClassification = namedtuple(
+    'UrlClassification',
+    ['reason', 'keyword', 'http', 'generated', 'doubao', 'image_extension', 'image_hint']
+)
+
+# 排除关键词：只在路径部分（?之前）匹配，避免签名参数中的随机字符误判
+EXCLUDE_KEYWORDS = [
+    'data:image/svg+xml', '.svg', 'avatar', 'icon', 'logo', 'placeholder',
+    'loading', 'default', 'thumb_', 'profile', 'banner', 'background',
+]
+# 单独出现即可判定为豆包生成图片的特征
+GENERATED_KEYWORDS = [
+    'flow-imagex-sign.byteimg.com', 'ocean-cloud-tos', 'tplv-', 'web-thumb-watermark', 'web-watermark',
+]
+# 需要同时出现的特征组合
+GENERATED_KEYWORD_PAIRS = [
+    ('byteimg.com', 'image_skill'),
+    ('doubao', 'generated'),
+    ('bytedance', 'ai'),
+]
+DOUBAO_KEYWORDS = ['doubao', 'bytedance', 'mcs']
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp', '.avif']
+IMAGE_HINT_KEYWORDS = ['image', 'img', 'photo', 'picture', 'generated']
+
+# is_generated_image_url 的规则，作为参数传给页面内的图片监听器，页面内外使用同一份关键词
+GENERATED_URL_RULES = {
+    'exclude': EXCLUDE_KEYWORDS,
+    'generated': GENERATED_KEYWORDS,
+    'generatedPairs': [list(pair) for pair in GENERATED_KEYWORD_PAIRS],
+    'doubao': DOUBAO_KEYWORDS,
+}
+
+
+def _alternation(keywords):
+    """把关键词列表编译为一个交替正则（长关键词优先）"""
+    return re.compile('|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)))
+
+
+_EXCLUDE_RE = _alternation(EXCLUDE_KEYWORDS)
+_GENERATED_RE = _alternation(GENERATED_KEYWORDS)
+_DOUBAO_RE = _alternation(DOUBAO_KEYWORDS)
+_EXTENSION_RE = _alternation(IMAGE_EXTENSIONS)
+_HINT_RE = _alternation(IMAGE_HINT_KEYWORDS)
+
+_EMPTY = UrlClassification(REASON_EMPTY, None, False, False, False, False, False)
+
+
+@lru_cache(maxsize=8192)
+def _classify(url):
+    """对单个非空URL分类（结果按URL缓存，页面轮询和日志中重复出现的URL只计算一次）"""
+    lower = url.lower()
+    path = lower.split('?', 1)[0]
+
+    excluded = _EXCLUDE_RE.search(path)
+    generated = bool(_GENERATED_RE.search(lower)) or any(
+        a in lower and b in lower for a, b in GENERATED_KEYWORD_PAIRS
+    )
+    doubao = bool(_DOUBAO_RE.search(lower))
+    image_extension = bool(_EXTENSION_RE.search(lower))
+    image_hint = bool(_HINT_RE.search(lower))
+
+    if excluded:
+        reason = REASON_EXCLUDED
+    elif generated:
+        reason = REASON_GENERATED
+    elif doubao:
+        reason = REASON_DOUBAO
+    elif image_extension:
+        reason = REASON_IMAGE_EXTENSION
+    elif image_hint:
+        reason = REASON_IMAGE_HINT
+    else:
+        reason = REASON_UNKNOWN
+
+    return UrlClassification(reason, excluded.group() if excluded else None, url.startswith('http'),
+                             generated, doubao, image_extension, image_hint)
+
+
+def classify(url):
+    """对单个URL分类，返回 UrlClassification"""
+    if not url or not isinstance(url, str):
+        return _EMPTY
+    return _classify(url)
+
+
+def classify_many(urls):
+    """批量分类，返回与输入顺序一致的结果列表；批内重复的URL只分类一次"""
+    results = {}
+    classified = []
+    for url in urls:
+        if not url or not isinstance(url, str):
+            classified.append(_EMPTY)
+            continue
+        result = results.get(url)
+        if result is None:
+            result = results[url] = _classify(url)
+        classified.append(result)
+    return classified
+
+
+def is_generated_image_url(url):
+    """是否为豆包生成图片的候选URL（页面扫描时使用）"""
+    result = classify(url)
+    return result.http and result.reason != REASON_EXCLUDED and (result.generated or result.doubao)
+
+
+def is_likely_generated_image(url):
+    """是否可能是生成的图片（允许通用图片扩展名）"""
+    result = classify(url)
+    return result.reason not in (REASON_EMPTY, REASON_EXCLUDED) and (result.generated or result.image_extension)
+
+
+def is_valid_image_url(url):
+    """是否为有效的图片URL"""
+    result = classify(url)
+    return (result.http and result.reason != REASON_EXCLUDED and
+            (result.generated or result.doubao or result.image_extension or result.image_hint))
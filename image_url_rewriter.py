@@ -0,0 +1,164 @@
+import re
+import threading
+from collections import OrderedDict
+
+
+# 缩略图/水印标识，按长度从长到短排列，单个正则一次替换
+_THUMB_TOKEN_RE = re.compile(
+    r'-web-thumb-watermark-v2|-web-thumb-watermark|-web-thumb-wm|-watermark-v2|-watermark|-thumb|-wm'
+)
+
+# URL末尾的格式后缀：-avif.avif / -webp.webp 直接去掉，.avif / .webp 改为 .jpeg（保留格式时不改）
+_FORMAT_SUFFIX_RE = re.compile(r'(?:-(avif|webp)\.\1|\.(?:avif|webp))$')
+
+# 需要从查询参数中移除的尺寸、质量、格式和签名参数
+_DIGIT_PARAMS = frozenset(['w', 'h', 's', 'size', 'quality'])
+_WORD_PARAMS = frozenset(['format', 'f'])
+_SIGNATURE_PARAMS = frozenset(['rk3s', 'x-expires', 'x-signature'])
+_WORD_VALUE_RE = re.compile(r'\w+')
+
+# 缓存键：去掉每次重新签名都会变化的参数，同一对象的不同签名URL共用一条缓存
+_SIGNATURE_PARAM_RE = re.compile(r'(?:rk3s|x-expires|x-signature)=[^&#]*')
+
+_OBJECT_ID_RE = re.compile(r'image_skill/([^~?#/.]+)')
+
+_BASE_URL_RE = re.compile(r'(https://[^~?]+)')
+_IMAGE_ID_RE = re.compile(r'image_skill/([^~]+)')
+_DOMAIN_RE = re.compile(r'(https://[^/]+)')
+
+
+def extract_object_id(url):
+    """从URL中提取 image_skill 对象ID，不是豆包生成图片URL时返回None"""
+    if not url:
+        return None
+    match = _OBJECT_ID_RE.search(url)
+    return match.group(1) if match else None
+
+
+def _keep_param(param):
+    """判断查询参数是否保留"""
+    if not param:
+        return False
+    key, _, value = param.partition('=')
+    if 'tplv' in param or key in _SIGNATURE_PARAMS:
+        return False
+    if key in _DIGIT_PARAMS and value.isdigit():
+        return False
+    if key in _WORD_PARAMS and _WORD_VALUE_RE.fullmatch(value):
+        return False
+    return True
+
+
+def _convert(thumbnail_url, keep_format=False):
+    """单遍将缩略图URL改写为原图URL（不带缓存）
+
+    keep_format 为True时不把 .avif/.webp 改写为 .jpeg，直接取CDN原有格式（由本地转码阶段统一格式）。
+    """
+    base, has_query, query = thumbnail_url.partition('?')
+
+    # 移除整个tplv处理段
+    tplv = base.find('~tplv-')
+    if tplv != -1:
+        base = base[:tplv]
+
+    # 移除水印和缩略图标识
+    base = _THUMB_TOKEN_RE.sub('', base)
+
+    if has_query:
+        # 移除尺寸、质量、格式、签名和tplv参数
+        params = [param for param in query.split('&') if _keep_param(param)]
+        if params:
+            base = base + '?' + '&'.join(params)
+    else:
+        # 移除或转换格式后缀
+        base = _FORMAT_SUFFIX_RE.sub(lambda m: '' if m.group(1) else (m.group(0) if keep_format else '.jpeg'), base)
+
+    if base != thumbnail_url:
+        return base
+
+    # 常规转换无效时提取基础URL
+    base_match = _BASE_URL_RE.match(thumbnail_url)
+    if base_match:
+        base_url = base_match.group(1)
+        if not keep_format and not base_url.endswith(('.jpg', '.jpeg', '.png')):
+            base_url += '.jpeg'
+        return base_url
+
+    # 从缩略图URL中提取图片ID手动构建
+    id_match = _IMAGE_ID_RE.search(thumbnail_url)
+    domain_match = _DOMAIN_RE.match(thumbnail_url)
+    if id_match and domain_match:
+        return f"{domain_match.group(1)}/ocean-cloud-tos/image_skill/{id_match.group(1)}.jpeg"
+
+    return thumbnail_url
+
+
+class OriginalUrlRewriter:
+    """缩略图URL到原图URL的改写器，带有界LRU缓存
+
+    缓存键为去掉签名参数后的URL，即 image_skill 对象路径加处理参数，
+    同一张图片重新签名后的URL也能命中缓存。
+    """
+    def __init__(self, maxsize=4096):
+        """初始化改写器
+
+        Args:
+            maxsize (int): LRU缓存的最大条目数
+        """
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cache_key(thumbnail_url):
+        """计算缓存键"""
+        return _SIGNATURE_PARAM_RE.sub('', thumbnail_url)
+
+    def convert(self, thumbnail_url, keep_format=False):
+        """将单个缩略图URL改写为原图URL"""
+        if not thumbnail_url:
+            return thumbnail_url
+
+        key = (self.cache_key(thumbnail_url), keep_format)
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return result
+
+        result = _convert(thumbnail_url, keep_format)
+
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = result
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return result
+
+    def convert_many(self, thumbnail_urls):
+        """批量改写，返回与输入顺序一致的列表"""
+        return [self.convert(url) for url in thumbnail_urls]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# 模块级共享实例
+default_rewriter = OriginalUrlRewriter()
+
+
+def convert_to_original_url(thumbnail_url, keep_format=False):
+    """将缩略图URL改写为原图URL（使用共享缓存）"""
+    return default_rewriter.convert(thumbnail_url, keep_format)
+
+
+def convert_many(thumbnail_urls):
+    """批量将缩略图URL改写为原图URL（使用共享缓存）"""
+    return default_rewriter.convert_many(thumbnail_urls)
@@ -0,0 +1,236 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+# 任务状态
+STATE_PENDING = 'pending'        # 尚未提交
+STATE_SUBMITTED = 'submitted'    # 提示词已发送，等待生成结果
+STATE_GENERATED = 'generated'    # 已拿到页面上的图片URL
+STATE_RESOLVED = 'resolved'      # 已解析出原图URL
+STATE_DOWNLOADED = 'downloaded'  # 图片已全部保存
+STATE_FAILED = 'failed'          # 某个阶段失败，failed_stage 记录失败的阶段
+
+# 失败阶段，以及重试该阶段时回退到的状态
+STAGE_GENERATE = 'generate'
+STAGE_RESOLVE = 'resolve'
+STAGE_DOWNLOAD = 'download'
+RETRY_STATES = {
+    STAGE_GENERATE: STATE_PENDING,
+    STAGE_RESOLVE: STATE_GENERATED,
+    STAGE_DOWNLOAD: STATE_RESOLVED,
+}
+
+# 任务当前状态 -> 在该状态出错时失败的阶段
+CURRENT_STAGES = {
+    STATE_PENDING: STAGE_GENERATE,
+    STATE_SUBMITTED: STAGE_GENERATE,
+    STATE_GENERATED: STAGE_RESOLVE,
+    STATE_RESOLVED: STAGE_DOWNLOAD,
+}
+
+_JSON_FIELDS = ('image_urls', 'original_urls', 'downloaded_files')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt_index INTEGER NOT NULL,
+    prompt TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    image_urls TEXT NOT NULL DEFAULT '[]',
+    original_urls TEXT NOT NULL DEFAULT '[]',
+    downloaded_files TEXT NOT NULL DEFAULT '[]',
+    failed_stage TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (prompt_index, prompt)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+
+class JobStore:
+    """基于SQLite的持久化提示词任务队列
+
+    每个提示词是一条任务，按 pending → submitted → generated → resolved → downloaded
+    推进，每个阶段完成后立即提交事务。进程中断后重新打开同一个数据库即可继续，
+    已完成的任务会被跳过；失败的任务只重试失败的那个阶段（例如只重新下载）。
+    """
+    def __init__(self, path='image_jobs.db'):
+        """打开（或创建）任务数据库
+
+        Args:
+            path (str): SQLite数据库文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+
+    def add_prompts(self, prompts, start=0, retry_failed=False):
+        """登记一批提示词，已存在的（相同序号和内容）保持原状态，返回对应的任务ID列表
+
+        Args:
+            prompts (list): 提示词列表
+            start (int): 第一个提示词的序号，流式逐个登记时传入提示词在输入中的位置
+            retry_failed (bool): 是否把这些提示词中之前失败的任务回退到失败阶段之前重新执行
+        """
+        now = time.time()
+        job_ids = []
+        with self._lock, self._conn:
+            for index, prompt in enumerate(prompts, start):
+                self._conn.execute(
+                    'INSERT OR IGNORE INTO jobs (prompt_index, prompt, created_at, updated_at) VALUES (?, ?, ?, ?)',
+                    (index, prompt, now, now)
+                )
+                row = self._conn.execute(
+                    'SELECT id FROM jobs WHERE prompt_index = ? AND prompt = ?', (index, prompt)
+                ).fetchone()
+                job_ids.append(row['id'])
+        if retry_failed:
+            retried = self.retry_failed(job_ids=job_ids)
+            if retried:
+                print(f"🔁 重试失败任务 {retried} 个")
+        return job_ids
+
+    def _to_job(self, row):
+        """把数据库行转换为字典，JSON字段解码为列表"""
+        job = dict(row)
+        for field in _JSON_FIELDS:
+            job[field] = json.loads(job[field])
+        return job
+
+    def get(self, job_id):
+        """读取单个任务，不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def jobs(self, states=None):
+        """按提示词序号列出任务，可按状态过滤"""
+        query = 'SELECT * FROM jobs'
+        params = ()
+        if states:
+            query += ' WHERE state IN (%s)' % ','.join('?' * len(states))
+            params = tuple(states)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY prompt_index, id', params).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def update(self, job_id, state, **fields):
+        """推进任务状态并保存该阶段的产出（立即提交）"""
+        for field in _JSON_FIELDS:
+            if field in fields:
+                fields[field] = json.dumps(fields[field], ensure_ascii=False)
+        fields.update(state=state, updated_at=time.time())
+        if state != STATE_FAILED:
+            fields.setdefault('failed_stage', None)
+            fields.setdefault('error', None)
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def mark_submitted(self, job_id):
+        """标记提示词已发送，并累计尝试次数"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE jobs SET state = ?, attempts = attempts + 1, failed_stage = NULL, error = NULL, '
+                'updated_at = ? WHERE id = ?',
+                (STATE_SUBMITTED, time.time(), job_id)
+            )
+
+    def fail(self, job_id, stage, error, **fields):
+        """记录任务在某个阶段失败"""
+        self.update(job_id, STATE_FAILED, failed_stage=stage, error=str(error)[:1000], **fields)
+
+    def fail_current_stage(self, job_id, error):
+        """任务推进中出现意外异常时，按任务当前所处的状态记录失败阶段
+
+        已拿到生成结果的任务不会被记为生成失败，重试时只重新解析或下载，不会重新提交提示词；
+        已完成或已记录失败的任务保持原状态。
+        """
+        job = self.get(job_id)
+        if job is None or job['state'] not in CURRENT_STAGES:
+            return
+        self.fail(job_id, CURRENT_STAGES[job['state']], error)
+
+    def retry_failed(self, stages=None, job_ids=None):
+        """把失败任务回退到失败阶段之前的状态，返回重新排队的任务数
+
+        Args:
+            stages (list): 只重试这些阶段的失败（generate/resolve/download），None表示全部
+            job_ids (list): 只重试这些任务，None表示库中所有失败任务（包括之前其他批次的）
+        """
+        if job_ids is None:
+            jobs = self.jobs([STATE_FAILED])
+        else:
+            jobs = [job for job in map(self.get, job_ids) if job and job['state'] == STATE_FAILED]
+        count = 0
+        for job in jobs:
+            stage = job['failed_stage'] or STAGE_GENERATE
+            if stages and stage not in stages:
+                continue
+            self.update(job['id'], RETRY_STATES.get(stage, STATE_PENDING))
+            count += 1
+        return count
+
+    def recover_interrupted(self):
+        """进程中断时停留在 submitted 的任务无法找回页面结果，回退为 pending 重新生成"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET state = ?, updated_at = ? WHERE state = ?',
+                (STATE_PENDING, time.time(), STATE_SUBMITTED)
+            )
+        return cursor.rowcount
+
+    def open_batch(self, prompts, retry_failed=False):
+        """登记一批提示词并准备续跑，返回与提示词顺序一致的任务ID列表
+
+        Args:
+            prompts (list): 提示词列表
+            retry_failed (bool): 是否把失败任务回退到失败阶段之前重新执行
+        """
+        self.resume()
+        return self.add_prompts(prompts, retry_failed=retry_failed)
+
+    def resume(self):
+        """续跑前的准备：恢复中断的任务并打印任务统计
+
+        流式处理时先调用本方法，再用 add_prompts 逐个登记提示词；失败任务的重试由 add_prompts
+        按提示词进行，只涉及本批次的提示词，共用任务库时不会重新执行其他批次失败的任务。
+
+        Returns:
+            int: 恢复的中断任务数
+        """
+        recovered = self.recover_interrupted()
+        counts = self.counts()
+        print(f"📋 任务库 {self.path}: {counts}"
+              f"{f'，恢复中断任务 {recovered} 个' if recovered else ''}")
+        return recovered
+
+    def counts(self):
+        """各状态的任务数量"""
+        with self._lock:
+            rows = self._conn.execute('SELECT state, COUNT(*) AS n FROM jobs GROUP BY state').fetchall()
+        return {row['state']: row['n'] for row in rows}
+
+    @staticmethod
+    def to_result(job):
+        """转换为 generate_images 原有的结果记录格式"""
+        return {
+            'prompt': job['prompt'],
+            'success': job['state'] == STATE_DOWNLOADED,
+            'image_urls': job['original_urls'] or job['image_urls'],
+            'downloaded_files': job['downloaded_files'],
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,202 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+
+# 耗时直方图的桶上限（秒），覆盖从单次chromedriver往返到完整生成等待
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 阶段名称
+STAGE_INPUT_LOOKUP = 'input_lookup'        # 查找输入框
+STAGE_SUBMIT = 'submit'                    # 输入并发送提示词
+STAGE_GENERATION_WAIT = 'generation_wait'  # 等待生成完成
+STAGE_IMAGE_SCAN = 'image_scan'            # 扫描页面图片
+STAGE_URL_RESOLUTION = 'url_resolution'    # 缩略图解析为原图URL
+STAGE_DOWNLOAD = 'download'                # 单张图片下载
+STAGE_DOWNLOAD_BATCH = 'download_batch'    # 一批图片下载
+STAGE_TRANSCODE = 'transcode'              # 一批图片本地转码
+
+
+class Span:
+    """一次阶段执行的计时记录，在 with 块内可设置结果和字节数"""
+    def __init__(self, metrics, stage, labels):
+        self.metrics = metrics
+        self.stage = stage
+        self.labels = labels
+        self.outcome = 'ok'
+        self.bytes = 0
+        self.start = None
+        self.duration = None
+
+    def set(self, outcome=None, bytes=None, **labels):
+        """设置结果（ok/failed/timeout等）、字节数和附加标签"""
+        if outcome is not None:
+            self.outcome = outcome
+        if bytes is not None:
+            self.bytes = bytes
+        self.labels.update(labels)
+        return self
+
+    def __enter__(self):
+        self.start = time.time()
+        self._perf_start = time.perf_counter()
+        return self
+
+    def begin(self):
+        """开始计时（用于不便改写为 with 块的长流程）"""
+        return self.__enter__()
+
+    def end(self, outcome=None, bytes=None, **labels):
+        """结束计时并记录，重复调用时只记录一次"""
+        if self.duration is None:
+            self.set(outcome, bytes, **labels)
+            self.__exit__(None, None, None)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._perf_start
+        if exc_type is not None:
+            self.outcome = 'error'
+            self.labels.setdefault('error', exc_type.__name__)
+        self.metrics.record(self)
+        return False
+
+
+class _StageStats:
+    """单个 (阶段, 结果) 的聚合数据"""
+    def __init__(self, reservoir_size):
+        self.count = 0
+        self.total = 0.0
+        self.bytes = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.recent = deque(maxlen=reservoir_size)
+
+
+class Metrics:
+    """分阶段计时与指标导出
+
+    每个阶段用 span() 包裹，结束时记录耗时、结果和字节数：
+    写入JSON Lines文件（每个span一行），并聚合为Prometheus直方图，
+    flush() 时以textfile格式原子写出，供node_exporter的textfile收集器读取。
+    两个输出路径都为None时只在内存中聚合。
+    """
+    def __init__(self, jsonl_path=None, prometheus_path=None, prefix='doubao', reservoir_size=10000):
+        """初始化指标收集器
+
+        Args:
+            jsonl_path (str): JSON Lines输出文件（追加写入）
+            prometheus_path (str): Prometheus textfile输出路径
+            prefix (str): 指标名前缀
+            reservoir_size (int): 每个阶段保留的最近耗时样本数，用于计算分位数
+        """
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.prefix = prefix
+        self.reservoir_size = reservoir_size
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._jsonl = open(jsonl_path, 'a', encoding='utf-8', buffering=1) if jsonl_path else None
+
+    def span(self, stage, **labels):
+        """创建阶段计时span，用法: with metrics.span('download') as span: ..."""
+        return Span(self, stage, labels)
+
+    def record(self, span):
+        """记录一个已结束的span"""
+        with self._lock:
+            stats = self._stats.get((span.stage, span.outcome))
+            if stats is None:
+                stats = self._stats[(span.stage, span.outcome)] = _StageStats(self.reservoir_size)
+            stats.count += 1
+            stats.total += span.duration
+            stats.bytes += span.bytes or 0
+            stats.recent.append(span.duration)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.duration <= bound:
+                    stats.buckets[i] += 1
+
+            if self._jsonl:
+                event = {
+                    'ts': round(span.start, 3),
+                    'stage': span.stage,
+                    'duration': round(span.duration, 6),
+                    'outcome': span.outcome,
+                    'bytes': span.bytes,
+                }
+                if span.labels:
+                    event['labels'] = span.labels
+                self._jsonl.write(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+
+    def summary(self):
+        """各阶段的次数、平均耗时和P50/P99（秒），按 阶段/结果 汇总"""
+        result = {}
+        with self._lock:
+            for (stage, outcome), stats in sorted(self._stats.items()):
+                recent = sorted(stats.recent)
+                result[f"{stage}/{outcome}"] = {
+                    'count': stats.count,
+                    'mean': stats.total / stats.count,
+                    'p50': recent[int(0.5 * (len(recent) - 1))],
+                    'p99': recent[int(0.99 * (len(recent) - 1))],
+                    'bytes': stats.bytes,
+                }
+        return result
+
+    def print_summary(self):
+        """打印各阶段耗时汇总"""
+        summary = self.summary()
+        if not summary:
+            return
+        print("📊 阶段耗时汇总:")
+        for key, stats in summary.items():
+            size = f", {stats['bytes']/1024:.1f}KB" if stats['bytes'] else ''
+            print(f"  {key}: {stats['count']} 次, 平均 {stats['mean']:.3f}s, "
+                  f"P50 {stats['p50']:.3f}s, P99 {stats['p99']:.3f}s{size}")
+
+    def render_prometheus(self):
+        """生成Prometheus textfile格式的文本"""
+        duration = f"{self.prefix}_stage_duration_seconds"
+        transferred = f"{self.prefix}_stage_bytes_total"
+        lines = [
+            f"# HELP {duration} Duration of each pipeline stage.",
+            f"# TYPE {duration} histogram",
+        ]
+        byte_lines = [
+            f"# HELP {transferred} Bytes transferred by each pipeline stage.",
+            f"# TYPE {transferred} counter",
+        ]
+        with self._lock:
+            for (stage, outcome), stats in sorted(self._stats.items()):
+                labels = f'stage="{stage}",outcome="{outcome}"'
+                for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                    lines.append(f'{duration}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{duration}_bucket{{{labels},le="+Inf"}} {stats.count}')
+                lines.append(f'{duration}_sum{{{labels}}} {stats.total:.6f}')
+                lines.append(f'{duration}_count{{{labels}}} {stats.count}')
+                if stats.bytes:
+                    byte_lines.append(f'{transferred}{{{labels}}} {stats.bytes}')
+        return '\n'.join(lines + byte_lines) + '\n'
+
+    def flush(self):
+        """写出Prometheus textfile（先写临时文件再重命名，收集器不会读到半个文件）"""
+        if not self.prometheus_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.prometheus_path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics.', suffix='.prom')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_path, self.prometheus_path)
+        except Exception as e:
+            print(f"⚠️ 写出指标文件失败: {e}")
+
+    def close(self):
+        """写出最终指标并关闭JSON Lines文件"""
+        self.flush()
+        with self._lock:
+            if self._jsonl:
+                self._jsonl.close()
+                self._jsonl = None
@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+import requests
+import websocket
+
+from image_url_rewriter import extract_object_id
+
+
+class NetworkImageCapture:
+    """后台CDP网络监听器
+
+    通过 chromedriver 暴露的 debuggerAddress 直接连接浏览器的DevTools websocket，
+    自动附加到所有页面（含之后新开的标签页），监听 Network.requestWillBeSent /
+    responseReceived / loadingFinished 事件，按 image_skill 对象ID实时索引图片请求。
+    监听在独立线程中运行，不占用非线程安全的WebDriver。
+    """
+    def __init__(self, debugger_address, max_objects=2048):
+        """初始化监听器
+
+        Args:
+            debugger_address (str): 浏览器调试地址，如 localhost:9222
+            max_objects (int): 最多保留的图片对象数，超出时丢弃最早的对象
+        """
+        self.debugger_address = debugger_address
+        self.max_objects = max_objects
+        self._ws = None
+        self._thread = None
+        self._send_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._next_id = 0
+        self._sessions = set()
+        self._targets = set()
+        self._requests = {}
+        self._objects = {}
+        self.running = False
+
+    @classmethod
+    def for_driver(cls, driver, **kwargs):
+        """根据WebDriver的capabilities创建监听器"""
+        debugger_address = driver.capabilities.get('goog:chromeOptions', {}).get('debuggerAddress')
+        if not debugger_address:
+            raise Exception("浏览器未暴露debuggerAddress")
+        return cls(debugger_address, **kwargs)
+
+    def start(self):
+        """连接浏览器并启动后台监听线程"""
+        version = requests.get(f"http://{self.debugger_address}/json/version", timeout=5).json()
+        self._ws = websocket.create_connection(version['webSocketDebuggerUrl'], suppress_origin=True)
+        self.running = True
+
+        self._thread = threading.Thread(target=self._run, name='cdp-network-capture', daemon=True)
+        self._thread.start()
+
+        # 发现并附加到所有页面目标
+        self._send('Target.setDiscoverTargets', {'discover': True})
+        return self
+
+    def stop(self):
+        """停止监听并关闭连接"""
+        self.running = False
+        if self._ws:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def _send(self, method, params=None, session_id=None):
+        """发送CDP命令（不等待响应）"""
+        with self._send_lock:
+            self._next_id += 1
+            message = {'id': self._next_id, 'method': method, 'params': params or {}}
+            if session_id:
+                message['sessionId'] = session_id
+            self._ws.send(json.dumps(message))
+
+    def _run(self):
+        """后台线程：读取并分发CDP事件"""
+        while self.running:
+            try:
+                message = json.loads(self._ws.recv())
+            except Exception:
+                break
+            method = message.get('method')
+            if method:
+                try:
+                    self._handle_event(method, message.get('params', {}), message.get('sessionId'))
+                except Exception as e:
+                    print(f"⚠️ 处理CDP事件 {method} 时出错: {e}")
+        self.running = False
+
+    def _handle_event(self, method, params, session_id):
+        """处理单个CDP事件"""
+        if method in ('Target.targetCreated', 'Target.targetInfoChanged'):
+            # chromedriver自身也附加在页面上，因此按我们自己附加过的targetId去重
+            target = params['targetInfo']
+            if target.get('type') == 'page' and target['targetId'] not in self._targets:
+                self._targets.add(target['targetId'])
+                self._send('Target.attachToTarget', {'targetId': target['targetId'], 'flatten': True})
+
+        elif method == 'Target.attachedToTarget':
+            new_session = params['sessionId']
+            if new_session not in self._sessions:
+                self._sessions.add(new_session)
+                self._send('Network.enable', {}, new_session)
+
+        elif method == 'Target.detachedFromTarget':
+            self._sessions.discard(params.get('sessionId'))
+
+        elif method == 'Target.targetDestroyed':
+            self._targets.discard(params.get('targetId'))
+
+        elif method == 'Network.requestWillBeSent':
+            url = params['request']['url']
+            object_id = extract_object_id(url)
+            if object_id:
+                self._requests[params['requestId']] = (object_id, url)
+                self._record(object_id, url)
+
+        elif method == 'Network.responseReceived':
+            response = params['response']
+            url = response['url']
+            object_id = extract_object_id(url)
+            if object_id:
+                self._requests[params['requestId']] = (object_id, url)
+                headers = {k.lower(): v for k, v in response.get('headers', {}).items()}
+                length = headers.get('content-length')
+                self._record(object_id, url,
+                             status=response.get('status'),
+                             mime_type=response.get('mimeType', ''),
+                             length=int(length) if length and length.isdigit() else None)
+
+        elif method == 'Network.loadingFinished':
+            entry = self._requests.pop(params['requestId'], None)
+            if entry:
+                self._record(entry[0], entry[1], length=int(params.get('encodedDataLength') or 0) or None)
+
+        elif method == 'Network.loadingFailed':
+            self._requests.pop(params['requestId'], None)
+
+    def _record(self, object_id, url, **fields):
+        """更新对象ID下某个URL的记录并唤醒等待者"""
+        with self._condition:
+            variants = self._objects.get(object_id)
+            if variants is None:
+                if len(self._objects) >= self.max_objects:
+                    self._objects.pop(next(iter(self._objects)))
+                variants = self._objects[object_id] = {}
+            record = variants.setdefault(url, {'url': url, 'status': None, 'mime_type': '', 'length': None})
+            for key, value in fields.items():
+                if value is not None:
+                    record[key] = value
+            record['timestamp'] = time.time()
+            self._condition.notify_all()
+
+    def get_variants(self, url_or_object_id):
+        """返回某个图片对象已捕获的所有URL记录"""
+        object_id = extract_object_id(url_or_object_id) or url_or_object_id
+        with self._condition:
+            return [dict(record) for record in self._objects.get(object_id, {}).values()]
+
+    def recent_responses(self, limit=None):
+        """按时间顺序返回已收到响应的图片请求，字段与CDP的response对象保持一致"""
+        with self._condition:
+            records = [record for variants in self._objects.values() for record in variants.values()
+                       if record['status'] is not None]
+        records.sort(key=lambda record: record['timestamp'])
+        if limit:
+            records = records[-limit:]
+        return [{'url': record['url'], 'status': record['status'], 'mimeType': record['mime_type'],
+                 'headers': {}} for record in records]
+
+    def lookup(self, thumbnail_url):
+        """查找缩略图对应的原图URL：优先无tplv处理参数或下载链接，其次体积最大者"""
+        candidates = []
+        for record in self.get_variants(thumbnail_url):
+            url = record['url']
+            if url == thumbnail_url or record['status'] not in (None, 200):
+                continue
+            if record['mime_type'] and not record['mime_type'].startswith('image/'):
+                continue
+            is_original = '~tplv-' not in url or 'download' in url.lower()
+            if is_original:
+                candidates.append((record['status'] == 200, record['length'] or 0, url))
+        if not candidates:
+            return None
+        return max(candidates)[2]
+
+    def wait_for_original(self, thumbnail_url, timeout=4):
+        """等待原图URL出现在网络请求中，出现后立即返回，超时返回None"""
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                url = self.lookup(thumbnail_url)
+                remaining = deadline - time.time()
+                if url or remaining <= 0 or not self.running:
+                    return url
+                self._condition.wait(remaining)
@@ -0,0 +1,152 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+from image_url_rewriter import extract_object_id
+
+
+# 获取原图成功的策略
+STRATEGY_NETWORK = 'network'                  # 后台网络监听索引
+STRATEGY_PICTURE = 'picture'                  # picture元素的source
+STRATEGY_ATTRIBUTE = 'attribute'              # 元素属性及URL改写
+STRATEGY_DOWNLOAD_BUTTON = 'download_button'  # 悬停后点击下载按钮
+STRATEGY_CONTEXT_MENU = 'context_menu'        # 右键菜单在新标签页打开
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resolutions (
+    object_id TEXT PRIMARY KEY,
+    original_url TEXT NOT NULL,
+    strategy TEXT,
+    expires_at REAL,
+    resolved_at REAL NOT NULL
+);
+"""
+
+
+def url_expires_at(url):
+    """读取签名URL的 x-expires 过期时间（Unix秒），没有签名时返回None"""
+    try:
+        values = parse_qs(urlsplit(url).query).get('x-expires')
+        return float(values[0]) if values else None
+    except (ValueError, TypeError):
+        return None
+
+
+class ResolutionCache:
+    """缩略图到原图URL的解析缓存，按 image_skill 对象ID索引
+
+    记录每个对象解析出的原图URL和成功的策略。带 x-expires 签名的URL在过期前
+    expiry_margin 秒即视为失效，需要重新解析；不带签名的URL长期有效。
+    path 为None时只缓存在内存中，否则同时写入SQLite，跨进程运行保留。
+    内存层是最多 maxsize 条的LRU，长时间运行的批次内存占用有上限；淘汰的条目仍可从SQLite读回。
+    """
+    def __init__(self, path=None, expiry_margin=60, maxsize=4096):
+        """初始化解析缓存
+
+        Args:
+            path (str): SQLite数据库文件路径，None表示只使用内存
+            expiry_margin (float): 签名过期前提前失效的秒数，保证取出的URL还来得及下载
+            maxsize (int): 内存LRU缓存的最大条目数
+        """
+        self.path = path
+        self.expiry_margin = expiry_margin
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._conn:
+                self._conn.executescript(_SCHEMA)
+
+    def _is_fresh(self, entry):
+        """判断缓存条目是否仍然有效"""
+        expires_at = entry['expires_at']
+        return expires_at is None or expires_at - self.expiry_margin > time.time()
+
+    def _remember(self, object_id, entry):
+        """放入内存LRU并淘汰最久未使用的条目（调用方持有锁）"""
+        self._memory[object_id] = entry
+        self._memory.move_to_end(object_id)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, thumbnail_url):
+        """查找缩略图对应的原图解析结果
+
+        Returns:
+            dict: {'original_url', 'strategy', 'expires_at', 'resolved_at'}；未命中或已过期返回None
+        """
+        object_id = extract_object_id(thumbnail_url)
+        if not object_id:
+            return None
+
+        with self._lock:
+            entry = self._memory.get(object_id)
+            if entry is None and self._conn:
+                row = self._conn.execute(
+                    'SELECT original_url, strategy, expires_at, resolved_at FROM resolutions WHERE object_id = ?',
+                    (object_id,)
+                ).fetchone()
+                if row:
+                    entry = dict(zip(('original_url', 'strategy', 'expires_at', 'resolved_at'), row))
+                    self._remember(object_id, entry)
+
+            if entry is not None and not self._is_fresh(entry):
+                self._memory.pop(object_id, None)
+                if self._conn:
+                    with self._conn:
+                        self._conn.execute('DELETE FROM resolutions WHERE object_id = ?', (object_id,))
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self._memory.move_to_end(object_id)
+            self.hits += 1
+            return dict(entry)
+
+    def put(self, thumbnail_url, original_url, strategy):
+        """记录解析结果，缩略图不是豆包生成图片URL时忽略"""
+        object_id = extract_object_id(thumbnail_url)
+        if not object_id or not original_url:
+            return
+        entry = {
+            'original_url': original_url,
+            'strategy': strategy,
+            'expires_at': url_expires_at(original_url),
+            'resolved_at': time.time(),
+        }
+        with self._lock:
+            self._remember(object_id, entry)
+            if self._conn:
+                with self._conn:
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO resolutions (object_id, original_url, strategy, expires_at, resolved_at) '
+                        'VALUES (?, ?, ?, ?, ?)',
+                        (object_id, original_url, strategy, entry['expires_at'], entry['resolved_at'])
+                    )
+
+    def strategy_counts(self):
+        """统计各策略成功解析的对象数"""
+        with self._lock:
+            if self._conn:
+                rows = self._conn.execute(
+                    'SELECT strategy, COUNT(*) FROM resolutions GROUP BY strategy'
+                ).fetchall()
+                return dict(rows)
+            counts = {}
+            for entry in self._memory.values():
+                counts[entry['strategy']] = counts.get(entry['strategy'], 0) + 1
+            return counts
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
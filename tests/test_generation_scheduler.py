@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from generation_scheduler import GenerationScheduler
+
+
+def scheduler(durations=(), **kwargs):
+    kwargs.setdefault('min_samples', 5)
+    scheduler = GenerationScheduler(**kwargs)
+    for duration in durations:
+        scheduler.observe(duration)
+    return scheduler
+
+
+def test_defaults_until_enough_samples():
+    s = scheduler([10, 11, 12], default_timeout=120, default_interval=2.0)
+    assert s.quantile(0.5) is None
+    assert s.timeout() == 120
+    assert s.next_interval(5) == 2.0
+
+
+def test_timeout_is_clamped_p99():
+    assert scheduler([10] * 10, min_timeout=30).timeout() == 30
+    assert scheduler([40] * 10).timeout() == 60
+    assert scheduler([400] * 10, max_timeout=300).timeout() == 300
+
+
+def test_interval_is_sparse_before_the_window_and_dense_inside():
+    s = scheduler([20, 21, 22, 23, 24, 25, 26, 27, 28, 29], min_interval=1.0, max_interval=8.0)
+    assert s.next_interval(0) == 8.0
+    assert s.next_interval(14) == pytest.approx(16.8 - 14)
+    assert s.next_interval(22) == 1.0
+    # 超出常见耗时后逐渐放缓
+    assert s.next_interval(40) > s.next_interval(36) >= 1.0
+
+
+def test_timeout_after_a_timeout_is_raised():
+    s = scheduler([10] * 10, min_timeout=30)
+    s.observe(30, timed_out=True)
+    assert s.timeout() >= 45
+    s.observe(45, timed_out=True)
+    assert s.timeout() >= 67.5
+
+
+def test_timeout_floor_respects_max_timeout():
+    s = scheduler([10] * 10, max_timeout=100)
+    s.observe(90, timed_out=True)
+    assert s.timeout() == 100
+
+
+def test_timeout_floor_is_cleared_by_a_success():
+    s = scheduler([10] * 200, history_size=200, min_timeout=30)
+    s.observe(30, timed_out=True)
+    assert s.timeout() == 45
+    s.observe(10)
+    assert s.timeout() == 30
+
+
+def test_history_round_trips(tmp_path):
+    path = str(tmp_path / 'times.json')
+    s = scheduler([10.1234, 20, 30], history_path=path)
+    s.observe(40, timed_out=True)
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f) == [10.123, 20, 30, 40]
+    assert list(tmp_path.iterdir()) == [tmp_path / 'times.json']
+
+    reloaded = GenerationScheduler(history_path=path, min_samples=4)
+    assert reloaded.quantile(1.0) == 40
+
+
+def test_corrupt_history_is_ignored(tmp_path):
+    path = tmp_path / 'times.json'
+    path.write_text('not json', encoding='utf-8')
+    assert GenerationScheduler(history_path=str(path)).quantile(0.5) is None
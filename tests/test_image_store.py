@@ -0,0 +1,100 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from image_store import ImageStore, object_key
+
+
+THUMB = ("https://p3-flow-imagex-sign.byteimg.com/ocean-cloud-tos/image_skill/abc123"
+         "~tplv-a9rns2rl98-image.jpeg?rk3s=1&x-expires=1760000000&x-signature=old")
+RESIGNED = THUMB.replace('x-signature=old', 'x-signature=new')
+
+
+class FakeDownloader:
+    """按URL返回固定内容的下载引擎，记录实际下载的URL"""
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.fetched = []
+        self.executor = ThreadPoolExecutor(max_workers=4)
+
+    def fetch_to_temp(self, url, directory, cookies=None):
+        self.fetched.append(url)
+        body = self.bodies[url]
+        fd, path = tempfile.mkstemp(dir=directory, prefix='.download.')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        return {'path': path, 'size': len(body), 'format': 'JPEG', 'sha256': hashlib.sha256(body).hexdigest(),
+                'content_type': 'image/jpeg'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    yield store
+    store.close()
+
+
+def test_object_key_ignores_signature():
+    assert object_key(THUMB) == object_key(RESIGNED) == 'abc123~tplv-a9rns2rl98-image.jpeg'
+
+
+def test_fetch_stores_by_content_hash(store):
+    body = b'\xff\xd8\xff' + b'x' * 100
+    path = store.fetch(FakeDownloader({THUMB: body}), THUMB, prompt='cat')
+    sha256 = hashlib.sha256(body).hexdigest()
+    assert path == store.blob_path(sha256, 'JPEG')
+    assert path.endswith(os.path.join(sha256[:2], sha256[2:4], sha256 + '.jpg'))
+    with open(path, 'rb') as f:
+        assert f.read() == body
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_resigned_url_is_not_downloaded_again(store):
+    downloader = FakeDownloader({THUMB: b'one', RESIGNED: b'one'})
+    first = store.fetch(downloader, THUMB, prompt='cat')
+    assert store.fetch(downloader, RESIGNED, prompt='cat') == first
+    assert downloader.fetched == [THUMB]
+
+
+def test_identical_content_is_stored_once(store):
+    other = THUMB.replace('abc123', 'def456')
+    downloader = FakeDownloader({THUMB: b'same', other: b'same'})
+    paths = store.fetch_many(downloader, [THUMB, other], prompt='cat')
+    assert paths[0] == paths[1]
+    assert store.files_for_prompt('cat') == [paths[0]]
+
+
+def test_refs_without_prompt_do_not_accumulate(store):
+    downloader = FakeDownloader({THUMB: b'one'})
+    for _ in range(3):
+        store.fetch(downloader, THUMB)
+    with sqlite3.connect(os.path.join(store.root, 'index.db')) as conn:
+        assert conn.execute('SELECT COUNT(*), MIN(prompt) FROM refs').fetchone() == (1, '')
+
+
+def test_store_opens_from_another_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = ImageStore('store')
+    path = store.fetch(FakeDownloader({THUMB: b'one'}), THUMB, prompt='cat')
+    store.close()
+
+    monkeypatch.chdir(tmp_path.parent)
+    store = ImageStore(os.path.join(tmp_path.name, 'store'))
+    _, found = store.lookup(RESIGNED)
+    assert os.path.samefile(found, tmp_path / path)
+    assert store.files_for_prompt('cat') == [found]
+    store.close()
+
+
+def test_missing_blob_is_downloaded_again(store):
+    downloader = FakeDownloader({THUMB: b'one'})
+    path = store.fetch(downloader, THUMB)
+    os.remove(path)
+    assert store.lookup(THUMB) is None
+    assert store.fetch(downloader, THUMB) == path
+    assert os.path.exists(path)
+    assert len(downloader.fetched) == 2
@@ -0,0 +1,70 @@
+import contextlib
+import io
+
+import pytest
+
+from benchmarks.bench_url_rewrite import SAMPLE_TEMPLATES, generate_corpus, legacy_convert
+from image_url_rewriter import OriginalUrlRewriter, convert_to_original_url, extract_object_id
+
+
+def legacy(urls):
+    """旧实现会打印每一步，测试中静默执行"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [legacy_convert(url) for url in urls]
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    return generate_corpus(2000, 200, seed=1)
+
+
+def test_matches_legacy_on_benchmark_corpus(corpus):
+    assert OriginalUrlRewriter().convert_many(corpus) == legacy(corpus)
+
+
+def test_matches_legacy_without_query(corpus):
+    urls = [url.split('?', 1)[0] for url in corpus]
+    assert OriginalUrlRewriter().convert_many(urls) == legacy(urls)
+
+
+@pytest.mark.parametrize('url', [
+    "https://x.com/a.jpg",
+    "https://x.com/a-thumb.webp",
+    "https://x.com/a.png?format=webp&quality=80",
+    "https://x.com/ocean-cloud-tos/image_skill/abc~tplv-x-image.avif",
+    "http://x.com/plain",
+])
+def test_matches_legacy_on_edge_cases(url):
+    assert OriginalUrlRewriter().convert(url) == legacy([url])[0]
+
+
+def test_remaining_params_keep_the_question_mark():
+    # 旧实现移除首个参数后留下 "a.png&keep=1"，改写器重新拼接剩余参数
+    assert convert_to_original_url("https://x.com/a.png?w=100&h=200&keep=1") == "https://x.com/a.png?keep=1"
+
+
+def test_cache_hits_across_signatures(corpus):
+    rewriter = OriginalUrlRewriter()
+    rewriter.convert_many(corpus)
+    # 语料只有200个对象、5种模板，其余都是重新签名的URL
+    assert rewriter.misses <= 200 * len(SAMPLE_TEMPLATES)
+    assert rewriter.hits == len(corpus) - rewriter.misses
+
+
+def test_cache_is_bounded(corpus):
+    rewriter = OriginalUrlRewriter(maxsize=16)
+    rewriter.convert_many(corpus)
+    assert len(rewriter._cache) <= 16
+
+
+def test_keep_format_leaves_avif_and_webp():
+    url = "https://x.com/ocean-cloud-tos/image_skill/abc.avif"
+    assert convert_to_original_url(url) == "https://x.com/ocean-cloud-tos/image_skill/abc.jpeg"
+    assert convert_to_original_url(url, keep_format=True) == url
+
+
+def test_extract_object_id():
+    assert extract_object_id(
+        "https://p3.byteimg.com/ocean-cloud-tos/image_skill/abc_123~tplv-x.jpeg?x-signature=1") == 'abc_123'
+    assert extract_object_id("https://example.com/a.jpeg") is None
+    assert extract_object_id(None) is None
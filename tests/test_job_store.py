@@ -0,0 +1,114 @@
+import pytest
+
+from job_store import (JobStore, STATE_PENDING, STATE_SUBMITTED, STATE_GENERATED, STATE_RESOLVED,
+                       STATE_DOWNLOADED, STATE_FAILED, STAGE_GENERATE, STAGE_RESOLVE, STAGE_DOWNLOAD)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    yield store
+    store.close()
+
+
+def test_add_prompts_is_idempotent(store):
+    first = store.add_prompts(['a', 'b'])
+    assert store.add_prompts(['a', 'b']) == first
+    assert store.counts() == {STATE_PENDING: 2}
+
+
+def test_same_prompt_at_different_positions_is_two_jobs(store):
+    job_ids = store.add_prompts(['a', 'a'])
+    assert len(set(job_ids)) == 2
+
+
+def test_add_prompts_with_start_offset(store):
+    job_id, = store.add_prompts(['c'], start=2)
+    assert store.get(job_id)['prompt_index'] == 2
+
+
+def test_stage_outputs_survive_reopen(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    store = JobStore(path)
+    job_id, = store.add_prompts(['a'])
+    store.mark_submitted(job_id)
+    store.update(job_id, STATE_GENERATED, image_urls=['https://x/1.jpeg'])
+    store.close()
+
+    store = JobStore(path)
+    job = store.get(job_id)
+    assert job['state'] == STATE_GENERATED
+    assert job['image_urls'] == ['https://x/1.jpeg']
+    assert job['attempts'] == 1
+    store.close()
+
+
+def test_resume_recovers_interrupted_submissions(store):
+    job_id, = store.add_prompts(['a'])
+    store.mark_submitted(job_id)
+    assert store.resume() == 1
+    assert store.get(job_id)['state'] == STATE_PENDING
+
+
+@pytest.mark.parametrize('stage, state', [
+    (STAGE_GENERATE, STATE_PENDING),
+    (STAGE_RESOLVE, STATE_GENERATED),
+    (STAGE_DOWNLOAD, STATE_RESOLVED),
+])
+def test_retry_failed_rewinds_to_the_failed_stage(store, stage, state):
+    job_id, = store.add_prompts(['a'])
+    store.fail(job_id, stage, 'boom')
+    assert store.retry_failed() == 1
+    job = store.get(job_id)
+    assert job['state'] == state
+    assert job['failed_stage'] is None and job['error'] is None
+
+
+def test_retry_failed_filters_by_stage(store):
+    generate_id, download_id = store.add_prompts(['a', 'b'])
+    store.fail(generate_id, STAGE_GENERATE, 'boom')
+    store.fail(download_id, STAGE_DOWNLOAD, 'boom')
+    assert store.retry_failed(stages=[STAGE_DOWNLOAD]) == 1
+    assert store.get(generate_id)['state'] == STATE_FAILED
+    assert store.get(download_id)['state'] == STATE_RESOLVED
+
+
+def test_add_prompts_retries_only_its_own_failures(store):
+    other_id, = store.add_prompts(['other'])
+    store.fail(other_id, STAGE_GENERATE, 'boom')
+    job_id, = store.add_prompts(['a'], start=1)
+    store.fail(job_id, STAGE_RESOLVE, 'boom')
+
+    assert store.add_prompts(['a'], start=1, retry_failed=True) == [job_id]
+    assert store.get(job_id)['state'] == STATE_GENERATED
+    assert store.get(other_id)['state'] == STATE_FAILED
+
+
+@pytest.mark.parametrize('state, stage', [
+    (STATE_SUBMITTED, STAGE_GENERATE),
+    (STATE_GENERATED, STAGE_RESOLVE),
+    (STATE_RESOLVED, STAGE_DOWNLOAD),
+])
+def test_fail_current_stage_follows_progress(store, state, stage):
+    job_id, = store.add_prompts(['a'])
+    store.update(job_id, state)
+    store.fail_current_stage(job_id, RuntimeError('boom'))
+    job = store.get(job_id)
+    assert job['state'] == STATE_FAILED
+    assert job['failed_stage'] == stage
+    assert job['error'] == 'boom'
+
+
+def test_fail_current_stage_leaves_finished_jobs(store):
+    job_id, = store.add_prompts(['a'])
+    store.update(job_id, STATE_DOWNLOADED, downloaded_files=['a.jpg'])
+    store.fail_current_stage(job_id, RuntimeError('late'))
+    assert store.get(job_id)['state'] == STATE_DOWNLOADED
+
+
+def test_to_result_prefers_original_urls(store):
+    job_id, = store.add_prompts(['a'])
+    store.update(job_id, STATE_DOWNLOADED, image_urls=['thumb'], original_urls=['orig'], downloaded_files=['a.jpg'])
+    assert JobStore.to_result(store.get(job_id)) == {
+        'prompt': 'a', 'success': True, 'image_urls': ['orig'], 'downloaded_files': ['a.jpg'],
+    }
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+from resolution_cache import ResolutionCache, STRATEGY_NETWORK, STRATEGY_PICTURE, url_expires_at
+
+
+def thumb(object_id='abc123', signature='s'):
+    return (f"https://p3-flow-imagex-sign.byteimg.com/ocean-cloud-tos/image_skill/{object_id}"
+            f"~tplv-a9rns2rl98-image.jpeg?x-signature={signature}")
+
+
+def original(expires=None):
+    url = "https://p3-flow-imagex-sign.byteimg.com/ocean-cloud-tos/image_skill/abc123.jpeg"
+    return url if expires is None else f"{url}?x-expires={int(expires)}&x-signature=z"
+
+
+def test_url_expires_at():
+    assert url_expires_at(original(1760000000)) == 1760000000
+    assert url_expires_at(original()) is None
+    assert url_expires_at("https://x/a.jpeg?x-expires=soon") is None
+
+
+def test_hit_by_object_id_across_signatures():
+    cache = ResolutionCache()
+    cache.put(thumb(signature='a'), original(), STRATEGY_NETWORK)
+    entry = cache.get(thumb(signature='b'))
+    assert entry['original_url'] == original()
+    assert entry['strategy'] == STRATEGY_NETWORK
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_non_doubao_urls_are_ignored():
+    cache = ResolutionCache()
+    cache.put("https://example.com/a.jpeg", original(), STRATEGY_NETWORK)
+    assert cache.get("https://example.com/a.jpeg") is None
+    assert cache.strategy_counts() == {}
+
+
+@pytest.mark.parametrize('expires, fresh', [(None, True), (3600, True), (30, False), (-10, False)])
+def test_entries_expire_before_the_signature(expires, fresh):
+    cache = ResolutionCache(expiry_margin=60)
+    cache.put(thumb(), original(None if expires is None else time.time() + expires), STRATEGY_NETWORK)
+    assert (cache.get(thumb()) is not None) == fresh
+
+
+def test_memory_layer_is_bounded_lru():
+    cache = ResolutionCache(maxsize=2)
+    cache.put(thumb('a'), original(), STRATEGY_NETWORK)
+    cache.put(thumb('b'), original(), STRATEGY_NETWORK)
+    cache.get(thumb('a'))
+    cache.put(thumb('c'), original(), STRATEGY_NETWORK)
+    assert list(cache._memory) == ['a', 'c']
+    assert cache.get(thumb('b')) is None
+
+
+def test_persists_across_instances_and_reloads_evicted(tmp_path):
+    path = str(tmp_path / 'resolutions.db')
+    cache = ResolutionCache(path, maxsize=1)
+    cache.put(thumb('a'), original(), STRATEGY_NETWORK)
+    cache.put(thumb('b'), original(), STRATEGY_PICTURE)
+    assert cache.get(thumb('a'))['strategy'] == STRATEGY_NETWORK
+    cache.close()
+
+    cache = ResolutionCache(path)
+    assert cache.get(thumb('b'))['strategy'] == STRATEGY_PICTURE
+    assert cache.strategy_counts() == {STRATEGY_NETWORK: 1, STRATEGY_PICTURE: 1}
+    cache.close()
+
+
+def test_expired_entries_are_deleted_from_disk(tmp_path):
+    path = str(tmp_path / 'resolutions.db')
+    cache = ResolutionCache(path)
+    cache.put(thumb(), original(time.time() + 10), STRATEGY_NETWORK)
+    assert cache.get(thumb()) is None
+    assert cache.strategy_counts() == {}
+    cache.close()
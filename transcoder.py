@@ -0,0 +1,183 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+else:
+    try:
+        # 旧版Pillow解码AVIF需要插件，新版（11.2起）内置支持
+        import pillow_avif
+    except ImportError:
+        pass
+
+
+# 目标格式 -> (Pillow格式名, 文件扩展名, 视为同一格式的源格式)
+TARGET_FORMATS = {
+    'jpeg': ('JPEG', '.jpg', ('jpeg', 'mpo')),
+    'png': ('PNG', '.png', ('png',)),
+    'webp': ('WEBP', '.webp', ('webp',)),
+    'avif': ('AVIF', '.avif', ('avif',)),
+}
+
+
+def _flatten_alpha(image):
+    """把带透明通道的图片合成到白色背景上（JPEG不支持透明）"""
+    if image.mode in ('RGB', 'L'):
+        return image
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def _fitted_size(size, max_dimension):
+    """按最长边上限等比缩小后的尺寸；不需要缩小时返回原尺寸"""
+    width, height = size
+    if not max_dimension or max(width, height) <= max_dimension:
+        return width, height
+    scale = max_dimension / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def transcode_file(path, target_format='jpeg', quality=90, max_dimension=None, keep_original=False):
+    """把一个图片文件转码为目标格式并限制最长边（在工作进程中执行）
+
+    源文件已是目标格式且不需要缩小时不做任何处理，避免重复有损压缩。
+    保留源文件时，若同尺寸的派生文件已存在且不早于源文件，直接复用，重新运行不再重复解码和编码。
+
+    Args:
+        path (str): 源图片路径
+        target_format (str): 目标格式（jpeg/png/webp/avif）
+        quality (int): 有损格式的编码质量
+        max_dimension (int): 最长边上限（像素），None表示不缩放
+        keep_original (bool): 是否保留源文件；为True时输出写入 <原文件名>.<宽>x<高>.<扩展名>，
+            为False且输出路径不同时删除源文件
+
+    Returns:
+        dict: {path, format, width, height, size, transcoded}
+    """
+    pil_format, extension, same_formats = TARGET_FORMATS[target_format]
+    with Image.open(path) as image:
+        source_format = (image.format or '').lower()
+        needs_resize = bool(max_dimension) and max(image.size) > max_dimension
+        if source_format in same_formats and not needs_resize:
+            return {'path': path, 'format': source_format, 'width': image.width, 'height': image.height,
+                    'size': os.path.getsize(path), 'transcoded': False}
+
+        # 输出尺寸只由源尺寸和上限决定，解码前即可确定派生文件名
+        width, height = _fitted_size(image.size, max_dimension)
+        base = os.path.splitext(path)[0]
+        # 保留源文件时派生文件使用带尺寸的独立文件名，绝不覆盖源文件（如图片仓库中按内容寻址的对象）
+        output = f"{base}.{width}x{height}{extension}" if keep_original else base + extension
+        if keep_original and os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(path):
+            return {'path': output, 'format': target_format, 'width': width, 'height': height,
+                    'size': os.path.getsize(output), 'transcoded': False}
+
+        image.load()
+        if needs_resize:
+            image = image.resize((width, height), Image.LANCZOS, reducing_gap=2.0)
+        if pil_format == 'JPEG':
+            image = _flatten_alpha(image)
+        elif image.mode == 'P':
+            image = image.convert('RGBA')
+
+        tmp_path = output + '.tmp'
+        options = {'optimize': True} if pil_format == 'PNG' else {'quality': quality}
+        if pil_format == 'JPEG':
+            options['optimize'] = True
+        image.save(tmp_path, format=pil_format, **options)
+
+    os.replace(tmp_path, output)
+    if not keep_original and output != path:
+        os.remove(path)
+    return {'path': output, 'format': target_format, 'width': width, 'height': height,
+            'size': os.path.getsize(output), 'transcoded': True}
+
+
+class ImageTranscoder:
+    """下载后的本地转码阶段
+
+    接受CDN返回的任意格式（AVIF/WEBP/PNG/JPEG），在进程池中统一转码为目标格式并限制尺寸，
+    因此解析原图时不必再猜测CDN是否支持改写成JPEG，可以直接取最便宜的可用来源。
+    CPU密集的解码和编码不占用驱动线程，也不受GIL限制。未安装Pillow时跳过转码，保留原文件。
+    """
+    def __init__(self, target_format='jpeg', quality=90, max_dimension=None, max_workers=None, keep_original=False):
+        """初始化转码器
+
+        Args:
+            target_format (str): 目标格式（jpeg/png/webp/avif）
+            quality (int): 有损格式的编码质量（1-100）
+            max_dimension (int): 最长边上限（像素），None表示不缩放
+            max_workers (int): 转码进程数，None表示CPU核数
+            keep_original (bool): 是否保留转码前的文件
+        """
+        if target_format not in TARGET_FORMATS:
+            raise ValueError(f"不支持的目标格式: {target_format}")
+        self.target_format = target_format
+        self.quality = quality
+        self.max_dimension = max_dimension
+        self.max_workers = max_workers
+        self.keep_original = keep_original
+        self.available = Image is not None
+        self._executor = None
+        self._lock = threading.Lock()
+        if not self.available:
+            print("⚠️ 未安装Pillow，跳过本地转码（pip install Pillow）")
+
+    @property
+    def executor(self):
+        """按需创建的转码进程池
+
+        使用spawn方式启动工作进程：创建进程池时Selenium、网络监听和下载线程都在运行，
+        fork会把其他线程持有的锁一并复制到子进程，可能造成死锁。
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def transcode_many(self, paths, keep_original=None):
+        """并行转码一组文件，返回与输入顺序一致的新路径
+
+        None（下载失败）原样保留；单个文件转码失败时保留原文件路径。
+
+        Args:
+            paths (list): 图片路径列表
+            keep_original (bool): 覆盖实例的 keep_original 设置
+        """
+        if not self.available:
+            return list(paths)
+        keep_original = self.keep_original if keep_original is None else keep_original
+        futures = [
+            self.executor.submit(transcode_file, path, self.target_format, self.quality,
+                                 self.max_dimension, keep_original) if path else None
+            for path in paths
+        ]
+        results = []
+        for path, future in zip(paths, futures):
+            if future is None:
+                results.append(None)
+                continue
+            try:
+                info = future.result()
+            except Exception as e:
+                print(f"⚠️ 转码失败，保留原文件 {path}: {e}")
+                results.append(path)
+                continue
+            if info['transcoded']:
+                print(f"🎨 已转码: {os.path.basename(path)} → {os.path.basename(info['path'])} "
+                      f"({info['width']}x{info['height']}, {info['size']/1024:.1f}KB)")
+            results.append(info['path'])
+        return results
+
+    def close(self):
+        """关闭转码进程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
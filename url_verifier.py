@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+
+class UrlVerifier:
+    """并行批量的图片URL可访问性校验器
+
+    通过共享的 requests.Session 并行发送HEAD请求，复用长连接；
+    每个主机的并发数有上限，校验结果在短时间内缓存（最多 maxsize 条的LRU）；
+    整批校验有总时间预算，预算用完时未完成的URL直接判定为不可用，不再等待。
+    """
+    def __init__(self, session, max_workers=16, per_host=4, ttl=60, timeout=5, min_size=10240, maxsize=4096):
+        """初始化校验器
+
+        Args:
+            session (requests.Session): 共享的HTTP会话（连接池）
+            max_workers (int): 并行校验的最大线程数
+            per_host (int): 同一主机的最大并发请求数
+            ttl (float): 校验结果的缓存时间（秒）
+            timeout (float): 单个HEAD请求的超时时间（秒）
+            min_size (int): 有效图片的最小字节数
+            maxsize (int): 结果缓存的最大条目数
+        """
+        self.session = session
+        self.per_host = per_host
+        self.ttl = ttl
+        self.timeout = timeout
+        self.min_size = min_size
+        self.maxsize = maxsize
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='url-verify')
+        self._lock = threading.Lock()
+        self._host_limits = {}
+        self._cache = OrderedDict()
+
+    def _host_semaphore(self, url):
+        """获取URL所在主机的并发限制信号量"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            semaphore = self._host_limits.get(host)
+            if semaphore is None:
+                semaphore = self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return semaphore
+
+    def _cached(self, url):
+        """读取未过期的缓存结果，没有时返回None"""
+        with self._lock:
+            entry = self._cache.get(url)
+            if entry and time.time() - entry[1] < self.ttl:
+                self._cache.move_to_end(url)
+                return entry[0]
+            self._cache.pop(url, None)
+            return None
+
+    def _check(self, url, cookies, deadline):
+        """在主机并发限制内发送单个HEAD请求"""
+        with self._host_semaphore(url):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            try:
+                response = self.session.head(url, cookies=cookies, timeout=min(self.timeout, remaining),
+                                             allow_redirects=True)
+            except Exception as e:
+                print(f"验证图片URL时出现错误: {e}")
+                return False
+
+        content_type = response.headers.get('content-type', '')
+        content_length = response.headers.get('content-length')
+        # 检查是否为图片类型且大小合理
+        valid = (response.status_code == 200 and 'image' in content_type and
+                 bool(content_length) and content_length.isdigit() and int(content_length) > self.min_size)
+        if valid:
+            print(f"验证通过: {url[:50]}... (大小: {int(content_length)/1024:.1f}KB)")
+
+        with self._lock:
+            self._cache[url] = (valid, time.time())
+            self._cache.move_to_end(url)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return valid
+
+    def _submit(self, urls, cookies, deadline):
+        """为未命中缓存的URL提交校验任务（同一批内重复的URL只校验一次）"""
+        results = {}
+        futures = {}
+        for url in urls:
+            if url in results or url in futures:
+                continue
+            cached = self._cached(url)
+            if cached is not None:
+                results[url] = cached
+            else:
+                futures[url] = self.executor.submit(self._check, url, cookies, deadline)
+        return results, futures
+
+    def verify_many(self, urls, cookies=None, budget=8):
+        """并行校验多个URL
+
+        Args:
+            urls (list): 待校验的URL
+            cookies: 请求使用的cookies
+            budget (float): 整批校验的总时间预算（秒）
+
+        Returns:
+            list: 与urls顺序一致的校验结果（True/False），预算内未完成的为False
+        """
+        deadline = time.time() + budget
+        results, futures = self._submit(urls, cookies, deadline)
+        for url, future in futures.items():
+            try:
+                results[url] = bool(future.result(timeout=max(deadline - time.time(), 0)))
+            except Exception:
+                results[url] = False
+        return [results[url] for url in urls]
+
+    def clear(self):
+        """清空结果缓存"""
+        with self._lock:
+            self._cache.clear()
+
+    def close(self):
+        """关闭校验线程池"""
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,285 @@
+import threading
+import time
+
+
+# 元素滚动到视口内且位置稳定（连续两次检查坐标不变）
+IN_VIEWPORT_SCRIPT = """
+const el = arguments[0];
+const timeoutMs = arguments[1];
+const done = arguments[arguments.length - 1];
+const started = Date.now();
+let last = null;
+(function check() {
+    const r = el.getBoundingClientRect();
+    const key = r.top + ',' + r.left;
+    const inView = r.bottom > 0 && r.top < window.innerHeight && r.right > 0 && r.left < window.innerWidth;
+    if (inView && key === last) { done(true); return; }
+    last = key;
+    if (Date.now() - started >= timeoutMs) { done(false); return; }
+    setTimeout(check, 50);
+})();
+"""
+
+# 网络空闲：idleMs 内没有新的资源请求完成
+NETWORK_IDLE_SCRIPT = """
+const idleMs = arguments[0];
+const timeoutMs = arguments[1];
+const done = arguments[arguments.length - 1];
+const started = Date.now();
+let lastActivity = Date.now();
+let observer = null;
+try {
+    observer = new PerformanceObserver(() => { lastActivity = Date.now(); });
+    observer.observe({type: 'resource', buffered: false});
+} catch (e) {}
+const timer = setInterval(() => {
+    const now = Date.now();
+    const idle = document.readyState === 'complete' && now - lastActivity >= idleMs;
+    if (idle || now - started >= timeoutMs) {
+        clearInterval(timer);
+        if (observer) observer.disconnect();
+        done(idle);
+    }
+}, 50);
+"""
+
+# 下载控件的XPath条件，与生成器中下载按钮策略使用的选择器一致
+DOWNLOAD_CONTROL_PREDICATE = (
+    "contains(@class, 'download') or contains(@title, 'download') or contains(@title, '下载') or "
+    "contains(@aria-label, 'download') or contains(@aria-label, '下载') or contains(text(), '下载')"
+)
+
+# 页面内函数：图片所在容器（向上最多4层）中当前可见的下载按钮或链接
+_FIND_DOWNLOAD_CONTROLS = """
+const findDownloadControls = (img) => {
+    const visible = (el) => {
+        const style = window.getComputedStyle(el);
+        return !!(el.offsetWidth || el.offsetHeight) && style.visibility !== 'hidden' && style.display !== 'none';
+    };
+    const xpath = ".//*[self::button or self::a][%s]";
+    const found = new Set();
+    let node = img.closest("[class*='image'], [class*='img'], [class*='picture']") || img.parentElement;
+    for (let depth = 0; node && depth < 4; depth++, node = node.parentElement) {
+        const result = document.evaluate(xpath, node, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (let i = 0; i < result.snapshotLength; i++) {
+            const el = result.snapshotItem(i);
+            if (visible(el)) found.add(el);
+        }
+    }
+    return Array.from(found);
+};
+""" % DOWNLOAD_CONTROL_PREDICATE.replace('"', '\\"')
+
+# 悬停前可见的下载控件（悬停前调用，结果作为 HOVER_CONTROLS_SCRIPT 的基线）
+VISIBLE_DOWNLOAD_CONTROLS_SCRIPT = _FIND_DOWNLOAD_CONTROLS + """
+return findDownloadControls(arguments[0]);
+"""
+
+# 悬停后出现了悬停前不可见的下载控件（悬停操作栏已显示）
+HOVER_CONTROLS_SCRIPT = _FIND_DOWNLOAD_CONTROLS + """
+const img = arguments[0];
+const before = new Set(arguments[1] || []);
+const timeoutMs = arguments[2];
+const done = arguments[arguments.length - 1];
+const started = Date.now();
+(function check() {
+    if (findDownloadControls(img).some(el => !before.has(el))) { done(true); return; }
+    if (Date.now() - started >= timeoutMs) { done(false); return; }
+    setTimeout(check, 50);
+})();
+"""
+
+# 输入框可见且可用，页面上没有可见的生成中指示器（可以发送下一个提示词）
+INPUT_READY_SCRIPT = """
+const timeoutMs = arguments[0];
+const done = arguments[arguments.length - 1];
+const started = Date.now();
+const visible = (el) => !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+const ready = () => {
+    const input = Array.from(document.querySelectorAll("textarea, input[type='text'], div[contenteditable='true']"))
+        .find(el => visible(el) && !el.disabled && !el.readOnly);
+    if (!input) return false;
+    const busy = document.querySelectorAll(
+        "div[class*='loading'], div[class*='generating'], div[class*='spinner'], div[class*='progress']");
+    return !Array.from(busy).some(visible);
+};
+(function check() {
+    if (ready()) { done(true); return; }
+    if (Date.now() - started >= timeoutMs) { done(false); return; }
+    setTimeout(check, 100);
+})();
+"""
+
+# XPath匹配到可见元素
+XPATH_VISIBLE_SCRIPT = """
+const xpath = arguments[0];
+const timeoutMs = arguments[1];
+const done = arguments[arguments.length - 1];
+const started = Date.now();
+(function check() {
+    const result = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    for (let i = 0; i < result.snapshotLength; i++) {
+        const el = result.snapshotItem(i);
+        if (el.offsetWidth || el.offsetHeight || el.getClientRects().length) { done(true); return; }
+    }
+    if (Date.now() - started >= timeoutMs) { done(false); return; }
+    setTimeout(check, 50);
+})();
+"""
+
+
+class WaitLedger:
+    """记录每次条件等待相对原固定sleep节省的时间"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, label, budget, elapsed, satisfied):
+        """记录一次等待
+
+        Args:
+            label (str): 等待点名称
+            budget (float): 原来的固定sleep时长（即等待上限，秒）
+            elapsed (float): 实际等待时长（秒）
+            satisfied (bool): 条件是否在上限内满足
+        """
+        with self._lock:
+            entry = self._entries.setdefault(label, {'count': 0, 'satisfied': 0, 'budget': 0.0, 'elapsed': 0.0})
+            entry['count'] += 1
+            entry['satisfied'] += 1 if satisfied else 0
+            entry['budget'] += budget
+            entry['elapsed'] += elapsed
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+
+    def summary(self):
+        """各等待点的次数、条件满足次数、原固定耗时、实际耗时和节省的秒数"""
+        with self._lock:
+            return {label: dict(entry, saved=entry['budget'] - entry['elapsed'])
+                    for label, entry in self._entries.items()}
+
+    def total_saved(self):
+        return sum(entry['saved'] for entry in self.summary().values())
+
+    def dump(self, label, reset=True):
+        """打印本轮等待节省的时间，默认随后清空"""
+        summary = self.summary()
+        if summary:
+            total = sum(entry['saved'] for entry in summary.values())
+            print(f"⏱️ 条件等待 [{label}]: 相比固定sleep节省 {total:.1f}s")
+            for name, entry in sorted(summary.items(), key=lambda item: -item[1]['saved']):
+                print(f"  {name}: {entry['count']} 次 (满足 {entry['satisfied']}), "
+                      f"原 {entry['budget']:.1f}s → 实际 {entry['elapsed']:.1f}s")
+        if reset:
+            self.reset()
+        return summary
+
+
+class Waiter:
+    """条件等待工具：条件满足立即返回，最长等待原来的固定sleep时长
+
+    until() 在Python侧轮询任意谓词；其余方法把轮询放进页面内的异步脚本，
+    整个等待只需一次WebDriver往返。每次等待都记入 ledger。
+    """
+    def __init__(self, driver, ledger=None, poll_interval=0.1):
+        """初始化等待工具
+
+        Args:
+            driver: Selenium WebDriver实例
+            ledger (WaitLedger): 节省时间记录，为None时新建
+            poll_interval (float): until() 的默认轮询间隔（秒）
+        """
+        self.driver = driver
+        self.ledger = ledger or WaitLedger()
+        self.poll_interval = poll_interval
+
+    def until(self, predicate, timeout, label, interval=None):
+        """轮询谓词直到返回真值或超时，返回谓词的最后结果（谓词抛出的异常视为未满足）"""
+        interval = self.poll_interval if interval is None else interval
+        start = time.time()
+        deadline = start + timeout
+        result = None
+        while True:
+            try:
+                result = predicate()
+            except Exception:
+                result = None
+            if result or time.time() >= deadline:
+                break
+            time.sleep(min(interval, max(deadline - time.time(), 0)))
+        self.ledger.record(label, timeout, time.time() - start, bool(result))
+        return result
+
+    def _script_timeout(self):
+        """读取驱动当前的异步脚本超时（秒），读取失败时返回None"""
+        try:
+            return self.driver.timeouts.script
+        except Exception:
+            return None
+
+    def _in_page(self, script, timeout, label, *args):
+        """执行页面内的异步等待脚本，出错时退回等满上限
+
+        异步脚本超时是整个驱动共用的设置，等待结束后恢复原值，
+        之后生成器中的其他 execute_async_script（如等待生成完成）不会沿用这里较短的超时。
+        """
+        start = time.time()
+        satisfied = False
+        previous = self._script_timeout()
+        try:
+            self.driver.set_script_timeout(timeout + 5)
+            satisfied = bool(self.driver.execute_async_script(script, *args, int(timeout * 1000)))
+        except Exception as e:
+            print(f"⚠️ 页面内等待 {label} 失败，改为固定等待: {str(e)[:80]}")
+            time.sleep(max(timeout - (time.time() - start), 0))
+        finally:
+            if previous is not None:
+                try:
+                    self.driver.set_script_timeout(previous)
+                except Exception:
+                    pass
+        self.ledger.record(label, timeout, time.time() - start, satisfied)
+        return satisfied
+
+    def in_viewport(self, element, timeout=1, label='scroll'):
+        """等待元素滚动到视口内且位置稳定"""
+        return self._in_page(IN_VIEWPORT_SCRIPT, timeout, label, element)
+
+    def network_idle(self, timeout=3, idle=0.5, label='network_idle'):
+        """等待页面加载完成且 idle 秒内没有新的资源请求完成"""
+        return self._in_page(NETWORK_IDLE_SCRIPT, timeout, label, int(idle * 1000))
+
+    def hover_controls(self, img_element, hover, timeout=3, label='hover'):
+        """执行悬停并等待图片容器中出现悬停后才显示的下载控件
+
+        悬停前先记录已经可见的下载控件，只有悬停后新出现的控件才算操作栏已显示，
+        页面上常驻的按钮和链接不会让等待提前结束。
+
+        Args:
+            img_element: 图片的WebElement
+            hover (callable): 执行悬停操作的函数
+        """
+        try:
+            before = self.driver.execute_script(VISIBLE_DOWNLOAD_CONTROLS_SCRIPT, img_element) or []
+        except Exception:
+            before = []
+        hover()
+        return self._in_page(HOVER_CONTROLS_SCRIPT, timeout, label, img_element, before)
+
+    def input_ready(self, timeout=3, label='input_ready'):
+        """等待输入框可用且页面不在生成中"""
+        return self._in_page(INPUT_READY_SCRIPT, timeout, label)
+
+    def xpath_visible(self, xpath, timeout=1, label='xpath'):
+        """等待XPath匹配到可见元素"""
+        return self._in_page(XPATH_VISIBLE_SCRIPT, timeout, label, xpath)
+
+    def new_window(self, known_handles, timeout=2, label='new_window'):
+        """等待出现新的窗口句柄，返回新句柄或None"""
+        known = set(known_handles)
+        return self.until(
+            lambda: next((h for h in self.driver.window_handles if h not in known), None),
+            timeout, label, interval=0.1
+        )
@@ -0,0 +1,179 @@
+import json
+import os
+import sys
+import threading
+import time
+
+
+# 延迟直方图的桶上限（毫秒）
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+# 调用方定位时跳过的模块（selenium内部和本模块）
+_SKIP_PATHS = (
+    os.sep + 'selenium' + os.sep,
+    os.path.abspath(__file__),
+)
+
+
+def _caller_names():
+    """返回发出WebDriver命令的调用链（跳过selenium内部），由内到外的业务方法名列表"""
+    names = []
+    frame = sys._getframe(2)
+    while frame:
+        filename = frame.f_code.co_filename
+        if not any(path in filename for path in _SKIP_PATHS):
+            name = frame.f_code.co_name
+            if name not in names:
+                names.append(name)
+        frame = frame.f_back
+    return names or ['<unknown>']
+
+
+class _CommandStats:
+    """单个WebDriver命令的计数和延迟分布"""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        elapsed_ms = elapsed * 1000
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def to_dict(self):
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 2),
+            'mean_ms': round(self.total / self.count * 1000, 2) if self.count else 0,
+            'max_ms': round(self.max * 1000, 2),
+            'histogram': {label: n for label, n in zip(labels, self.buckets) if n},
+        }
+
+
+class WebDriverProfiler:
+    """WebDriver命令计数与延迟分析器（按需启用）
+
+    WebDriver 和它返回的 WebElement 的所有命令（find_elements、get_attribute、is_displayed、
+    execute_script、window_handles ……）最终都经过 driver.execute 发给chromedriver，
+    因此只需在驱动实例上包装 execute，就能按命令类型和发出命令的业务方法统计次数和往返延迟。
+    """
+    def __init__(self, driver, report_path=None):
+        """初始化分析器
+
+        Args:
+            driver: Selenium WebDriver实例
+            report_path (str): 每个提示词报告的JSON Lines输出文件，None表示只打印
+        """
+        self.driver = driver
+        self.report_path = report_path
+        self._lock = threading.Lock()
+        self._original_execute = None
+        self.reset()
+
+    def install(self):
+        """在驱动实例上安装命令计时包装"""
+        if self._original_execute is not None:
+            return self
+        original_execute = self._original_execute = self.driver.execute
+        profiler = self
+
+        def execute(driver_command, params=None):
+            start = time.perf_counter()
+            try:
+                return original_execute(driver_command, params)
+            finally:
+                profiler.record(driver_command, _caller_names(), time.perf_counter() - start)
+
+        self.driver.execute = execute
+        return self
+
+    def uninstall(self):
+        """移除包装，恢复驱动原有的 execute"""
+        if self._original_execute is not None:
+            try:
+                del self.driver.execute
+            except AttributeError:
+                pass
+            self._original_execute = None
+
+    def record(self, command, callers, elapsed):
+        """记录一次命令往返
+
+        Args:
+            command (str): WebDriver命令名
+            callers (list): 由内到外的调用方法名；第一个计入直接调用方，全部计入包含子调用的总数
+            elapsed (float): 往返耗时（秒）
+        """
+        with self._lock:
+            stats = self._commands.get(command)
+            if stats is None:
+                stats = self._commands[command] = _CommandStats()
+            stats.add(elapsed)
+            key = (callers[0], command)
+            self._by_caller[key] = self._by_caller.get(key, 0) + 1
+            for caller in callers:
+                self._inclusive[caller] = self._inclusive.get(caller, 0) + 1
+
+    def reset(self):
+        """清空统计（每个提示词开始时调用）"""
+        with self._lock:
+            self._commands = {}
+            self._by_caller = {}
+            self._inclusive = {}
+            self._started = time.time()
+
+    def report(self):
+        """返回当前统计：总命令数、总往返耗时、按命令和按调用方法的明细"""
+        with self._lock:
+            commands = {name: stats.to_dict() for name, stats in
+                        sorted(self._commands.items(), key=lambda item: -item[1].total)}
+            callers = {}
+            for (caller, command), count in self._by_caller.items():
+                entry = callers.setdefault(caller, {'total': 0, 'commands': {}})
+                entry['total'] += count
+                entry['commands'][command] = count
+            inclusive = dict(sorted(self._inclusive.items(), key=lambda item: -item[1]))
+            started = self._started
+        return {
+            'commands_total': sum(stats['count'] for stats in commands.values()),
+            'round_trip_ms': round(sum(stats['total_ms'] for stats in commands.values()), 2),
+            'wall_ms': round((time.time() - started) * 1000, 2),
+            'commands': commands,
+            'callers': dict(sorted(callers.items(), key=lambda item: -item[1]['total'])),
+            'inclusive': inclusive,
+        }
+
+    def dump(self, label, reset=True):
+        """打印（并按需写入文件）一份报告，默认随后清空统计"""
+        report = self.report()
+        report['label'] = label
+        print(f"🔬 WebDriver命令统计 [{label}]: {report['commands_total']} 条命令, "
+              f"往返耗时 {report['round_trip_ms']/1000:.2f}s / 总耗时 {report['wall_ms']/1000:.2f}s")
+        for caller, entry in list(report['callers'].items())[:10]:
+            top = ', '.join(f"{command}={count}" for command, count in
+                            sorted(entry['commands'].items(), key=lambda item: -item[1])[:5])
+            inclusive = report['inclusive'].get(caller, entry['total'])
+            print(f"  {caller}: 直接 {entry['total']} 条 / 含子调用 {inclusive} 条 ({top})")
+        for command, stats in list(report['commands'].items())[:10]:
+            print(f"  · {command}: {stats['count']} 次, 平均 {stats['mean_ms']}ms, 最大 {stats['max_ms']}ms")
+
+        if self.report_path:
+            try:
+                with open(self.report_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(report, ensure_ascii=False) + '\n')
+            except Exception as e:
+                print(f"⚠️ 写入WebDriver命令报告失败: {e}")
+
+        if reset:
+            self.reset()
+        return report